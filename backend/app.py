@@ -1,16 +1,37 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context, g
 from openai import OpenAI
 import os
+import sys
 from dotenv import load_dotenv
 from flask_cors import CORS
 import requests
-import pandas as pd
 from datetime import datetime
 import logging
 from logging.handlers import RotatingFileHandler
 import json
-from functools import wraps
-from collections import defaultdict
+import hashlib
+import threading
+import unicodedata
+import time
+from functools import wraps, partial
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
+
+# Shared modules live in the repository root (floodsense/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from floodsense.columnar import ColumnarHistory
+from floodsense.downsample import downsample
+from floodsense.stats import HistoryStats
+from floodsense.cache import SharedCache
+from floodsense.conversations import ConversationStore
+from floodsense.limiter import ConcurrencyLimiter, reserved_threads, thread_budget
+from floodsense.tokens import count_tokens, message_tokens, fit_history, MESSAGE_OVERHEAD, REPLY_PRIMING
+from floodsense.firebase import get_client
+from floodsense.broadcast import Broadcaster
+from floodsense.logtail import LogReader, InvalidCursor
+from floodsense.sensors import load_registry
+from floodsense.metrics import get_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 # ========================================
 # Configuration & Logging Setup
@@ -22,10 +43,12 @@ CORS(app)
 
 # Create logs directory
 os.makedirs('./logs', exist_ok=True)
+LOG_FILE = './logs/app.log'
+LOG_BACKUPS = 5
 
 # Configure logging with rotating file handler
 log_format = '%(asctime)s - %(name)s - %(levelname)s - [%(funcName)s:%(lineno)d] - %(message)s'
-file_handler = RotatingFileHandler('./logs/app.log', maxBytes=5*1024*1024, backupCount=5)
+file_handler = RotatingFileHandler(LOG_FILE, maxBytes=5*1024*1024, backupCount=LOG_BACKUPS)
 file_handler.setFormatter(logging.Formatter(log_format))
 
 logger = logging.getLogger('FloodSense')
@@ -37,6 +60,8 @@ console_handler = logging.StreamHandler()
 console_handler.setFormatter(logging.Formatter(log_format))
 logger.addHandler(console_handler)
 
+log_reader = LogReader(LOG_FILE, backup_count=LOG_BACKUPS)
+
 logger.info("="*60)
 logger.info("FloodSense Backend Started")
 logger.info("="*60)
@@ -52,38 +77,160 @@ else:
     logger.info("✓ OpenAI API Key loaded")
 
 if API_KEY:
-    client = OpenAI(api_key=API_KEY)
+    # OPENAI_BASE_URL points the client at a compatible server (e.g. bench/fake_openai.py)
+    client = OpenAI(api_key=API_KEY, base_url=os.getenv('OPENAI_BASE_URL') or None)
+
+AI_MODEL = os.getenv('AI_MODEL', 'gpt-4o-mini')
+AI_MAX_TOKENS = int(os.getenv('AI_MAX_TOKENS', 300))
+AI_TEMPERATURE = float(os.getenv('AI_TEMPERATURE', 0.7))
+
+# Thread budget of a gunicorn worker (GUNICORN_THREADS, as in gunicorn.conf.py):
+# FAST_ROUTE_THREADS always stay free for water-status/config/commands, and
+# /api/stream clients plus chat (in flight + queued) share the rest. Limits
+# left unset are derived from it; set ones are lowered to fit. A worker
+# without 3 threads to share fails to start (ValueError).
+def _env_int(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+WORKER_THREADS = int(os.getenv('GUNICORN_THREADS', 32))
+FAST_ROUTE_THREADS = _env_int('FAST_ROUTE_THREADS')
+if FAST_ROUTE_THREADS is None:
+    FAST_ROUTE_THREADS = reserved_threads(WORKER_THREADS)
+CHAT_MAX_IN_FLIGHT, CHAT_MAX_QUEUE, STREAM_MAX_CLIENTS = thread_budget(
+    WORKER_THREADS, FAST_ROUTE_THREADS,
+    _env_int('CHAT_MAX_IN_FLIGHT'), _env_int('CHAT_MAX_QUEUE'), _env_int('STREAM_MAX_CLIENTS'))
+for _name, _value in (('CHAT_MAX_IN_FLIGHT', CHAT_MAX_IN_FLIGHT), ('CHAT_MAX_QUEUE', CHAT_MAX_QUEUE),
+                      ('STREAM_MAX_CLIENTS', STREAM_MAX_CLIENTS)):
+    if _env_int(_name) not in (None, _value):
+        logger.warning(f"{_name}={_env_int(_name)} lowered to {_value} to keep "
+                       f"{FAST_ROUTE_THREADS} of {WORKER_THREADS} threads for fast routes")
+logger.info(f"Thread budget: {WORKER_THREADS} threads, {FAST_ROUTE_THREADS} reserved, "
+            f"chat {CHAT_MAX_IN_FLIGHT}+{CHAT_MAX_QUEUE} queued, {STREAM_MAX_CLIENTS} stream clients")
+
+# At most CHAT_MAX_IN_FLIGHT chat requests per worker run at once and
+# CHAT_MAX_QUEUE more wait; the rest get 429, so chat can never take more
+# than in-flight + queue of the worker's threads from the dashboards
+chat_limiter = ConcurrencyLimiter(
+    limit=CHAT_MAX_IN_FLIGHT,
+    max_queue=CHAT_MAX_QUEUE,
+    queue_timeout=float(os.getenv('CHAT_QUEUE_TIMEOUT_SEC', 10)),
+    on_change=lambda active, waiting: (
+        metrics.gauge_set('floodsense_limited_requests', active, route='/chat', state='active'),
+        metrics.gauge_set('floodsense_limited_requests', waiting, route='/chat', state='waiting')))
+CHAT_RETRY_AFTER = int(os.getenv('CHAT_RETRY_AFTER_SEC', 5))
 
 # ========================================
 # Firebase Configuration
 # ========================================
-FIREBASE_SENSOR = os.getenv(
-    "FB_SENSOR",
-    "https://edfwef-default-rtdb.firebaseio.com/water_level/sensor1.json")
-FIREBASE_FORECAST = os.getenv(
-    "FB_FORECAST",
-    "https://edfwef-default-rtdb.firebaseio.com/forecast/sensor1.json")
-FIREBASE_CONFIG = os.getenv(
-    "FB_CONFIG",
-    "https://edfwef-default-rtdb.firebaseio.com/config/sensor1.json")
-FIREBASE_COMMANDS = os.getenv(
-    "FB_COMMANDS",
-    "https://edfwef-default-rtdb.firebaseio.com/commands/sensor1.json")
-
-LOCAL_HISTORY = "../history.csv"
-
-logger.info(f"Firebase Sensor URL: {FIREBASE_SENSOR}")
-logger.info(f"Firebase Forecast URL: {FIREBASE_FORECAST}")
+# Every registered gauge (sensors.json, or just sensor1); endpoints take
+# ?sensor=<id> and default to the first one
+SENSORS = load_registry()
+DEFAULT_SENSOR_ID = next(iter(SENSORS))
+
+# Range queries read the memory-mapped columnar store the ingestion daemon
+# mirrors each sensor's CSV log into (floodsense.ingest); workers only read it
+HISTORY_MAX_ROWS = int(os.getenv('HISTORY_MAX_ROWS', 50000))
+HISTORY_MAX_POINTS = int(os.getenv('HISTORY_MAX_POINTS', 5000))
+HISTORY_CACHE_SIZE = int(os.getenv('HISTORY_CACHE_SIZE', 128))
+history_columns = {sid: ColumnarHistory(s.columns_dir, read_only=True) for sid, s in SENSORS.items()}
+history_stores = {sid: s.history_store() for sid, s in SENSORS.items()}
+history_stats = {sid: HistoryStats(store) for sid, store in history_stores.items()}
+
+# Independent upstream reads run concurrently on a shared pool under one
+# deadline. At most UPSTREAM_MAX_PENDING fetches may be queued or running;
+# beyond that a fetch fails fast instead of queueing behind slow ones
+UPSTREAM_DEADLINE = float(os.getenv('UPSTREAM_DEADLINE_SEC', 6))
+UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', 16))
+upstream_pool = ThreadPoolExecutor(max_workers=UPSTREAM_POOL_SIZE, thread_name_prefix='upstream')
+upstream_slots = threading.BoundedSemaphore(int(os.getenv('UPSTREAM_MAX_PENDING', 4 * UPSTREAM_POOL_SIZE)))
+
+# Firebase reads are cached host-wide (shared by all gunicorn workers) with a
+# per-key TTL; a miss triggers a single upstream fetch
+upstream_cache = SharedCache(
+    path=os.getenv('CACHE_DB'),
+    ttls={
+        'sensor': float(os.getenv('CACHE_TTL_SENSOR', 2)),
+        'forecast': float(os.getenv('CACHE_TTL_FORECAST', 5)),
+        'config': float(os.getenv('CACHE_TTL_CONFIG', 30)),
+    })
+
+logger.info(f"Sensors: {', '.join(SENSORS)}")
+for _sensor in SENSORS.values():
+    logger.info(f"Firebase Sensor URL ({_sensor.id}): {_sensor.sensor_url}")
+
+# ========================================
+# Metrics (Prometheus /metrics, summed over all gunicorn workers)
+# ========================================
+metrics = get_metrics('backend')
+metrics.describe('floodsense_http_request_seconds', 'histogram',
+                 'Time until a view returned its response, by route, method and status')
+metrics.describe('floodsense_http_requests_in_flight', 'gauge', 'Requests being handled, by route')
+metrics.describe('floodsense_limited_requests', 'gauge',
+                 'Requests of a concurrency-limited route, by route and state (active/waiting)')
+metrics.describe('floodsense_rejected_requests_total', 'counter',
+                 'Requests turned away with 429 because a route was at its concurrency limit')
+metrics.describe('floodsense_chat_prompt_tokens', 'histogram',
+                 'Estimated prompt tokens per /chat model call (system + history + question)',
+                 buckets=(250, 500, 750, 1000, 1500, 2000, 3000, 4000, 6000, 8000))
+metrics.describe('floodsense_chat_tokens_total', 'counter',
+                 'Tokens billed by OpenAI for non-streamed /chat calls, by kind')
+metrics.describe('floodsense_chat_context_renders_total', 'counter',
+                 'Chat system prompts rendered because a sensor\'s data changed')
+metrics.describe('floodsense_chat_first_token_seconds', 'histogram',
+                 'Time from a streamed /chat request reaching OpenAI to its first token')
+
+def upstream_cache_metrics():
+    stats = upstream_cache.stats()
+    return [('floodsense_cache_requests_total', 'counter', 'Cache lookups by cache and result',
+             [({'cache': 'firebase', 'result': result}, stats[key])
+              for key, result in (('hits', 'hit'), ('misses', 'miss'), ('coalesced', 'coalesced'))])]
+
+metrics.add_collector(upstream_cache_metrics)
+
+@app.before_request
+def start_request_timer():
+    g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_start = time.perf_counter()
+    metrics.gauge_add('floodsense_http_requests_in_flight', 1, route=g.metrics_route)
+
+@app.after_request
+def record_request_time(response):
+    if 'metrics_start' in g:
+        metrics.observe('floodsense_http_request_seconds', time.perf_counter() - g.metrics_start,
+                        route=g.metrics_route, method=request.method, status=response.status_code)
+    return response
+
+@app.teardown_request
+def end_request(exc):
+    if 'metrics_route' in g:
+        metrics.gauge_add('floodsense_http_requests_in_flight', -1, route=g.metrics_route)
 
 # ========================================
-# Conversation History (In-Memory, per session)
+# Conversation History (shared by all workers, per session)
 # ========================================
-conversation_history = defaultdict(list)
 MAX_HISTORY = int(os.getenv('CONVERSATION_HISTORY_LIMIT', 10))
+conversations = ConversationStore(
+    path=os.getenv('CONVERSATION_DB'),
+    max_messages=MAX_HISTORY * 2,
+    max_sessions=int(os.getenv('CONVERSATION_MAX_SESSIONS', 5000)),
+    ttl=float(os.getenv('CONVERSATION_TTL_SEC', 3600)),
+    max_chars=int(os.getenv('CONVERSATION_MAX_CHARS', 2000)))
+
+def conversation_metrics():
+    stats = conversations.stats()
+    return [('floodsense_chat_sessions', 'gauge', 'Chat sessions held in the conversation store',
+             [({}, stats['sessions'])]),
+            ('floodsense_chat_sessions_removed_total', 'counter',
+             'Chat sessions dropped from the conversation store, by reason',
+             [({'reason': 'expired'}, stats['expired']), ({'reason': 'evicted'}, stats['evicted'])])]
+
+metrics.add_collector(conversation_metrics)
 
 def get_session_id():
-    """Extract or generate session ID from request"""
-    return request.remote_addr
+    """Session ID sent by the page (X-Session-Id), else the client address"""
+    session_id = request.headers.get('X-Session-Id', '').strip()
+    return session_id[:64] if session_id else request.remote_addr
 
 # ========================================
 # Utility Functions
@@ -93,11 +240,13 @@ def log_action(action_type, details):
     session_id = request.remote_addr
     logger.info(f"[{action_type}] Session:{session_id} | {details}")
 
-def get_latest_sensor_data():
+@upstream_cache.cached('sensor')
+def get_latest_sensor_data(sensor_id):
     """Fetch latest sensor reading from Firebase"""
     try:
-        logger.debug(f"Fetching sensor data from {FIREBASE_SENSOR}")
-        r = requests.get(FIREBASE_SENSOR, timeout=5)
+        url = SENSORS[sensor_id].sensor_url
+        logger.debug(f"Fetching sensor data from {url}")
+        r = get_client().get(url, timeout=5)
         if r.status_code == 200:
             data = r.json()
             logger.info(f"✓ Sensor data retrieved: waterLevel={data.get('waterLevel')}mm")
@@ -110,11 +259,13 @@ def get_latest_sensor_data():
         logger.error(f"Error fetching sensor data: {str(e)}")
     return None
 
-def get_forecast_data():
+@upstream_cache.cached('forecast')
+def get_forecast_data(sensor_id):
     """Fetch ML forecast from Firebase"""
     try:
-        logger.debug(f"Fetching forecast from {FIREBASE_FORECAST}")
-        r = requests.get(FIREBASE_FORECAST, timeout=5)
+        url = SENSORS[sensor_id].forecast_url
+        logger.debug(f"Fetching forecast from {url}")
+        r = get_client().get(url, timeout=5)
         if r.status_code == 200:
             data = r.json()
             logger.info(f"✓ Forecast retrieved: pred_10min={data.get('pred_10min')}mm")
@@ -127,45 +278,112 @@ def get_forecast_data():
         logger.error(f"Error fetching forecast: {str(e)}")
     return None
 
-def get_history_stats():
-    """Get statistics from historical data"""
+def get_history_stats(sensor_id):
+    """Get statistics from historical data (maintained incrementally)"""
     try:
-        if os.path.exists(LOCAL_HISTORY):
-            df = pd.read_csv(LOCAL_HISTORY)
-            if len(df) > 0 and 'waterLevel' in df.columns:
-                stats = {
-                    'current': float(df['waterLevel'].iloc[-1]),
-                    'min': float(df['waterLevel'].min()),
-                    'max': float(df['waterLevel'].max()),
-                    'avg': float(df['waterLevel'].mean()),
-                    'records': len(df),
-                    'trend': 'increasing' if len(df) > 1 and df['waterLevel'].iloc[-1] > df['waterLevel'].iloc[-2] else 'decreasing'
-                }
-                logger.debug(f"History stats: {stats}")
-                return stats
+        stats = history_stats[sensor_id].snapshot()
+        if stats:
+            logger.debug(f"History stats: {stats}")
+            return stats
     except Exception as e:
         logger.error(f"Error reading history stats: {str(e)}")
     return None
 
-def get_config_data():
+@upstream_cache.cached('config')
+def get_config_data(sensor_id):
     """Fetch current sensor configuration from Firebase"""
     try:
-        logger.debug(f"Fetching config from {FIREBASE_CONFIG}")
-        r = requests.get(FIREBASE_CONFIG, timeout=5)
+        url = SENSORS[sensor_id].config_url
+        logger.debug(f"Fetching config from {url}")
+        r = get_client().get(url, timeout=5)
         if r.status_code == 200:
             return r.json()
     except Exception as e:
         logger.error(f"Error fetching config: {str(e)}")
     return None
 
-def build_water_context():
-    """Build comprehensive context string with water level data for OpenAI"""
-    sensor = get_latest_sensor_data()
-    forecast = get_forecast_data()
-    history = get_history_stats()
-    config = get_config_data()
+def gather_upstream(fetchers, deadline=None):
+    """Run independent fetch functions concurrently under one overall deadline
+
+    Returns (results, missing): a fetch that has not finished by the deadline
+    comes back as None and its name is listed in `missing`, so callers can
+    answer with partial data instead of failing.
+    """
+    deadline = UPSTREAM_DEADLINE if deadline is None else deadline
+    slots = upstream_slots
+    futures = {}
+    for name, fn in fetchers.items():
+        if not slots.acquire(blocking=False):
+            continue  # pool saturated: answer without it rather than queue
+        future = upstream_pool.submit(fn)
+        future.add_done_callback(lambda _: slots.release())
+        futures[name] = future
+    done, _ = wait(futures.values(), timeout=deadline)
+
+    results, missing = {}, []
+    for name in fetchers:
+        future = futures.get(name)
+        if future is None:
+            logger.warning(f"Upstream fetch '{name}' skipped: {UPSTREAM_POOL_SIZE}-thread pool is saturated")
+            results[name] = None
+            missing.append(name)
+        elif future in done:
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error(f"Upstream fetch '{name}' failed: {str(e)}")
+                results[name] = None
+        else:
+            # Nobody waits for it any more; drop it if it has not started yet
+            future.cancel()
+            logger.warning(f"Upstream fetch '{name}' missed the {deadline}s deadline")
+            results[name] = None
+            missing.append(name)
+    return results, missing
+
+# Horizons quoted to the chat model; any horizon on the pushed curve works
+FORECAST_CONTEXT_MINUTES = (10, 30, 60)
+
+def forecast_at(forecast, minutes):
+    """(prediction, lower, upper) at a horizon, read from the forecast curve
+
+    Falls back to the pred_<N>min fields of forecasts pushed without a curve;
+    lower/upper are None when the curve has no interval yet.
+    """
+    curve = forecast.get('curve') or {}
+    mean, step = curve.get('mean'), curve.get('step_min')
+    if mean and step:
+        i = round(minutes / step) - 1
+        if 0 <= i < len(mean):
+            lower, upper = curve.get('lower'), curve.get('upper')
+            if lower and upper:
+                return mean[i], lower[i], upper[i]
+            return mean[i], None, None
+        return None
+    pred = forecast.get(f'pred_{minutes}min')
+    return (pred, None, None) if isinstance(pred, (int, float)) else None
+
+def sensor_fetchers(sensor_id, names=('sensor', 'forecast', 'history', 'config')):
+    """Zero-argument fetch functions for one sensor, for gather_upstream"""
+    fetchers = {
+        'sensor': partial(get_latest_sensor_data, sensor_id),
+        'forecast': partial(get_forecast_data, sensor_id),
+        'history': partial(get_history_stats, sensor_id),
+        'config': partial(get_config_data, sensor_id),
+    }
+    return {name: fetchers[name] for name in names}
+
+def build_water_context(sensor_id, data=None):
+    """Build comprehensive context string with water level data for OpenAI
+    (from already-fetched sensor_fetchers() results, if given)"""
+    if data is None:
+        data, _ = gather_upstream(sensor_fetchers(sensor_id))
+    sensor = data['sensor']
+    forecast = data['forecast']
+    history = data['history']
+    config = data['config']
     
-    context = "\n**📊 Dữ Liệu Cảm Biến Nước Thực Tế:**\n"
+    context = f"\n**📊 Dữ Liệu Cảm Biến Nước Thực Tế ({SENSORS[sensor_id].name}):**\n"
     
     if sensor:
         context += f"- Mực nước hiện tại: {sensor.get('waterLevel', 'N/A')} mm\n"
@@ -175,11 +393,19 @@ def build_water_context():
         context += "- ⚠️ Không có dữ liệu từ cảm biến (Kiểm tra kết nối Arduino)\n"
     
     if forecast:
-        pred_10 = forecast.get('pred_10min', 'N/A')
-        pred_30 = forecast.get('pred_30min', 'N/A')
         context += f"\n**🔮 Dự Báo ML:**\n"
-        context += f"- Dự báo 10 phút tới: {pred_10} mm\n"
-        context += f"- Dự báo 30 phút tới: {pred_30} mm\n"
+        for minutes in FORECAST_CONTEXT_MINUTES:
+            point = forecast_at(forecast, minutes)
+            if point is None:
+                continue
+            pred, lower, upper = point
+            band = f" (khoảng {lower:.1f}–{upper:.1f} mm)" if lower is not None else ""
+            context += f"- Dự báo {minutes} phút tới: {pred:.1f} mm{band}\n"
+        curve = forecast.get('curve') or {}
+        if curve.get('mean'):
+            peak = max(range(len(curve['mean'])), key=curve['mean'].__getitem__)
+            context += f"- Cao nhất trong {len(curve['mean']) * curve['step_min']} phút tới: "
+            context += f"{curve['mean'][peak]:.1f} mm (sau {(peak + 1) * curve['step_min']} phút)\n"
         context += f"- Độ tin cậy: Dựa trên {forecast.get('training_samples', '?')} mẫu lịch sử\n"
     else:
         context += f"\n**🔮 Dự Báo ML:**\n- Chưa có dữ liệu (Chạy ml_forecast_weather.py lần đầu)\n"
@@ -200,6 +426,24 @@ def build_water_context():
     
     return context
 
+def water_snapshot(sensor_id):
+    """Current sensor/forecast/config/history state pushed to /api/stream clients"""
+    data, _ = gather_upstream(sensor_fetchers(sensor_id))
+    return data
+
+# One poller per sensor per worker feeds every /api/stream client of that
+# sensor; reads go through the shared cache, so N dashboards cost about one
+# upstream fetch per update
+STREAM_HEARTBEAT = float(os.getenv('STREAM_HEARTBEAT_SEC', 15))
+broadcasters = {
+    sid: Broadcaster(
+        partial(water_snapshot, sid),
+        interval=float(os.getenv('STREAM_POLL_SEC', 2)),
+        buffer_size=int(os.getenv('STREAM_CLIENT_BUFFER', 8)),
+        log=logger.error)
+    for sid in SENSORS
+}
+
 # ========================================
 # Request Validation Decorator
 # ========================================
@@ -223,26 +467,75 @@ def validate_json(*expected_fields):
         return decorated_function
     return decorator
 
+def with_sensor(f):
+    """Decorator: pass the ?sensor= id (default: first registered) as sensor_id"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        sensor_id = request.args.get('sensor') or DEFAULT_SENSOR_ID
+        if sensor_id not in SENSORS:
+            logger.warning(f"Unknown sensor in {request.endpoint}: {sensor_id}")
+            return jsonify({'error': f'Unknown sensor: {sensor_id}', 'status': 'error'}), 404
+        return f(*args, sensor_id=sensor_id, **kwargs)
+    return decorated_function
+
+def limit_concurrency(limiter):
+    """Decorator: admit the request through limiter, or answer 429 with
+    Retry-After. A streamed response keeps its slot until the stream closes."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not limiter.acquire():
+                route = request.url_rule.rule
+                logger.warning(f"{route} at its concurrency limit, rejecting request")
+                metrics.inc('floodsense_rejected_requests_total', route=route)
+                response = jsonify({'error': 'Server busy, please retry shortly', 'status': 'error'})
+                response.headers['Retry-After'] = str(CHAT_RETRY_AFTER)
+                return response, 429
+
+            try:
+                response = app.make_response(f(*args, **kwargs))
+            except BaseException:
+                limiter.release()
+                raise
+            if response.is_streamed:
+                response.call_on_close(limiter.release)
+            else:
+                limiter.release()
+            return response
+        return decorated_function
+    return decorator
+
 # ========================================
 # API Routes (MUST be before catch-all route)
 # ========================================
 
+@app.route('/api/sensors', methods=['GET'])
+def list_sensors():
+    """Registered sensors (ids usable as ?sensor= on the other endpoints)"""
+    return jsonify({
+        'sensors': [s.to_dict() for s in SENSORS.values()],
+        'default': DEFAULT_SENSOR_ID,
+        'status': 'success'
+    })
+
 @app.route('/api/water-status', methods=['GET'])
-def water_status():
+@with_sensor
+def water_status(sensor_id):
     """Get current water level, predictions, and history"""
     try:
-        log_action("WATER_STATUS_REQUEST", "Fetching water data")
+        log_action("WATER_STATUS_REQUEST", f"Fetching water data for {sensor_id}")
         
-        sensor = get_latest_sensor_data()
-        forecast = get_forecast_data()
-        history = get_history_stats()
+        data, missing = gather_upstream(sensor_fetchers(sensor_id, ('sensor', 'forecast', 'history')))
         
         return jsonify({
-            'sensor': sensor,
-            'forecast': forecast,
-            'history': history,
+            'sensor_id': sensor_id,
+            'sensor': data['sensor'],
+            'forecast': data['forecast'],
+            'history': data['history'],
             'timestamp': datetime.now().isoformat(),
-            'status': 'success'
+            'status': 'success',
+            'partial': bool(missing),
+            'missing': missing
         })
     except Exception as e:
         logger.error(f"Error in /api/water-status: {str(e)}")
@@ -251,19 +544,54 @@ def water_status():
             'status': 'error'
         }), 500
 
+@app.route('/api/stream', methods=['GET'])
+@with_sensor
+def water_stream(sensor_id):
+    """Server-Sent Events: push water status to the client whenever it changes"""
+    clients = sum(len(b) for b in broadcasters.values())
+    if clients >= STREAM_MAX_CLIENTS:
+        logger.warning("Stream client limit reached")
+        response = jsonify({'error': 'Too many stream clients', 'status': 'error'})
+        response.headers['Retry-After'] = '10'
+        return response, 503
+
+    broadcaster = broadcasters[sensor_id]
+    log_action("STREAM_SUBSCRIBE", f"Sensor: {sensor_id} | Clients: {clients + 1}")
+    sub = broadcaster.subscribe()
+
+    def events():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                item = sub.get(timeout=STREAM_HEARTBEAT)
+                if item is None:
+                    yield ': keep-alive\n\n'
+                else:
+                    event_id, payload = item
+                    yield f'id: {event_id}\nevent: update\ndata: {payload}\n\n'
+        finally:
+            broadcaster.unsubscribe(sub)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
 @app.route('/api/config', methods=['GET'])
-def get_config():
+@with_sensor
+def get_config(sensor_id):
     """Get current sensor configuration"""
     try:
-        log_action("CONFIG_GET", "Fetching configuration")
-        config = get_config_data()
+        log_action("CONFIG_GET", f"Fetching configuration for {sensor_id}")
+        config = get_config_data(sensor_id)
         return jsonify({'config': config, 'status': 'success'})
     except Exception as e:
         logger.error(f"Error in /api/config: {str(e)}")
         return jsonify({'error': str(e), 'status': 'error'}), 500
 
 @app.route('/api/config', methods=['POST'])
-def save_config():
+@with_sensor
+def save_config(sensor_id):
     """Save sensor configuration to Firebase"""
     try:
         data = request.get_json()
@@ -272,11 +600,13 @@ def save_config():
             logger.warning("Empty config update attempt")
             return jsonify({'error': 'Empty config'}), 400
         
-        logger.info(f"Updating config: {data}")
-        log_action("CONFIG_UPDATE", f"New config: {json.dumps(data)}")
+        logger.info(f"Updating config for {sensor_id}: {data}")
+        log_action("CONFIG_UPDATE", f"Sensor: {sensor_id} | New config: {json.dumps(data)}")
         
         # Push to Firebase config
-        config_response = requests.put(FIREBASE_CONFIG, json=data, timeout=5)
+        sensor = SENSORS[sensor_id]
+        config_response = get_client().put(sensor.config_url, json=data, timeout=5)
+        upstream_cache.invalidate(f'config:{sensor_id}')
         
         # Also push to Arduino commands so it picks up the new config
         cmd_data = {
@@ -285,7 +615,7 @@ def save_config():
             'timestamp': datetime.now().isoformat(),
             'source': 'web-ui'
         }
-        requests.post(FIREBASE_COMMANDS.replace('.json', '.json'), json=cmd_data, timeout=5)
+        get_client().post(sensor.commands_url, json=cmd_data, timeout=5)
         
         if config_response.status_code in [200, 201]:
             logger.info("✓ Config saved to Firebase and sent to Arduino")
@@ -302,7 +632,8 @@ def save_config():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/command', methods=['POST'])
-def send_command():
+@with_sensor
+def send_command(sensor_id):
     """Send command to Arduino via Firebase"""
     try:
         data = request.get_json()
@@ -311,8 +642,8 @@ def send_command():
         if not command:
             return jsonify({'error': 'Missing command'}), 400
         
-        logger.info(f"Sending command: {command}")
-        log_action("COMMAND_SEND", f"Command: {command}")
+        logger.info(f"Sending command to {sensor_id}: {command}")
+        log_action("COMMAND_SEND", f"Sensor: {sensor_id} | Command: {command}")
         
         # Push to Firebase
         cmd_data = {
@@ -321,7 +652,7 @@ def send_command():
             'source': 'web-ui'
         }
         
-        response = requests.post(FIREBASE_COMMANDS.replace('.json', '.json'), json=cmd_data, timeout=5)
+        response = get_client().post(SENSORS[sensor_id].commands_url, json=cmd_data, timeout=5)
         
         if response.status_code in [200, 201]:
             logger.info(f"✓ Command '{command}' sent successfully")
@@ -334,28 +665,214 @@ def send_command():
         logger.error(f"Error in /api/command: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text exposition of request, upstream and cache metrics"""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    """Upstream cache hit/miss counters, summed over all workers"""
+    try:
+        return jsonify({'cache': upstream_cache.stats(), 'status': 'success'})
+    except Exception as e:
+        logger.error(f"Error reading cache stats: {str(e)}")
+        return jsonify({'error': str(e), 'status': 'error'}), 500
+
+def parse_time_param(value):
+    """Query param as epoch ms: accepts an integer or an ISO date/time"""
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return int(datetime.fromisoformat(value).timestamp() * 1000)
+    except ValueError:
+        raise ValueError(f"invalid time: {value}")
+
+def query_history(sensor_id, start, end):
+    """Columnar history of a sensor in [start, end] with late CSV rows merged in"""
+    history_stores[sensor_id].refresh()  # picks up late rows the daemon logged since
+    cols = history_columns[sensor_id].query(start, end)
+    late = history_stores[sensor_id].late_rows()
+    if len(late):
+        ts = late['timestamp'].to_numpy()
+        mask = np.ones(len(ts), dtype=bool)
+        if start is not None:
+            mask &= ts >= start
+        if end is not None:
+            mask &= ts <= end
+        if mask.any():
+            late = late[mask]
+            merged = {c: np.concatenate([cols[c], late[c].to_numpy(cols[c].dtype)]) for c in cols}
+            order = np.argsort(merged['timestamp'], kind='stable')
+            cols = {c: merged[c][order] for c in merged}
+    return cols
+
+def history_version(sensor_id):
+    """Changes whenever a sensor's history does: row count, newest row, late rows"""
+    store = history_stores[sensor_id]
+    store.refresh()
+    columns = history_columns[sensor_id]
+    return (len(columns), columns.last_timestamp(), len(store.late_rows()))
+
+def history_payload(cols):
+    return {
+        'timestamp': cols['timestamp'].tolist(),
+        'waterLevel': [None if v != v else v for v in cols['waterLevel'].tolist()],
+        'distance': [None if v != v else v for v in cols['distance'].tolist()],
+        'count': len(cols['timestamp']),
+    }
+
+# Downsampled chart series keyed by (sensor, from, to, points, mode, data version)
+downsample_cache = OrderedDict()
+downsample_cache_lock = threading.Lock()
+
+def downsampled_history(sensor_id, start, end, points, mode):
+    """Chart series for a range reduced to at most `points` readings (cached)"""
+    key = (sensor_id, start, end, points, mode, history_version(sensor_id))
+    with downsample_cache_lock:
+        if key in downsample_cache:
+            downsample_cache.move_to_end(key)
+            metrics.inc('floodsense_cache_requests_total', cache='history_downsample', result='hit')
+            return downsample_cache[key]
+    metrics.inc('floodsense_cache_requests_total', cache='history_downsample', result='miss')
+
+    cols = query_history(sensor_id, start, end)
+    idx = downsample(cols['timestamp'], cols['waterLevel'], points, mode)
+    payload = history_payload({c: cols[c][idx] for c in cols})
+    payload.update({'raw_count': len(cols['timestamp']), 'points': points, 'mode': mode})
+    with downsample_cache_lock:
+        downsample_cache[key] = payload
+        while len(downsample_cache) > HISTORY_CACHE_SIZE:
+            downsample_cache.popitem(last=False)
+    return payload
+
+@app.route('/api/history', methods=['GET'])
+@with_sensor
+def get_history(sensor_id):
+    """Readings in a time range from the columnar history
+
+    Query params: from, to (epoch ms or ISO time, both inclusive); points
+    (pixel budget, downsamples on the server) and mode (lttb or minmax).
+    """
+    try:
+        start = parse_time_param(request.args.get('from'))
+        end = parse_time_param(request.args.get('to'))
+        if start is not None and end is not None and start > end:
+            return jsonify({'error': 'from must not be after to', 'status': 'error'}), 400
+
+        points = request.args.get('points', type=int)
+        if points is not None:
+            points = min(max(points, 3), HISTORY_MAX_POINTS)
+            mode = request.args.get('mode', 'lttb')
+            return jsonify(dict(downsampled_history(sensor_id, start, end, points, mode), status='success'))
+
+        cols = query_history(sensor_id, start, end)
+        count = len(cols['timestamp'])
+        if count > HISTORY_MAX_ROWS:
+            return jsonify({
+                'error': f'{count} readings in range, limit is {HISTORY_MAX_ROWS}; narrow from/to or pass points',
+                'status': 'error'
+            }), 400
+        return jsonify(dict(history_payload(cols), status='success'))
+    except ValueError as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 400
+    except Exception as e:
+        logger.error(f"Error reading history: {str(e)}")
+        return jsonify({'error': str(e), 'status': 'error'}), 500
+
 @app.route('/api/logs', methods=['GET'])
 def get_logs():
-    """Get recent application logs (last 100 lines)"""
+    """Get recent application logs
+
+    Query params: lines (default 100, max 1000), level (minimum severity),
+    since (ISO time), cursor (from a previous response: only newer lines).
+    """
     try:
-        if not os.path.exists('./logs/app.log'):
+        if not os.path.exists(LOG_FILE):
             return jsonify({'logs': [], 'status': 'no_logs'})
         
-        with open('./logs/app.log', 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        lines = min(max(request.args.get('lines', 100, type=int), 1), 1000)
+        level = request.args.get('level')
+        since = request.args.get('since')
+        cursor = request.args.get('cursor')
         
-        recent_logs = lines[-100:]  # Last 100 lines
+        if cursor:
+            recent_logs, next_cursor = log_reader.read_since(cursor, lines, level, since)
+        else:
+            recent_logs, next_cursor = log_reader.tail(lines, level, since)
         return jsonify({
             'logs': recent_logs,
-            'total_lines': len(lines),
+            'cursor': next_cursor,
             'status': 'success'
         })
+    except (InvalidCursor, ValueError) as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 400
     except Exception as e:
         logger.error(f"Error reading logs: {str(e)}")
         return jsonify({'error': str(e), 'status': 'error'}), 500
 
+# Answers to first questions are cached per normalized question and
+# quantized water state, so a surge of the same few questions costs one
+# OpenAI call per state instead of one per user
+CHAT_CACHE_TTL = float(os.getenv('CHAT_CACHE_TTL_SEC', 300))
+CHAT_CACHE_SIZE = int(os.getenv('CHAT_CACHE_SIZE', 256))
+chat_cache = OrderedDict()
+chat_cache_lock = threading.Lock()
+
+def normalize_question(message):
+    """Case-, punctuation- and spacing-insensitive form of a question"""
+    text = unicodedata.normalize('NFC', message).lower()
+    text = ''.join(ch if ch.isalnum() else ' ' for ch in text)
+    return ' '.join(text.split())
+
+def water_band(level_mm):
+    """Alert band of a water level, matching the thresholds in the prompt"""
+    if not isinstance(level_mm, (int, float)):
+        return 'unknown'
+    if level_mm < 150:
+        return 'normal'
+    return 'watch' if level_mm <= 200 else 'danger'
+
+def chat_cache_key(sensor_id, message, data):
+    """(question, water band, forecast band, config version) for the answer
+    cache, or None if the water level or forecast is unavailable: an answer
+    given without data must not be served once it is back"""
+    sensor, forecast, config = data['sensor'], data['forecast'], data['config']
+    predictions = [point[0] for point in (forecast_at(forecast, m) for m in FORECAST_CONTEXT_MINUTES)
+                   if point is not None] if forecast else []
+    level_band = water_band(sensor.get('waterLevel') if sensor else None)
+    forecast_band = water_band(max(predictions) if predictions else None)
+    if 'unknown' in (level_band, forecast_band):
+        return None
+    config_version = hashlib.sha1(
+        json.dumps(config, sort_keys=True).encode()).hexdigest()[:12] if config else 'none'
+    return (sensor_id, normalize_question(message), level_band, forecast_band, config_version)
+
+def cached_answer(key):
+    with chat_cache_lock:
+        entry = chat_cache.get(key)
+        if entry is not None and entry[1] > time.time():
+            chat_cache.move_to_end(key)
+            metrics.inc('floodsense_cache_requests_total', cache='chat_answer', result='hit')
+            return entry[0]
+        chat_cache.pop(key, None)
+    metrics.inc('floodsense_cache_requests_total', cache='chat_answer', result='miss')
+    return None
+
+def store_answer(key, reply):
+    with chat_cache_lock:
+        chat_cache[key] = (reply, time.time() + CHAT_CACHE_TTL)
+        chat_cache.move_to_end(key)
+        while len(chat_cache) > CHAT_CACHE_SIZE:
+            chat_cache.popitem(last=False)
+
 @app.route('/chat', methods=['POST'])
-def chat():
+@with_sensor
+def chat(sensor_id):
     """AI chat endpoint with context-aware responses and conversation history"""
     try:
         data = request.get_json()
@@ -372,14 +889,42 @@ def chat():
         session_id = get_session_id()
         log_action("CHAT_MESSAGE", f"User: {message[:50]}...")
         
-        # Get water context
-        water_context = build_water_context()
-        
         # Get conversation history for this session
-        history = conversation_history[session_id]
+        history = conversations.get(session_id)
+        
+        # Current water data (through the shared upstream cache)
+        water_data, _ = gather_upstream(sensor_fetchers(sensor_id))
+        
+        # A question without earlier turns does not depend on the session, so
+        # it can be answered from the cache while the water state is unchanged
+        cache_key = None if history else chat_cache_key(sensor_id, message, water_data)
+        reply = cached_answer(cache_key) if cache_key else None
+        if reply is not None:
+            logger.info("✓ Chat answered from cache")
+            record_chat_turn(session_id, message, reply)
+            return jsonify({
+                'reply': reply,
+                'status': 'success',
+                'cached': True,
+                'timestamp': datetime.now().isoformat()
+            })
         
-        # Build enhanced system prompt
-        system_prompt = f'''Bạn là trợ lý AI chuyên CẢNH BÁO LŨ LỤT Việt Nam - FloodSense System.
+        stream = data.get('stream') or 'text/event-stream' in request.headers.get('Accept', '')
+        return answer_chat(sensor_id, session_id, message, history, water_data, cache_key, stream)
+        
+    except Exception as e:
+        logger.error(f"Error in /chat: {str(e)}")
+        log_action("CHAT_ERROR", str(e))
+        return jsonify({
+            'error': f'Lỗi AI: {str(e)}',
+            'status': 'error'
+        }), 500
+
+# The system prompt (instructions + rendered water context) is built once
+# per change of a sensor's data and shared by every chat request; history
+# is then trimmed to what fits CHAT_PROMPT_TOKEN_BUDGET
+CHAT_PROMPT_TOKEN_BUDGET = int(os.getenv('CHAT_PROMPT_TOKEN_BUDGET', 2000))
+SYSTEM_PROMPT = '''Bạn là trợ lý AI chuyên CẢNH BÁO LŨ LỤT Việt Nam - FloodSense System.
 
 **Hướng dẫn Hành Động:**
 - Trả lời **ngắn gọn, hữu ích** bằng tiếng Việt (tối đa 3 câu).
@@ -398,50 +943,124 @@ def chat():
 - "Mực nước hiện tại bao nhiêu?" → Nêu giá trị từ cảm biến + tình trạng
 - "Sẽ ngập không?" → Dùng dự báo ML + lịch sử
 - "Bây giờ đang nguy hiểm?" → So sánh với ngưỡng cảnh báo'''
-        
-        # Prepare messages with history
-        messages = [{'role': 'system', 'content': system_prompt}]
-        
-        # Add conversation history (last N messages)
-        for hist_msg in history[-MAX_HISTORY:]:
-            messages.append(hist_msg)
-        
-        # Add current user message
-        messages.append({'role': 'user', 'content': message})
-        
-        logger.info(f"Calling OpenAI with {len(messages)} messages (including system)")
-        
-        # Call OpenAI
+chat_contexts = {}  # sensor_id -> (data version, system prompt, tokens)
+chat_contexts_lock = threading.Lock()
+
+def system_prompt_for(sensor_id, water_data):
+    """(system prompt, token count) for the sensor's current data"""
+    version = hashlib.sha1(json.dumps(water_data, sort_keys=True, default=str).encode()).hexdigest()
+    with chat_contexts_lock:
+        cached = chat_contexts.get(sensor_id)
+    if cached and cached[0] == version:
+        return cached[1], cached[2]
+    prompt = SYSTEM_PROMPT.format(water_context=build_water_context(sensor_id, water_data))
+    tokens = count_tokens(prompt, AI_MODEL) + MESSAGE_OVERHEAD
+    with chat_contexts_lock:
+        chat_contexts[sensor_id] = (version, prompt, tokens)
+    metrics.inc('floodsense_chat_context_renders_total', sensor=sensor_id)
+    return prompt, tokens
+
+def build_chat_messages(sensor_id, message, history, water_data):
+    """Messages for OpenAI: system prompt, as much recent history as the
+    token budget allows, then the question. Returns (messages, prompt tokens)."""
+    system_prompt, system_tokens = system_prompt_for(sensor_id, water_data)
+    question = {'role': 'user', 'content': message}
+    fixed = system_tokens + message_tokens(question, AI_MODEL) + REPLY_PRIMING
+    kept, history_tokens = fit_history(history[-MAX_HISTORY:], CHAT_PROMPT_TOKEN_BUDGET - fixed, AI_MODEL)
+    prompt_tokens = fixed + history_tokens
+    
+    metrics.observe('floodsense_chat_prompt_tokens', prompt_tokens)
+    logger.info(f"Prompt ~{prompt_tokens} tokens: system {system_tokens}, "
+                f"{len(kept)}/{len(history[-MAX_HISTORY:])} history messages ({history_tokens})")
+    return [{'role': 'system', 'content': system_prompt}, *kept, question], prompt_tokens
+
+@limit_concurrency(chat_limiter)
+def answer_chat(sensor_id, session_id, message, history, water_data, cache_key, stream):
+    """Ask OpenAI (admitted through the chat limiter); streamed as SSE if requested"""
+    messages, prompt_tokens = build_chat_messages(sensor_id, message, history, water_data)
+    
+    logger.info(f"Calling OpenAI with {len(messages)} messages (including system)")
+    
+    if stream:
+        return Response(stream_with_context(stream_chat(session_id, message, messages, cache_key,
+                                                        prompt_tokens)),
+                        mimetype='text/event-stream', headers={
+                            'Cache-Control': 'no-cache',
+                            'X-Accel-Buffering': 'no',
+                            'X-Prompt-Tokens': str(prompt_tokens),
+                        })
+    
+    # Call OpenAI
+    with metrics.upstream('openai', 'chat.completions'):
         completion = client.chat.completions.create(
-            model=os.getenv('AI_MODEL', 'gpt-4o-mini'),
+            model=AI_MODEL,
             messages=messages,
-            max_tokens=int(os.getenv('AI_MAX_TOKENS', 300)),
-            temperature=float(os.getenv('AI_TEMPERATURE', 0.7))
+            max_tokens=AI_MAX_TOKENS,
+            temperature=AI_TEMPERATURE
         )
-        
-        reply = completion.choices[0].message.content
-        
-        # Store in conversation history
-        history.append({'role': 'user', 'content': message})
-        history.append({'role': 'assistant', 'content': reply})
-        conversation_history[session_id] = history[-MAX_HISTORY*2:]  # Keep last N pairs
-        
-        logger.info(f"✓ AI replied: {reply[:50]}...")
-        log_action("CHAT_RESPONSE", f"AI: {reply[:50]}...")
-        
-        return jsonify({
-            'reply': reply,
-            'status': 'success',
-            'timestamp': datetime.now().isoformat()
-        })
-        
+    
+    reply = completion.choices[0].message.content
+    if completion.usage:
+        metrics.inc('floodsense_chat_tokens_total', completion.usage.prompt_tokens, kind='prompt')
+        metrics.inc('floodsense_chat_tokens_total', completion.usage.completion_tokens, kind='completion')
+    record_chat_turn(session_id, message, reply)
+    if cache_key:
+        store_answer(cache_key, reply)
+    
+    response = jsonify({
+        'reply': reply,
+        'status': 'success',
+        'prompt_tokens': prompt_tokens,
+        'timestamp': datetime.now().isoformat()
+    })
+    response.headers['X-Prompt-Tokens'] = str(prompt_tokens)
+    return response
+
+def record_chat_turn(session_id, message, reply):
+    """Store a finished exchange in the session's conversation history"""
+    conversations.append(session_id,
+                         {'role': 'user', 'content': message},
+                         {'role': 'assistant', 'content': reply})
+    logger.info(f"✓ AI replied: {reply[:50]}...")
+    log_action("CHAT_RESPONSE", f"AI: {reply[:50]}...")
+
+def stream_chat(session_id, message, messages, cache_key=None, prompt_tokens=None):
+    """SSE relay of a streamed completion: a `delta` event per token chunk,
+    then `done` with the whole reply (or `error`). The turn is recorded in
+    the conversation history once the completion has finished."""
+    parts = []
+    started = time.perf_counter()
+    try:
+        with metrics.upstream('openai', 'chat.completions.stream'):
+            chunks = client.chat.completions.create(
+                model=AI_MODEL,
+                messages=messages,
+                max_tokens=AI_MAX_TOKENS,
+                temperature=AI_TEMPERATURE,
+                stream=True
+            )
+            for chunk in chunks:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if not text:
+                    continue
+                if not parts:
+                    metrics.observe('floodsense_chat_first_token_seconds',
+                                    time.perf_counter() - started)
+                parts.append(text)
+                yield f"event: delta\ndata: {json.dumps({'text': text}, ensure_ascii=False)}\n\n"
     except Exception as e:
-        logger.error(f"Error in /chat: {str(e)}")
+        logger.error(f"Error in streamed /chat: {str(e)}")
         log_action("CHAT_ERROR", str(e))
-        return jsonify({
-            'error': f'Lỗi AI: {str(e)}',
-            'status': 'error'
-        }), 500
+        yield f"event: error\ndata: {json.dumps({'error': f'Lỗi AI: {str(e)}', 'status': 'error'}, ensure_ascii=False)}\n\n"
+        return
+
+    reply = ''.join(parts)
+    record_chat_turn(session_id, message, reply)
+    if cache_key:
+        store_answer(cache_key, reply)
+    done = {'reply': reply, 'status': 'success', 'prompt_tokens': prompt_tokens,
+            'timestamp': datetime.now().isoformat()}
+    yield f"event: done\ndata: {json.dumps(done, ensure_ascii=False)}\n\n"
 
 # ========================================
 # Static Files & Catch-all Routes (MUST be after API routes)
@@ -0,0 +1,236 @@
+"""Local stand-in for the Firebase Realtime Database REST API.
+
+Keeps an in-memory JSON tree and serves GET/PUT/PATCH/POST/DELETE on
+/<path>.json the way Firebase does (POST appends under a generated key and
+answers {"name": key}), with injected latency. It is seeded with a live
+looking sensor1: every read of water_level/<id> gets a fresh timestamp and
+a slowly drifting level.
+
+A GET with `Accept: text/event-stream` is answered like Firebase's
+streaming API: a `put` of the whole value at the path, then `put`/`patch`
+events for every write under it and a `keep-alive` every --keep-alive
+seconds. The response is not chunk-encoded (HTTP/1.0, closed by the
+server), so it also catches clients that buffer small events.
+
+    python bench/fake_firebase.py --port 8702 --latency 0.08 --jitter 0.04
+    FIREBASE_DB=http://127.0.0.1:8702 gunicorn wsgi:app
+"""
+import argparse
+import json
+import math
+import queue
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def seed(sensors=("sensor1",)):
+    now = int(time.time())
+    return {
+        "water_level": {sid: {"waterLevel": 120.0, "distance": 38.0, "timestamp": now * 1000}
+                        for sid in sensors},
+        "forecast": {sid: {"pred_10min": 124.0, "pred_30min": 131.0, "pred_60min": 142.0,
+                           "training_samples": 720, "timestamp": now} for sid in sensors},
+        "config": {sid: {"alertThreshold": 200, "updateInterval": 5, "sensorHeight": 50}
+                   for sid in sensors},
+        "commands": {sid: {} for sid in sensors},
+    }
+
+
+class Tree:
+    """The database: nested dicts addressed by slash-separated paths"""
+
+    def __init__(self, data):
+        self.data = data
+        self.lock = threading.Lock()
+        self.subscribers = []  # (path parts, queue of (event, payload))
+
+    def subscribe(self, parts):
+        q = queue.Queue()
+        with self.lock:
+            self.subscribers.append((parts, q))
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers = [(p, sq) for p, sq in self.subscribers if sq is not q]
+
+    def _notify(self, parts, event, value):
+        """Queue a write at `parts` for every stream whose path overlaps it
+        (called with the lock held)"""
+        for sub, q in self.subscribers:
+            if parts[:len(sub)] == sub:
+                q.put((event, {"path": "/" + "/".join(parts[len(sub):]), "data": value}))
+            elif sub[:len(parts)] == parts:
+                q.put(("put", {"path": "/", "data": self._at(sub)}))
+
+    def _at(self, parts):
+        node = self.data
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return json.loads(json.dumps(node))
+
+    def get(self, parts):
+        with self.lock:
+            node = self.data
+            for part in parts:
+                if not isinstance(node, dict) or part not in node:
+                    return None
+                node = node[part]
+            if len(parts) == 2 and parts[0] == "water_level" and isinstance(node, dict):
+                # Live sensor: new reading on every poll
+                node["timestamp"] = int(time.time() * 1000)
+                node["waterLevel"] = round(120 + 15 * math.sin(time.time() / 60), 1)
+            return json.loads(json.dumps(node))
+
+    def set(self, parts, value):
+        with self.lock:
+            if not parts:
+                self.data = value if isinstance(value, dict) else {}
+                self._notify(parts, "put", value)
+                return
+            node = self.data
+            for part in parts[:-1]:
+                node = node.setdefault(part, {})
+            if value is None:
+                node.pop(parts[-1], None)
+            else:
+                node[parts[-1]] = value
+            self._notify(parts, "put", value)
+
+    def update(self, parts, values):
+        with self.lock:
+            node = self.data
+            for part in parts:
+                node = node.setdefault(part, {})
+            node.update(values)
+            self._notify(parts, "patch", values)
+
+
+def make_handler(tree, latency, jitter, keep_alive=30.0):
+    class Handler(BaseHTTPRequestHandler):
+        def _parts(self):
+            path = self.path.split("?")[0]
+            if not path.endswith(".json"):
+                return None
+            return [p for p in path[:-len(".json")].split("/") if p]
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"null")
+
+        def _reply(self, value, status=200):
+            time.sleep(latency + random.uniform(0, jitter))
+            payload = json.dumps(value).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _handle(self, method):
+            parts = self._parts()
+            if parts is None:
+                self._reply({"error": "404 Not Found"}, 404)
+                return
+            if method == "GET" and "text/event-stream" in self.headers.get("Accept", ""):
+                self._stream(parts)
+            elif method == "GET":
+                self._reply(tree.get(parts))
+            elif method == "PUT":
+                value = self._body()
+                tree.set(parts, value)
+                self._reply(value)
+            elif method == "PATCH":
+                values = self._body()
+                tree.update(parts, values)
+                self._reply(values)
+            elif method == "POST":
+                key = "-" + uuid.uuid4().hex[:19]
+                tree.set(parts + [key], self._body())
+                self._reply({"name": key})
+            elif method == "DELETE":
+                tree.set(parts, None)
+                self._reply(None)
+
+        def _stream(self, parts):
+            events = tree.subscribe(parts)
+            try:
+                time.sleep(latency + random.uniform(0, jitter))
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                self._event("put", {"path": "/", "data": tree.get(parts)})
+                while True:
+                    try:
+                        event, payload = events.get(timeout=keep_alive)
+                    except queue.Empty:
+                        event, payload = "keep-alive", None
+                    self._event(event, payload)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                tree.unsubscribe(events)
+
+        def _event(self, event, payload):
+            self.wfile.write(f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode())
+            self.wfile.flush()
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_PUT(self):
+            self._handle("PUT")
+
+        def do_PATCH(self):
+            self._handle("PATCH")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def do_DELETE(self):
+            self._handle("DELETE")
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port=8702, latency=0.05, jitter=0.0, sensors=("sensor1",), host="127.0.0.1", keep_alive=30.0):
+    """Start the stand-in on a daemon thread; returns the server"""
+    server = ThreadingHTTPServer((host, port),
+                                 make_handler(Tree(seed(sensors)), latency, jitter, keep_alive))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-firebase", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local Firebase Realtime Database stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8702)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay, up to this many seconds")
+    parser.add_argument("--sensors", default="sensor1", help="comma-separated sensor ids to seed")
+    parser.add_argument("--keep-alive", type=float, default=30.0, help="seconds between stream keep-alives")
+    args = parser.parse_args(argv)
+    tree = Tree(seed(args.sensors.split(",")))
+    server = ThreadingHTTPServer((args.host, args.port),
+                                 make_handler(tree, args.latency, args.jitter, args.keep_alive))
+    server.daemon_threads = True
+    print(f"[FAKE-FIREBASE] http://{args.host}:{args.port} (latency {args.latency}s "
+          f"+ up to {args.jitter}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
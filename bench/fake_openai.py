@@ -0,0 +1,116 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Serves POST /v1/chat/completions, both plain and stream=True (SSE chunks
+ending in `data: [DONE]`), with injected latency so /chat can be exercised
+and timed offline. Point the backend at it with
+
+    python bench/fake_openai.py --port 8701 --latency 0.8 --token-delay 0.03
+    OPENAI_API_KEY=test OPENAI_BASE_URL=http://127.0.0.1:8701/v1 gunicorn wsgi:app
+
+--latency is the wait before the first token, --token-delay the gap
+between tokens; a non-streamed reply takes latency + tokens * token-delay.
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = ("Mực nước hiện tại ở mức bình thường, chưa vượt ngưỡng cảnh báo. "
+         "Dự báo trong 60 phút tới không có nguy cơ ngập. "
+         "Hãy tiếp tục theo dõi vndms.dmc.gov.vn để cập nhật.")
+
+
+def make_handler(latency, token_delay, tokens):
+    words = REPLY.split(" ")
+    reply_tokens = [w if i == 0 else " " + w for i, w in enumerate(words)][:tokens or None]
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_error(404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            model = body.get("model", "gpt-4o-mini")
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            time.sleep(latency)
+            if body.get("stream"):
+                self._stream(completion_id, model)
+            else:
+                time.sleep(token_delay * len(reply_tokens))
+                self._json(completion_id, model, body)
+
+        def _json(self, completion_id, model, body):
+            prompt_chars = sum(len(m.get("content") or "") for m in body.get("messages", []))
+            payload = json.dumps({
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(reply_tokens)}}],
+                "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(reply_tokens),
+                          "total_tokens": prompt_chars // 4 + len(reply_tokens)},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _stream(self, completion_id, model):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            deltas = [{"role": "assistant", "content": ""}] + [{"content": t} for t in reply_tokens]
+            for i, delta in enumerate(deltas):
+                if i > 1:
+                    time.sleep(token_delay)
+                self._event({"id": completion_id, "object": "chat.completion.chunk",
+                             "created": int(time.time()), "model": model,
+                             "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+            self._event({"id": completion_id, "object": "chat.completion.chunk",
+                         "created": int(time.time()), "model": model,
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+        def _event(self, chunk):
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port=8701, latency=0.5, token_delay=0.02, tokens=0, host="127.0.0.1"):
+    """Start the stand-in on a daemon thread; returns the server"""
+    server = ThreadingHTTPServer((host, port), make_handler(latency, token_delay, tokens))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local OpenAI chat completions stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8701)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between tokens")
+    parser.add_argument("--tokens", type=int, default=0, help="cap on reply tokens (0 = whole reply)")
+    args = parser.parse_args(argv)
+    server = ThreadingHTTPServer((args.host, args.port),
+                                 make_handler(args.latency, args.token_delay, args.tokens))
+    server.daemon_threads = True
+    print(f"[FAKE-OPENAI] http://{args.host}:{args.port}/v1 (latency {args.latency}s, "
+          f"{args.token_delay}s/token)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
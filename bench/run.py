@@ -0,0 +1,264 @@
+"""Load test of the backend against local Firebase and OpenAI stand-ins.
+
+Starts bench/fake_firebase.py and bench/fake_openai.py in this process,
+starts `gunicorn wsgi:app` pointed at them (with its caches, conversation
+store, metrics and columnar history in a temporary directory), then drives
+each endpoint at the target concurrency for --duration seconds and prints
+one JSON document: per phase and endpoint the request count, status codes,
+throughput and p50/p95/p99 latency.
+
+    python bench/run.py --concurrency 16 --duration 10 --firebase-latency 0.08 \\
+        --openai-latency 1.5 --output /tmp/floodsense-bench.json
+
+Phases run one after another: one per endpoint, then "mixed", where every
+client picks endpoints by --mix weight (e.g. to see whether chat load moves
+water-status p99). --phases selects a subset. Every chat request comes from
+a new session, like a surge of users each asking one question.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_firebase  # noqa: E402
+import fake_openai  # noqa: E402
+
+QUESTIONS = (
+    "Mực nước hiện tại bao nhiêu?",
+    "Sẽ ngập không?",
+    "Bây giờ đang nguy hiểm?",
+    "Dự báo 30 phút tới thế nào?",
+)
+COMMANDS = ("ping", "read_now", "calibrate")
+
+# name -> (method, path, body factory)
+_counter = itertools.count()
+ENDPOINTS = {
+    "water-status": ("GET", "/api/water-status", None),
+    "config": ("GET", "/api/config", None),
+    "config-save": ("POST", "/api/config",
+                    lambda args: {"alertThreshold": 200, "updateInterval": 5, "sensorHeight": 50}),
+    "command": ("POST", "/api/command", lambda args: {"command": random.choice(COMMANDS)}),
+    "chat": ("POST", "/chat",
+             lambda args: {"message": random.choice(QUESTIONS) + (
+                 f" #{next(_counter)}" if args.unique_chat else ""), "stream": args.chat_stream}),
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# ----------------------------------------
+# Stand-ins and server under test
+# ----------------------------------------
+def start_backend(args, tmp, firebase_url, openai_url):
+    port = free_port()
+    sensors_file = os.path.join(tmp, "sensors.json")
+    with open(sensors_file, "w", encoding="utf-8") as f:
+        json.dump({"sensors": [{"id": "sensor1", "name": "Bench"}]}, f)
+    env = dict(os.environ,
+               FIREBASE_DB=firebase_url,
+               SENSORS_FILE=sensors_file,
+               FB_SENSOR=f"{firebase_url}/water_level/sensor1.json",
+               FB_FORECAST=f"{firebase_url}/forecast/sensor1.json",
+               OPENAI_API_KEY="bench",
+               OPENAI_BASE_URL=openai_url,
+               CACHE_DB=os.path.join(tmp, "cache.sqlite"),
+               CONVERSATION_DB=os.path.join(tmp, "conversations.sqlite"),
+               METRICS_DIR=tmp,
+               HISTORY_COLUMNS_DIR=os.path.join(tmp, "history_columns"),
+               GUNICORN_THREADS=str(args.threads))
+    log = open(os.path.join(tmp, "gunicorn.log"), "w")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(args.workers), "-b", f"127.0.0.1:{port}",
+         "--timeout", "120", "wsgi:app"],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {proc.returncode}; see {log.name}")
+        try:
+            if requests.get(f"{base}/api/sensors", timeout=2).status_code == 200:
+                return proc, base
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    proc.terminate()
+    raise RuntimeError(f"gunicorn did not come up within 60s; see {log.name}")
+
+
+# ----------------------------------------
+# Load generation
+# ----------------------------------------
+def run_phase(base, names, weights, args):
+    """Closed-loop clients for args.duration seconds; returns per-endpoint stats"""
+    samples = {name: [] for name in names}    # (latency, status)
+    lock = threading.Lock()
+    stop = time.time() + args.duration
+
+    def client(n):
+        session = requests.Session()
+        chat_session = f"bench-{n}-{random.getrandbits(32):08x}"
+        while time.time() < stop:
+            name = random.choices(names, weights)[0]
+            method, path, body = ENDPOINTS[name]
+            headers = {"X-Session-Id": f"{chat_session}-{next(_counter)}"} if name == "chat" else {}
+            began = time.perf_counter()
+            try:
+                r = session.request(method, base + path, json=body(args) if body else None,
+                                    headers=headers, timeout=args.timeout)
+                r.content  # the whole body, including a streamed chat reply
+                status = r.status_code
+            except requests.RequestException:
+                status = "error"
+            with lock:
+                samples[name].append((time.perf_counter() - began, status))
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(args.concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for name, rows in samples.items():
+        latencies = sorted(lat * 1000 for lat, _ in rows)
+        statuses = {}
+        for _, status in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        ok = sum(n for code, n in statuses.items() if code.startswith("2"))
+        results[name] = {
+            "requests": len(rows),
+            "ok": ok,
+            "status": statuses,
+            "throughput_rps": round(len(rows) / elapsed, 2),
+            "latency_ms": {
+                "mean": round(sum(latencies) / len(latencies), 2) if latencies else None,
+                "p50": _round(percentile(latencies, 0.50)),
+                "p95": _round(percentile(latencies, 0.95)),
+                "p99": _round(percentile(latencies, 0.99)),
+                "max": _round(latencies[-1] if latencies else None),
+            },
+        }
+    return results
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint in --mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FloodSense API benchmark with local upstream stand-ins")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients per phase")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per phase")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds of mixed load before measuring")
+    parser.add_argument("--phases", default=",".join([*ENDPOINTS, "mixed"]),
+                        help="comma-separated endpoints to run, plus 'mixed'")
+    parser.add_argument("--mix", type=parse_mix,
+                        default=parse_mix("water-status=6,config=2,command=1,chat=1"),
+                        help="endpoint weights for the mixed phase")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=32, help="threads per gunicorn worker")
+    parser.add_argument("--firebase-latency", type=float, default=0.05)
+    parser.add_argument("--firebase-jitter", type=float, default=0.0)
+    parser.add_argument("--openai-latency", type=float, default=1.0, help="seconds to first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between tokens")
+    parser.add_argument("--unique-chat", action="store_true",
+                        help="make every chat question distinct (no answer cache hits)")
+    parser.add_argument("--chat-stream", action="store_true", help="request streamed (SSE) chat replies")
+    parser.add_argument("--timeout", type=float, default=60, help="client request timeout")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary directory (logs)")
+    args = parser.parse_args(argv)
+
+    phases = [p for p in args.phases.split(",") if p]
+    for phase in phases:
+        if phase != "mixed" and phase not in ENDPOINTS:
+            parser.error(f"unknown phase: {phase}")
+
+    tmp = tempfile.mkdtemp(prefix="floodsense-bench-")
+    firebase = fake_firebase.serve(free_port(), args.firebase_latency, args.firebase_jitter)
+    openai = fake_openai.serve(free_port(), args.openai_latency, args.token_delay)
+    firebase_url = f"http://127.0.0.1:{firebase.server_address[1]}"
+    openai_url = f"http://127.0.0.1:{openai.server_address[1]}/v1"
+    proc = None
+    try:
+        proc, base = start_backend(args, tmp, firebase_url, openai_url)
+        print(f"[BENCH] gunicorn -w {args.workers} ({args.threads} threads) at {base}; "
+              f"logs in {tmp}", file=sys.stderr)
+        if args.warmup:
+            warm = argparse.Namespace(**dict(vars(args), duration=args.warmup))
+            run_phase(base, list(args.mix), list(args.mix.values()), warm)
+
+        report = {
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "keep")},
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "phases": {},
+        }
+        for phase in phases:
+            print(f"[BENCH] {phase}: {args.concurrency} clients for {args.duration:g}s", file=sys.stderr)
+            if phase == "mixed":
+                names, weights = list(args.mix), list(args.mix.values())
+            else:
+                names, weights = [phase], [1]
+            report["phases"][phase] = run_phase(base, names, weights, args)
+        try:
+            report["upstream_cache"] = requests.get(f"{base}/api/cache-stats", timeout=5).json().get("cache")
+        except (requests.RequestException, ValueError):
+            pass
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        firebase.shutdown()
+        openai.shutdown()
+        if not args.keep:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+"""Shared building blocks for the FloodSense pipeline scripts and backend."""
@@ -0,0 +1,100 @@
+"""Fan-out of one shared update stream to many Server-Sent Events clients.
+
+A single poller thread per process builds a snapshot (through the shared
+upstream cache) every `interval` seconds and publishes it only when it has
+changed. Each subscriber gets a small bounded queue; a client that cannot
+keep up loses its oldest queued updates rather than growing memory, which
+is fine because every update carries the full current state.
+
+The poller runs only while there are subscribers.
+"""
+import json
+import queue
+import threading
+import time
+
+
+class Subscription:
+    """Bounded queue of (event id, payload) pairs for one client"""
+
+    def __init__(self, buffer_size):
+        self._queue = queue.Queue(maxsize=buffer_size)
+        self.dropped = 0
+
+    def put(self, item):
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout):
+        """Next update, or None if nothing arrived within timeout"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broadcaster:
+    """Poll a snapshot function and push changes to all subscribers"""
+
+    def __init__(self, snapshot, interval=2.0, buffer_size=8, log=None):
+        self.snapshot = snapshot
+        self.interval = interval
+        self.buffer_size = buffer_size
+        self.log = log
+        self.updates = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._latest = None  # (event id, payload)
+        self._thread = None
+
+    def subscribe(self):
+        sub = Subscription(self.buffer_size)
+        with self._lock:
+            self._subscribers.add(sub)
+            if self._latest is not None:
+                sub.put(self._latest)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="broadcaster", daemon=True)
+                self._thread.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def publish(self, data):
+        """Send data to every subscriber if it differs from the last update"""
+        payload = json.dumps(data, sort_keys=True, default=str)
+        with self._lock:
+            if self._latest is not None and self._latest[1] == payload:
+                return False
+            self.updates += 1
+            self._latest = (self.updates, payload)
+            for sub in self._subscribers:
+                sub.put(self._latest)
+        return True
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            started = time.monotonic()
+            try:
+                self.publish(self.snapshot())
+            except Exception as e:
+                if self.log:
+                    self.log(f"Broadcast snapshot failed: {e}")
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
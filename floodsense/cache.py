@@ -0,0 +1,202 @@
+"""TTL cache shared by every process on the host, with single-flight fetches.
+
+Entries live in a small SQLite database (WAL mode), so all gunicorn workers
+see the same cached Firebase reads. On a miss only one caller fetches from
+upstream: threads in the same process queue on a per-key lock, and processes
+coordinate through a lease row, polling for the leader's result.
+
+Hit/miss counters are kept per process and flushed to the database about
+once a second, so stats() reports totals across workers.
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from functools import wraps
+
+logger = logging.getLogger('FloodSense.cache')
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, expires REAL)",
+    "CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT, expires REAL)",
+    "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+)
+
+
+class SharedCache:
+    """SQLite-backed TTL cache with cross-process single-flight"""
+
+    def __init__(self, path=None, default_ttl=2.0, ttls=None, negative_ttl=1.0,
+                 lease_ttl=10.0, poll_interval=0.02):
+        self.path = path or os.path.join(tempfile.gettempdir(), 'floodsense-cache.sqlite')
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.negative_ttl = negative_ttl  # how long a failed (None) fetch is cached
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self._owner = f"{os.getpid()}-{id(self)}"
+        self._local = threading.local()
+        self._key_locks = {}
+        self._key_locks_guard = threading.Lock()
+        self._counts = {}
+        self._counts_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        with self._conn() as conn:
+            for stmt in _SCHEMA:
+                conn.execute(stmt)
+
+    # ----------------------------------------
+    # Public API
+    # ----------------------------------------
+    def get(self, key, fetch, ttl=None):
+        """Return the cached value for key, calling fetch() once on a miss"""
+        try:
+            found, value = self._lookup(key)
+        except sqlite3.Error as e:
+            logger.error(f"Cache unavailable, fetching '{key}' directly: {e}")
+            return fetch()
+        if found:
+            self._count('hits')
+            return value
+
+        with self._key_lock(key):
+            found, value = self._lookup(key)
+            if found:
+                self._count('coalesced')
+                return value
+
+            while not self._acquire(key):
+                # Another worker is fetching this key; wait for its result
+                time.sleep(self.poll_interval)
+                found, value = self._lookup(key)
+                if found:
+                    self._count('coalesced')
+                    return value
+
+            try:
+                value = fetch()
+                if ttl is None:
+                    ttl = self.ttls.get(key, self.ttls.get(key.split(':')[0], self.default_ttl))
+                self._store(key, value, ttl if value is not None else self.negative_ttl)
+                self._count('misses')
+                return value
+            finally:
+                self._release(key)
+
+    def cached(self, key, ttl=None):
+        """Decorator: cache a fetch function under key
+
+        Positional arguments are appended to the key ("sensor:sensor2") and
+        share the TTL configured for the bare key.
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args):
+                full_key = ':'.join([key, *map(str, args)])
+                return self.get(full_key, lambda: f(*args), ttl)
+            decorated_function.uncached = f
+            return decorated_function
+        return decorator
+
+    def invalidate(self, key):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def stats(self):
+        """Counters summed over all processes sharing the cache"""
+        self._flush_counts(force=True)
+        rows = self._db().execute("SELECT name, value FROM counters").fetchall()
+        stats = {'hits': 0, 'misses': 0, 'coalesced': 0}
+        stats.update(dict(rows))
+        lookups = stats['hits'] + stats['misses'] + stats['coalesced']
+        stats['hit_ratio'] = round((lookups - stats['misses']) / lookups, 4) if lookups else None
+        return stats
+
+    # ----------------------------------------
+    # Internals
+    # ----------------------------------------
+    def _db(self):
+        """Per-thread connection in autocommit mode"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _conn(self):
+        return _Transaction(self._db())
+
+    def _key_lock(self, key):
+        with self._key_locks_guard:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _lookup(self, key):
+        row = self._db().execute(
+            "SELECT value FROM entries WHERE key = ? AND expires > ?",
+            (key, time.time())).fetchone()
+        if row is None:
+            return False, None
+        return True, json.loads(row[0])
+
+    def _store(self, key, value, ttl):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl))
+
+    def _acquire(self, key):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND expires < ?", (key, now))
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO leases (key, owner, expires) VALUES (?, ?, ?)",
+                (key, self._owner, now + self.lease_ttl))
+            return cur.rowcount == 1
+
+    def _release(self, key):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self._owner))
+
+    def _count(self, name):
+        with self._counts_lock:
+            self._counts[name] = self._counts.get(name, 0) + 1
+        self._flush_counts()
+
+    def _flush_counts(self, force=False):
+        with self._counts_lock:
+            if not self._counts or (not force and time.monotonic() - self._last_flush < 1.0):
+                return
+            counts, self._counts = self._counts, {}
+            self._last_flush = time.monotonic()
+        try:
+            with self._conn() as conn:
+                for name, n in counts.items():
+                    conn.execute(
+                        "INSERT INTO counters (name, value) VALUES (?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                        (name, n))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not flush cache counters: {e}")
+
+
+class _Transaction:
+    """`with` block running statements in one IMMEDIATE transaction"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
@@ -0,0 +1,221 @@
+"""Columnar, memory-mapped history format.
+
+Readings are stored sorted by timestamp as raw fixed-width little-endian
+arrays, one file per column per chunk:
+
+    history_columns/
+        meta.json                 column dtypes and rows per chunk
+        000000.timestamp          int64 ms
+        000000.distance           float64
+        000000.waterLevel         float64
+        000001.timestamp ...
+
+Chunks are opened with np.memmap, so nothing is parsed. A time-range query
+is a binary search over chunk boundaries plus np.searchsorted inside the
+chunk, and the result is a zero-copy slice when it falls in one chunk.
+
+Only in-order rows are accepted (late rows stay in the CSV store's late
+segment). Writers append under a file lock so the column files of a chunk
+never get out of step. A HistoryStore given `columnar=` mirrors every row of
+its main log here; rows already present are skipped. The ingestion daemon
+is the one writer; readers such as the web workers open the store with
+read_only=True.
+
+Convert an existing CSV history once with:
+
+    python -m floodsense.columnar history.csv history_columns
+"""
+import argparse
+import bisect
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from floodsense.filelock import FileLock
+
+DTYPES = {"timestamp": "<i8", "distance": "<f8", "waterLevel": "<f8"}
+CHUNK_ROWS = 262_144  # ~15 days of 5-second readings
+
+
+class ColumnarHistory:
+    """Append-only sorted column store read through np.memmap"""
+
+    def __init__(self, path, dtypes=None, chunk_rows=CHUNK_ROWS, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._maps = {}  # (chunk, column) -> (rows, memmap)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        else:
+            meta = {"columns": dict(dtypes or DTYPES), "chunk_rows": chunk_rows}
+            if not read_only:  # a reader just sees a store nothing was written to as empty
+                os.makedirs(path, exist_ok=True)
+                with open(meta_path, "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+        self.dtypes = {c: np.dtype(d) for c, d in meta["columns"].items()}
+        self.columns = list(self.dtypes)
+        self.chunk_rows = meta["chunk_rows"]
+        self._lock_path = os.path.join(path, ".lock")
+
+    # ----------------------------------------
+    # Writing
+    # ----------------------------------------
+    def append(self, record):
+        """Append one reading; returns False if it is older than the last row"""
+        row = {}
+        for c in self.columns:
+            value = record.get(c)
+            row[c] = np.array([np.nan if value is None else value]).astype(self.dtypes[c])
+        return self.append_many(row) == 1
+
+    def append_many(self, cols):
+        """Append sorted column arrays; rows not newer than the last stored row are skipped"""
+        if self.read_only:
+            raise ValueError(f"{self.path} is opened read-only")
+        ts = np.asarray(cols["timestamp"], dtype=self.dtypes["timestamp"])
+        with self._lock, FileLock(self._lock_path):
+            last = self.last_timestamp()
+            start = 0 if last is None else int(np.searchsorted(ts, last, "right"))
+            if start >= len(ts):
+                return 0
+            written = 0
+            chunk, rows = self._active_chunk()
+            while start + written < len(ts):
+                if rows >= self.chunk_rows:
+                    chunk, rows = chunk + 1, 0
+                take = min(self.chunk_rows - rows, len(ts) - start - written)
+                lo = start + written
+                for c in self.columns:
+                    data = np.asarray(cols[c][lo:lo + take]).astype(self.dtypes[c])
+                    with open(self._file(chunk, c), "ab") as f:
+                        f.write(data.tobytes())
+                rows += take
+                written += take
+            return written
+
+    def extend(self, cols):
+        """HistoryStore listener: mirror a sorted batch of main-log rows"""
+        if cols is None or len(cols["timestamp"]) == 0:
+            return
+        n = len(cols["timestamp"])
+        self.append_many({c: cols[c] if c in cols else np.full(n, np.nan) for c in self.columns})
+
+    # ----------------------------------------
+    # Reading
+    # ----------------------------------------
+    def query(self, start=None, end=None, columns=None):
+        """Return {column: ndarray} for start <= timestamp <= end (ms)"""
+        columns = columns or self.columns
+        chunks = self._chunks()
+        if not chunks:
+            return {c: np.empty(0, dtype=self.dtypes[c]) for c in columns}
+
+        # Chunks are sorted and non-overlapping: find the first/last that can match
+        firsts = [self._column(k, "timestamp")[0] for k in chunks]
+        lo_chunk = 0 if start is None else max(bisect.bisect_right(firsts, start) - 1, 0)
+        hi_chunk = len(chunks) - 1 if end is None else max(bisect.bisect_right(firsts, end) - 1, 0)
+
+        parts = {c: [] for c in columns}
+        for k in chunks[lo_chunk:hi_chunk + 1]:
+            ts = self._column(k, "timestamp")
+            lo = 0 if start is None else int(np.searchsorted(ts, start, "left"))
+            hi = len(ts) if end is None else int(np.searchsorted(ts, end, "right"))
+            if lo >= hi:
+                continue
+            for c in columns:
+                parts[c].append(self._column(k, c)[lo:hi])
+
+        out = {}
+        for c in columns:
+            if not parts[c]:
+                out[c] = np.empty(0, dtype=self.dtypes[c])
+            elif len(parts[c]) == 1:
+                out[c] = parts[c][0]  # zero-copy memmap slice
+            else:
+                out[c] = np.concatenate(parts[c])
+        return out
+
+    def last_timestamp(self):
+        chunks = self._chunks()
+        if not chunks:
+            return None
+        ts = self._column(chunks[-1], "timestamp")
+        return int(ts[-1]) if len(ts) else None
+
+    def __len__(self):
+        return sum(self._rows(k) for k in self._chunks())
+
+    # ----------------------------------------
+    # Internals
+    # ----------------------------------------
+    def _file(self, chunk, column):
+        return os.path.join(self.path, f"{chunk:06d}.{column}")
+
+    def _chunks(self):
+        chunks = []
+        while self._rows(len(chunks)) > 0:
+            chunks.append(len(chunks))
+        return chunks
+
+    def _active_chunk(self):
+        chunks = self._chunks()
+        if not chunks:
+            return 0, 0
+        return chunks[-1], self._rows(chunks[-1])
+
+    def _rows(self, chunk):
+        """Rows fully written to every column file of a chunk"""
+        rows = None
+        for c in self.columns:
+            try:
+                n = os.path.getsize(self._file(chunk, c)) // self.dtypes[c].itemsize
+            except FileNotFoundError:
+                return 0
+            rows = n if rows is None else min(rows, n)
+        return rows or 0
+
+    def _column(self, chunk, column):
+        rows = self._rows(chunk)
+        cached = self._maps.get((chunk, column))
+        if cached is None or cached[0] != rows:
+            # Full chunks never change, so their maps are reused across queries
+            data = np.memmap(self._file(chunk, column), dtype=self.dtypes[column], mode="r", shape=(rows,))
+            cached = (rows, data)
+            self._maps[(chunk, column)] = cached
+        return cached[1]
+
+
+def convert(csv_path, out_path, chunk_rows=CHUNK_ROWS):
+    """One-shot conversion of a CSV history's main log to columnar form
+
+    Late rows stay in the CSV store's late segment, where readers merge them
+    in, exactly as for rows mirrored by a HistoryStore.
+    """
+    from floodsense.history import HistoryStore
+
+    arrays = HistoryStore(csv_path, dedup=False).read_arrays(late=False)
+    tmp = out_path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    store = ColumnarHistory(tmp, chunk_rows=chunk_rows)
+    cols = {c: arrays[c] if c in arrays else np.full(len(arrays["timestamp"]), np.nan)
+            for c in store.columns}
+    written = store.append_many(cols)
+    shutil.rmtree(out_path, ignore_errors=True)
+    os.replace(tmp, out_path)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert history.csv to the columnar format")
+    parser.add_argument("csv", nargs="?", default="history.csv")
+    parser.add_argument("out", nargs="?", default="history_columns")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+    n = convert(args.csv, args.out, args.chunk_rows)
+    print(f"[COLUMNAR] Wrote {n} rows from {args.csv} to {args.out}")
@@ -0,0 +1,133 @@
+"""Chat conversation history shared by every gunicorn worker.
+
+Each session's recent turns live in one row of a small SQLite database (WAL
+mode), so a user's context is the same whichever worker serves the next
+message, and a turn costs one primary-key read and one write no matter how
+many sessions exist.
+
+The store is bounded: a session keeps at most `max_messages` messages of at
+most `max_chars` characters each, sessions idle for longer than `ttl`
+seconds expire, and beyond `max_sessions` the least recently used sessions
+are evicted. Expiry and eviction run as one sweep at most every
+`sweep_interval` seconds per process, using the index on the last-used time.
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from floodsense.cache import _Transaction
+
+logger = logging.getLogger('FloodSense.conversations')
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, messages TEXT NOT NULL, "
+    "updated REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)",
+    "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+)
+
+
+class ConversationStore:
+    """Per-session message history with TTL and LRU eviction"""
+
+    def __init__(self, path=None, max_messages=20, max_sessions=5000, ttl=3600.0,
+                 max_chars=2000, sweep_interval=1.0):
+        self.path = path or os.path.join(tempfile.gettempdir(), 'floodsense-conversations.sqlite')
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_chars = max_chars
+        self.sweep_interval = sweep_interval
+        self._local = threading.local()
+        self._sweep_lock = threading.Lock()
+        self._last_sweep = 0.0
+        with self._conn() as conn:
+            for stmt in _SCHEMA:
+                conn.execute(stmt)
+
+    # ----------------------------------------
+    # Public API
+    # ----------------------------------------
+    def get(self, session_id):
+        """The session's messages, oldest first ([] if unknown or expired)"""
+        try:
+            row = self._db().execute(
+                "SELECT messages FROM sessions WHERE id = ? AND updated > ?",
+                (session_id, time.time() - self.ttl)).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Conversation store unavailable, starting without history: {e}")
+            return []
+        return json.loads(row[0]) if row else []
+
+    def append(self, session_id, *messages):
+        """Add messages to the session, keeping only the newest max_messages"""
+        now = time.time()
+        new = [dict(m, content=m['content'][:self.max_chars]) for m in messages]
+        try:
+            with self._conn() as conn:
+                row = conn.execute(
+                    "SELECT messages FROM sessions WHERE id = ? AND updated > ?",
+                    (session_id, now - self.ttl)).fetchone()
+                history = (json.loads(row[0]) if row else []) + new
+                conn.execute(
+                    "INSERT OR REPLACE INTO sessions (id, messages, updated) VALUES (?, ?, ?)",
+                    (session_id, json.dumps(history[-self.max_messages:], ensure_ascii=False), now))
+        except sqlite3.Error as e:
+            logger.error(f"Could not store conversation turn for {session_id}: {e}")
+            return
+        self._sweep()
+
+    def clear(self, session_id):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def stats(self):
+        """Live sessions and evictions so far (summed over all processes)"""
+        self._sweep(force=True)
+        db = self._db()
+        stats = {'sessions': db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0],
+                 'expired': 0, 'evicted': 0}
+        stats.update(dict(db.execute("SELECT name, value FROM counters").fetchall()))
+        return stats
+
+    # ----------------------------------------
+    # Internals
+    # ----------------------------------------
+    def _db(self):
+        """Per-thread connection in autocommit mode"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _conn(self):
+        return _Transaction(self._db())
+
+    def _sweep(self, force=False):
+        """Drop expired sessions, then the least recently used beyond max_sessions"""
+        with self._sweep_lock:
+            if not force and time.monotonic() - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = time.monotonic()
+        try:
+            with self._conn() as conn:
+                expired = conn.execute("DELETE FROM sessions WHERE updated <= ?",
+                                       (time.time() - self.ttl,)).rowcount
+                evicted = conn.execute(
+                    "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions "
+                    "ORDER BY updated DESC LIMIT -1 OFFSET ?)", (self.max_sessions,)).rowcount
+                for name, n in (('expired', expired), ('evicted', evicted)):
+                    if n > 0:
+                        conn.execute(
+                            "INSERT INTO counters (name, value) VALUES (?, ?) "
+                            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                            (name, n))
+        except sqlite3.Error as e:
+            logger.warning(f"Conversation sweep failed: {e}")
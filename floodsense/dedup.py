@@ -0,0 +1,104 @@
+"""Index of recently ingested (sensor, timestamp) keys.
+
+Firebase keeps returning the last reading until the Arduino pushes a new
+one, so polling sees the same record over and over. The index remembers the
+most recent `capacity` keys in insertion order and drops repeats in O(1).
+
+Keys are also appended to a small log file so the index survives restarts
+and so other processes writing the same history pick up each other's keys.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+
+class DedupIndex:
+    """Bounded LRU-by-insertion set of (sensor, timestamp) keys backed by a log file"""
+
+    def __init__(self, path, capacity=50_000):
+        self.path = path
+        self.capacity = capacity
+        self.dropped = 0
+        self._keys = OrderedDict()
+        self._offset = 0
+        self._file_id = None
+        self._lock = threading.Lock()
+
+    def add(self, sensor, timestamp):
+        """Record a key; returns False (and counts a drop) if it was already seen"""
+        key = (str(sensor), int(timestamp))
+        with self._lock:
+            self._refresh()
+            if key in self._keys:
+                self.dropped += 1
+                return False
+            self._remember(key)
+            # Our own line is read back by the next _refresh(), which keeps
+            # the byte offset right even if another process appended too
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(f"{key[0]},{key[1]}\n")
+            if self._offset > 64 * self.capacity:
+                self._rewrite()
+        return True
+
+    def seed(self, sensor, timestamps):
+        """Populate an empty index from existing history (e.g. on first run)"""
+        with self._lock:
+            self._refresh()
+            if self._keys:
+                return
+            keys = [(str(sensor), int(ts)) for ts in timestamps[-self.capacity:]]
+            for key in keys:
+                self._remember(key)
+            self._rewrite()
+
+    def __contains__(self, key):
+        sensor, timestamp = key
+        with self._lock:
+            self._refresh()
+            return (str(sensor), int(timestamp)) in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _remember(self, key):
+        self._keys[key] = None
+        if len(self._keys) > self.capacity:
+            self._keys.popitem(last=False)
+
+    def _refresh(self):
+        """Load keys appended to the log (by us or another process) since last call"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        file_id = (st.st_dev, st.st_ino)
+        if file_id != self._file_id or st.st_size < self._offset:
+            # Log was rewritten by another process: reload from the start
+            self._keys.clear()
+            self._offset = 0
+            self._file_id = file_id
+        if st.st_size == self._offset:
+            return
+
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            chunk = f.read(st.st_size - self._offset)
+        end = chunk.rfind(b"\n") + 1
+        self._offset += end
+        for line in chunk[:end].decode("utf-8").splitlines():
+            sensor, _, ts = line.rpartition(",")
+            try:
+                self._remember((sensor, int(ts)))
+            except ValueError:
+                continue
+
+    def _rewrite(self):
+        """Trim the log to the keys still held in memory"""
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(f"{s},{ts}\n" for s, ts in self._keys)
+        os.replace(tmp, self.path)
+        st = os.stat(self.path)
+        self._file_id = (st.st_dev, st.st_ino)
+        self._offset = st.st_size
@@ -0,0 +1,99 @@
+"""Downsampling of sorted time series to a point budget for charts.
+
+Two modes:
+
+- minmax: split the time range into equal-width buckets and keep the
+  lowest and highest reading of each, in time order. Peaks are always kept,
+  and gaps in the data stay gaps.
+- lttb: Largest-Triangle-Three-Buckets, which keeps the visual shape of the
+  line. Long inputs are first reduced with a vectorized min/max pass over
+  a few candidates per bucket (MinMaxLTTB), so the sequential LTTB step
+  only ever looks at O(points) candidates whatever the input length.
+
+Both take x (int64 ms) and y (float64) arrays sorted by x and return index
+arrays into them, so any other column can be sliced the same way.
+"""
+import numpy as np
+
+MODES = ("lttb", "minmax")
+PRESELECT = 4  # min/max candidates per LTTB bucket (2 sub-buckets)
+
+
+def downsample(x, y, points, mode="lttb"):
+    """Indices of at most `points` readings to plot; NaN readings are skipped"""
+    if mode not in MODES:
+        raise ValueError(f"invalid mode: {mode} (expected one of {', '.join(MODES)})")
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) <= points or points < 3:
+        return valid if len(valid) <= points else valid[:points]
+    x, y = x[valid], y[valid]
+    if mode == "minmax":
+        return valid[minmax(x, y, points)]
+    return valid[lttb(x, y, points)]
+
+
+def minmax(x, y, points):
+    """Min and max of each of points // 2 equal-width time buckets"""
+    buckets = max(points // 2, 1)
+    span = int(x[-1]) - int(x[0]) + 1
+    ids = ((x - x[0]).astype(np.int64) * buckets) // span
+    return _bucket_extremes(y, np.flatnonzero(np.diff(ids, prepend=-1)))
+
+
+def lttb(x, y, points):
+    """Largest-Triangle-Three-Buckets over equal-count buckets"""
+    n = len(x)
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)  # inner buckets [edges[i], edges[i+1])
+
+    # Vectorized preselection: keep the min and max of two halves of each bucket
+    if n > PRESELECT * points:
+        halves = np.unique(np.concatenate([edges[:-1], (edges[:-1] + edges[1:]) // 2]))
+        keep = _bucket_extremes(y[:n - 1], halves)
+        bucket_of = np.searchsorted(edges, keep, "right") - 1
+    else:
+        keep = np.arange(1, n - 1)
+        bucket_of = np.searchsorted(edges, keep, "right") - 1
+
+    xs, ys = x.astype(np.float64), y
+    splits = np.searchsorted(bucket_of, np.arange(points - 1))
+    cand = np.split(keep, splits[1:])
+
+    # Average of each bucket is the fixed third vertex for the one before it
+    sums = np.add.reduceat(ys[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    avg_y = np.append(sums / counts, ys[-1])
+    avg_x = np.append(np.add.reduceat(xs[1:n - 1], edges[:-1] - 1) / counts, xs[-1])
+
+    # Sequential step over a handful of candidates per bucket: plain floats
+    # are faster than tiny numpy arrays here
+    cand_x, cand_y = [xs[c].tolist() for c in cand], [ys[c].tolist() for c in cand]
+    avg_x, avg_y = avg_x.tolist(), avg_y.tolist()
+    out = [0]
+    ax, ay = xs[0], ys[0]
+    for i in range(points - 2):
+        if len(cand[i]) == 0:
+            continue
+        cx, cy = avg_x[i + 1], avg_y[i + 1]
+        best, best_area = 0, -1.0
+        for j, (bx, by) in enumerate(zip(cand_x[i], cand_y[i])):
+            area = abs((ax - cx) * (by - ay) - (ax - bx) * (cy - ay))
+            if area > best_area:
+                best, best_area = j, area
+        out.append(int(cand[i][best]))
+        ax, ay = cand_x[i][best], cand_y[i][best]
+    out.append(n - 1)
+    return np.array(out, dtype=np.int64)
+
+
+def _bucket_extremes(y, starts):
+    """Indices of the min and max of y within each bucket [starts[i], starts[i+1])"""
+    base = starts[0]
+    y, rel = y[base:], starts - base
+    lo = np.minimum.reduceat(y, rel)
+    hi = np.maximum.reduceat(y, rel)
+    # Position of the extreme within its bucket: first index where y hits it
+    bucket = np.repeat(np.arange(len(rel)), np.diff(np.append(rel, len(y))))
+    idx = np.arange(len(y))
+    first_lo = np.minimum.reduceat(np.where(y == lo[bucket], idx, len(y)), rel)
+    first_hi = np.minimum.reduceat(np.where(y == hi[bucket], idx, len(y)), rel)
+    return np.unique(np.concatenate([first_lo, first_hi])) + base
@@ -0,0 +1,46 @@
+"""Advisory inter-process file lock (fcntl on POSIX, msvcrt on Windows)."""
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Exclusive lock held on `path` for the duration of a `with` block
+
+    With blocking=False, entering raises BlockingIOError if another process
+    already holds the lock instead of waiting for it.
+    """
+
+    def __init__(self, path, blocking=True):
+        self.path = path
+        self.blocking = blocking
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX if self.blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(self._fd, msvcrt.LK_LOCK if self.blocking else msvcrt.LK_NBLCK, 1)
+        except OSError as e:
+            os.close(self._fd)
+            self._fd = None
+            raise BlockingIOError(f"{self.path} is locked by another process") from e
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+        return False
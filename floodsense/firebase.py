@@ -0,0 +1,125 @@
+"""Pooled HTTP client for the Firebase Realtime Database REST API.
+
+One requests.Session per process keeps TCP/TLS connections alive between
+calls instead of handshaking every 5 seconds. Idempotent requests (GET,
+HEAD, PUT, DELETE, and PATCH, which in Firebase sets the given children)
+are retried with exponential backoff on connection errors and 5xx/429
+responses; POST is never retried because it creates a new child each time.
+A response still failing after the last retry is returned as is, so
+callers check its status.
+
+Every call is timed per "METHOD /path" so slow upstreams show up in stats()
+and in the floodsense_upstream_seconds histogram (see floodsense.metrics).
+"""
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from floodsense.metrics import get_metrics
+
+logger = logging.getLogger('FloodSense.firebase')
+
+
+class FirebaseClient:
+    """Keep-alive session with retries and per-endpoint latency timing"""
+
+    def __init__(self, pool_connections=None, pool_maxsize=None, retries=None,
+                 backoff=None, timeout=5):
+        pool_connections = pool_connections or int(os.getenv("FIREBASE_POOL_CONNECTIONS", 4))
+        pool_maxsize = pool_maxsize or int(os.getenv("FIREBASE_POOL_SIZE", 16))
+        retries = int(os.getenv("FIREBASE_RETRIES", 2)) if retries is None else retries
+        backoff = float(os.getenv("FIREBASE_BACKOFF", 0.2)) if backoff is None else backoff
+        self.timeout = timeout
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET", "PUT", "PATCH", "DELETE", "HEAD"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._timings = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        name = f"{method} {urlsplit(url).path}"
+        start = time.perf_counter()
+        error = False
+        try:
+            return self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            error = True
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._record(name, elapsed_ms, error)
+            logger.debug(f"{name} took {elapsed_ms:.1f}ms")
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def _record(self, name, elapsed_ms, error):
+        metrics = get_metrics()
+        metrics.observe("floodsense_upstream_seconds", elapsed_ms / 1000, upstream="firebase", endpoint=name)
+        if error:
+            metrics.inc("floodsense_upstream_errors_total", upstream="firebase", endpoint=name)
+        with self._lock:
+            t = self._timings.get(name)
+            if t is None:
+                t = self._timings[name] = {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+            t["count"] += 1
+            t["errors"] += int(error)
+            t["total_ms"] += elapsed_ms
+            t["max_ms"] = max(t["max_ms"], elapsed_ms)
+            t["last_ms"] = elapsed_ms
+
+    def stats(self):
+        """Per-endpoint call counts and latency (ms) since start"""
+        with self._lock:
+            out = {}
+            for name, t in self._timings.items():
+                out[name] = dict(t, avg_ms=t["total_ms"] / t["count"])
+            return out
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return this process's shared client (a fresh one after fork)"""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = FirebaseClient()
+            _client_pid = os.getpid()
+        return _client
@@ -0,0 +1,390 @@
+"""Append-only history store for sensor readings.
+
+history.csv is kept as an append-only log sorted by timestamp, so a reading
+that arrives in order costs one line write. Late readings (older than the
+last logged timestamp) go to a pending log and are merged into a sorted late
+segment by compact(), normally from the background compactor thread.
+
+The Arduino stamps readings with millis(), which restarts from zero when it
+reboots. A reading more than RESET_JUMP_MS older than the last logged one is
+therefore taken as a clock reset, not late data: the store starts a new
+epoch, offsetting this and later timestamps so they continue the log after
+the wall-clock gap since its last row. The offset is kept in history.csv.epoch.
+
+Every appended (sensor, timestamp) key goes through a DedupIndex first, so
+the same Firebase reading polled again is dropped before it reaches disk.
+
+Readers keep the parsed columns in memory and only parse the bytes appended
+since their last read, so a time-range query is a binary search plus a slice.
+Passing a ColumnarHistory as `columnar` also mirrors the main log into the
+memory-mapped columnar format (see floodsense.columnar).
+"""
+import io
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from floodsense.dedup import DedupIndex
+
+COLUMNS = ("distance", "timestamp", "waterLevel")
+MAX_FUTURE_MS = 3600_000  # reject timestamps more than 1h in the future
+RESET_JUMP_MS = 3600_000  # a reading this much older than the log is a clock reset
+
+# append() results
+APPENDED = "appended"
+DUPLICATE = "duplicate"
+INVALID = "invalid"
+
+
+def _to_ms(value):
+    """Convert a raw timestamp to int milliseconds, or None if invalid"""
+    try:
+        ms = float(value)
+    except (TypeError, ValueError):
+        return None
+    if ms != ms:  # NaN
+        return None
+    return int(ms)
+
+
+def _to_float(text):
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+def _format(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value != value:
+        return ""
+    return str(value)
+
+
+class HistoryStore:
+    """Sorted append-only CSV log plus a small sorted segment of late rows"""
+
+    def __init__(self, path, columns=COLUMNS, sensor="sensor1", dedup=True, columnar=None):
+        self.path = path
+        self.pending_path = path + ".pending"
+        self.late_path = path + ".late"
+        self.epoch_path = path + ".epoch"
+        self.sensor = sensor
+        self.seen = DedupIndex(path + ".seen") if dedup else None
+        self.counts = {APPENDED: 0, DUPLICATE: 0, INVALID: 0}
+        self._default_columns = list(columns)
+        self._lock = threading.RLock()
+        self._compactor = None
+        self._late_cache = {}
+        self._listeners = []
+        self.epoch_offset = self._read_epoch()
+        self._reset()
+        self.columnar = columnar
+        if columnar is not None:
+            self.add_listener(columnar.extend)
+
+    # ----------------------------------------
+    # Writing
+    # ----------------------------------------
+    def append(self, record):
+        """Append one reading; returns APPENDED, DUPLICATE or INVALID"""
+        raw = _to_ms(record.get("timestamp"))
+        if raw is None or raw <= 0:
+            self.counts[INVALID] += 1
+            return INVALID
+
+        with self._lock:
+            self._refresh()
+            ts = raw + self.epoch_offset
+            if self._n and ts < self._buf["timestamp"][self._n - 1] - RESET_JUMP_MS:
+                self._new_epoch(raw)
+                ts = raw + self.epoch_offset
+            now_ms = int(datetime.now().timestamp() * 1000)
+            if ts >= now_ms + MAX_FUTURE_MS:
+                self.counts[INVALID] += 1
+                return INVALID
+            if self.seen is not None:
+                if not os.path.exists(self.seen.path):
+                    self.seen.seed(self.sensor, self.read_arrays()["timestamp"])
+                if not self.seen.add(record.get("sensor", self.sensor), ts):
+                    self.counts[DUPLICATE] += 1
+                    return DUPLICATE
+            target = self.path
+            if self._n and ts < self._buf["timestamp"][self._n - 1]:
+                target = self.pending_path
+            row = dict(record, timestamp=ts)
+            line = ",".join(_format(row.get(c)) for c in self._columns) + "\n"
+            self._write(target, line)
+            self.counts[APPENDED] += 1
+        return APPENDED
+
+    def _new_epoch(self, raw):
+        """Offset timestamps after a sensor clock reset so that `raw` lands
+        after the last logged row, by the wall-clock time since it was written"""
+        last = int(self._buf["timestamp"][self._n - 1])
+        gap_ms = int((time.time() - os.path.getmtime(self.path)) * 1000)
+        self.epoch_offset = last + max(gap_ms, 1) - raw
+        tmp = f"{self.epoch_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"offset": self.epoch_offset}, f)
+        os.replace(tmp, self.epoch_path)
+        print(f"[HISTORY] {self.sensor}: timestamp went back from {last} to {raw}; "
+              f"treating it as a clock reset (offset {self.epoch_offset} ms)")
+
+    def _read_epoch(self):
+        try:
+            with open(self.epoch_path, "r", encoding="utf-8") as f:
+                return int(json.load(f)["offset"])
+        except FileNotFoundError:
+            return 0
+
+    def _write(self, path, line):
+        with open(path, "a", encoding="utf-8", newline="") as f:
+            if f.tell() == 0:
+                line = ",".join(self._columns) + "\n" + line
+            f.write(line)
+
+    def compact(self):
+        """Merge pending late rows into the sorted late segment"""
+        with self._lock:
+            work = f"{self.pending_path}.{os.getpid()}"
+            try:
+                os.replace(self.pending_path, work)
+            except FileNotFoundError:
+                return 0
+
+            pending = self._read_csv(work)
+            late = self._read_csv(self.late_path)
+            merged = pd.concat([late, pending], ignore_index=True)
+            merged.sort_values("timestamp", kind="stable", inplace=True)
+
+            tmp = self.late_path + ".tmp"
+            merged.to_csv(tmp, index=False, columns=self._columns)
+            os.replace(tmp, self.late_path)
+            os.remove(work)
+            return len(pending)
+
+    def start_compactor(self, interval=60):
+        """Run compact() every `interval` seconds on a daemon thread"""
+        if self._compactor is not None:
+            return self._compactor
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    merged = self.compact()
+                    if merged:
+                        print(f"[HISTORY] Merged {merged} late rows into {self.late_path}")
+                except Exception as e:
+                    print(f"[HISTORY] Compaction error: {e}")
+
+        self._compactor = threading.Thread(target=loop, name="history-compactor", daemon=True)
+        self._compactor.start()
+        return self._compactor
+
+    # ----------------------------------------
+    # Reading
+    # ----------------------------------------
+    def read_arrays(self, start=None, end=None, late=True):
+        """Return {column: ndarray} for start <= timestamp <= end (ms)
+
+        When no late rows fall in the range (or late=False, which reads the
+        main log only) the arrays are read-only views of the in-memory
+        columns, so no data is copied.
+        """
+        with self._lock:
+            self._refresh()
+            ts = self._buf["timestamp"][:self._n]
+            lo = 0 if start is None else int(np.searchsorted(ts, start, "left"))
+            hi = self._n if end is None else int(np.searchsorted(ts, end, "right"))
+            out = {}
+            for c in self._columns:
+                view = self._buf[c][lo:hi]
+                view.flags.writeable = False
+                out[c] = view
+            if not late:
+                return out
+            late = self._late_rows(start, end)
+
+        if late.empty:
+            return out
+        merged = {c: np.concatenate([out[c], late[c].to_numpy(out[c].dtype)]) for c in self._columns}
+        order = np.argsort(merged["timestamp"], kind="stable")
+        return {c: merged[c][order] for c in self._columns}
+
+    def read(self, start=None, end=None):
+        """Return readings in [start, end] (ms) as a DataFrame sorted by timestamp"""
+        arrays = self.read_arrays(start, end)
+        return pd.DataFrame(arrays, columns=self._columns)
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return self._n + len(self._late_rows(None, None))
+
+    def refresh(self):
+        """Pick up rows appended by other processes (and notify listeners)"""
+        with self._lock:
+            self._refresh()
+
+    def late_rows(self):
+        """Rows held outside the main log (late segment + pending) as a DataFrame"""
+        with self._lock:
+            return self._late_rows(None, None)
+
+    def add_listener(self, fn):
+        """Call fn(columns) with every batch of new main-log rows, sorted by
+        timestamp, and fn(None) whenever the log is reloaded from scratch.
+        Rows already loaded are replayed to fn immediately.
+        """
+        with self._lock:
+            self._listeners.append(fn)
+            if self._n:
+                fn({c: self._buf[c][:self._n] for c in self._columns})
+
+    # ----------------------------------------
+    # Internals
+    # ----------------------------------------
+    def _reset(self):
+        self._columns = list(self._default_columns)
+        self._buf = self._alloc(self._columns, 1024)
+        self._n = 0
+        self._offset = 0
+        self._file_id = None
+        for fn in self._listeners:
+            fn(None)
+
+    @staticmethod
+    def _alloc(columns, capacity):
+        return {c: np.empty(capacity, dtype=np.int64 if c == "timestamp" else np.float64)
+                for c in columns}
+
+    def _refresh(self):
+        """Parse whatever was appended to the main log since the last call"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset()
+            return
+
+        file_id = (st.st_dev, st.st_ino)
+        if file_id != self._file_id or st.st_size < self._offset:
+            self._reset()
+            self._file_id = file_id
+        if st.st_size == self._offset:
+            return
+
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            chunk = f.read(st.st_size - self._offset)
+
+        if self._offset == 0:
+            header, sep, chunk = chunk.partition(b"\n")
+            if not sep:
+                return
+            columns = header.decode("utf-8").strip().split(",")
+            if "timestamp" not in columns:
+                raise ValueError(f"{self.path} has no timestamp column")
+            self._columns = columns
+            self._buf = self._alloc(columns, 1024)
+            self._offset = len(header) + 1
+
+        # Only consume complete lines; a concurrent writer may be mid-line
+        end = chunk.rfind(b"\n") + 1
+        if end == 0:
+            return
+        self._offset += end
+        self._extend(self._parse(chunk[:end]))
+
+    def _parse(self, data):
+        if len(data) > 65536:
+            df = pd.read_csv(io.BytesIO(data), names=self._columns, header=None)
+            df = self._coerce(df)
+            return {c: df[c].to_numpy() for c in self._columns}
+
+        # A few new lines per tick: skip the pandas parser overhead
+        rows = [line.split(",") for line in data.decode("utf-8").splitlines() if line]
+        cols = {c: np.array([_to_float(r[i]) if i < len(r) else np.nan for r in rows])
+                for i, c in enumerate(self._columns)}
+        keep = ~np.isnan(cols["timestamp"])
+        cols = {c: v[keep] for c, v in cols.items()}
+        cols["timestamp"] = cols["timestamp"].astype(np.int64)
+        return cols
+
+    def _coerce(self, df):
+        for c in self._columns:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+        df = df.dropna(subset=["timestamp"])
+        df["timestamp"] = df["timestamp"].astype(np.int64)
+        return df
+
+    def _extend(self, cols):
+        n, m = self._n, len(cols["timestamp"])
+        if m == 0:
+            return
+        if n + m > len(self._buf["timestamp"]):
+            capacity = max(2 * len(self._buf["timestamp"]), n + m)
+            grown = self._alloc(self._columns, capacity)
+            for c in self._columns:
+                grown[c][:n] = self._buf[c][:n]
+            self._buf = grown
+        for c in self._columns:
+            self._buf[c][n:n + m] = cols[c]
+        self._n = n + m
+
+        if self._listeners:
+            order = np.argsort(cols["timestamp"], kind="stable")
+            batch = {c: cols[c][order] for c in self._columns}
+            for fn in self._listeners:
+                fn(batch)
+
+        ts = self._buf["timestamp"][max(n - 1, 0):self._n]
+        if np.any(ts[1:] < ts[:-1]):
+            # Legacy files written by hand may be unsorted; fix up in memory once.
+            # New arrays are allocated so views handed out earlier stay valid.
+            order = np.argsort(self._buf["timestamp"][:self._n], kind="stable")
+            fixed = self._alloc(self._columns, len(self._buf["timestamp"]))
+            for c in self._columns:
+                fixed[c][:self._n] = self._buf[c][:self._n][order]
+            self._buf = fixed
+
+    def _read_csv(self, path):
+        try:
+            df = pd.read_csv(path)
+        except (FileNotFoundError, pd.errors.EmptyDataError):
+            df = pd.DataFrame(columns=self._columns)
+        return self._coerce(df.reindex(columns=self._columns))
+
+    def _cached_csv(self, path):
+        """Re-read a small side file only when its size or mtime changes"""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._late_cache.pop(path, None)
+            return None
+        key = (st.st_size, st.st_mtime_ns)
+        cached = self._late_cache.get(path)
+        if cached is None or cached[0] != key:
+            cached = (key, self._read_csv(path))
+            self._late_cache[path] = cached
+        return cached[1]
+
+    def _late_rows(self, start, end):
+        frames = [df for df in (self._cached_csv(self.late_path), self._cached_csv(self.pending_path))
+                  if df is not None and not df.empty]
+        if not frames:
+            return self._coerce(pd.DataFrame(columns=self._columns))
+        late = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        mask = np.ones(len(late), dtype=bool)
+        if start is not None:
+            mask &= late["timestamp"].to_numpy() >= start
+        if end is not None:
+            mask &= late["timestamp"].to_numpy() <= end
+        return late[mask]
@@ -0,0 +1,266 @@
+"""Ingestion daemon: the single writer of every sensor's history.
+
+One supervised process fetches (or streams) readings from Firebase and
+appends them to each sensor's history log. It holds an exclusive lock file
+for as long as it runs, so a second daemon refuses to start instead of
+racing the first one's appends. The log itself is the feed: it is only ever
+appended to in whole lines (late rows go through an atomically replaced
+side file), so readers never see a half-written row.
+
+Forecast stages and the backend are consumers. HistoryFollower tails the
+logs through HistoryStore.refresh() and returns the newly appended rows in
+rounds, without any Firebase traffic of its own.
+
+Polling runs on floodsense.scheduler: each group of sensors sharing a poll
+period ("interval_sec" per sensor in the registry) has its own fixed-rate
+clock, and appends run as a separate stage.
+
+Run it with
+
+    python main.py [--config ingest.json] [--stream] [--once]
+
+Settings come from a JSON config file (INGEST_CONFIG, default ingest.json;
+see ingest.example.json), any of which can be overridden on the command
+line.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from functools import partial
+
+import numpy as np
+
+from floodsense.columnar import ColumnarHistory
+from floodsense.filelock import FileLock
+from floodsense.firebase import get_client
+from floodsense.history import DUPLICATE, INVALID
+from floodsense.metrics import get_metrics, serve as serve_metrics
+from floodsense.scheduler import PipelineRunner
+from floodsense.sensors import load_registry, fetch_readings, stream_source
+from floodsense.stream import FirebaseStream
+
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+DEFAULTS = {
+    "sensors_file": None,          # registry (None: SENSORS_FILE / sensors.json)
+    "mode": "poll",                # "poll" or "stream"
+    "interval_sec": 5,             # poll period (per sensor: "interval_sec" in sensors.json)
+    "log_file": "fetch_log.txt",
+    "lock_file": "ingest.lock",    # held while the daemon runs
+    "columnar": True,              # mirror each history into history_columns/
+    "compact_interval_sec": 60,    # late-row compaction period
+    "restart_delay_sec": 5,        # wait before restarting a crashed loop
+    "stats_interval_sec": 60,      # how often fetch/append latencies are logged
+    "metrics_port": 9101,          # Prometheus /metrics (0 = off)
+}
+
+
+def load_config(path=None):
+    """DEFAULTS overlaid with the JSON config file, if there is one"""
+    config = dict(DEFAULTS)
+    path = path or os.getenv("INGEST_CONFIG") or os.path.join(_ROOT, "ingest.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+    except FileNotFoundError:
+        overrides = {}
+    unknown = set(overrides) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"unknown setting(s) in {path}: {', '.join(sorted(unknown))}")
+    config.update(overrides)
+    if config["mode"] not in ("poll", "stream"):
+        raise ValueError(f"mode must be 'poll' or 'stream', not {config['mode']!r}")
+    return config
+
+
+class IngestService:
+    """Fetch every registered sensor and append new readings to its history"""
+
+    def __init__(self, config=None, client=None):
+        self.config = dict(DEFAULTS, **(config or {}))
+        self.sensors = load_registry(self.config["sensors_file"])
+        self.histories = {
+            sid: sensor.history_store(
+                columnar=ColumnarHistory(sensor.columns_dir) if self.config["columnar"] else None)
+            for sid, sensor in self.sensors.items()
+        }
+        self.client = client or get_client()
+        self.restarts = 0
+        self.runner = None
+        self.metrics = get_metrics("ingest")
+        self.metrics.describe("floodsense_ingest_readings_total", "counter",
+                              "Readings handed to the history writer, by append result")
+
+    def log(self, msg):
+        ts = datetime.now().isoformat()
+        with open(self.config["log_file"], "a", encoding="utf-8") as f:
+            f.write(f"[{ts}] {msg}\n")
+        print(msg)
+
+    # ----------------------------------------
+    # One pass
+    # ----------------------------------------
+    def fetch(self, sensors=None):
+        try:
+            readings = fetch_readings(sensors or self.sensors, self.client)
+            self.log(f"Fetched {len(readings)} sensor(s) from Firebase: {readings}")
+            return readings
+        except Exception as e:
+            self.log(f"Fetch exception: {e}")
+            return {}
+
+    def append(self, sensor_id, record):
+        if record is None:
+            self.log(f"{sensor_id}: no record to append")
+            return None
+
+        history = self.histories[sensor_id]
+        status = history.append(record)
+        self.metrics.inc("floodsense_ingest_readings_total", sensor=sensor_id, status=status)
+        if status == DUPLICATE:
+            self.log(f"{sensor_id}: dropped duplicate reading ({history.counts[DUPLICATE]} so far): {record}")
+        elif status == INVALID:
+            self.log(f"{sensor_id}: rejected record with invalid timestamp: {record}")
+        else:
+            self.log(f"Appended to {history.path}: {record}")
+        return status
+
+    def ingest(self, readings):
+        """Append {sensor_id: record}; returns {sensor_id: append status}"""
+        if not readings:
+            self.log("No history updated")
+        return {sid: self.append(sid, record) for sid, record in readings.items()}
+
+    # ----------------------------------------
+    # Running
+    # ----------------------------------------
+    def run(self, once=False):
+        """Hold the writer lock and ingest until interrupted, restarting the
+        fetch loop after unexpected errors"""
+        lock_path = self.config["lock_file"]
+        lock = FileLock(lock_path, blocking=False)
+        try:
+            lock.__enter__()
+        except BlockingIOError:
+            self.log(f"Another ingestion daemon holds {lock_path}; exiting")
+            return 1
+        try:
+            return self._supervise(once)
+        finally:
+            lock.__exit__(None, None, None)
+
+    def _supervise(self, once):
+        if once:
+            self.ingest(self.fetch())
+            return 0
+        for history in self.histories.values():
+            history.start_compactor(self.config["compact_interval_sec"])
+        if self.config["metrics_port"]:
+            serve_metrics(self.config["metrics_port"], self.metrics)
+        self.log(f"Ingesting {len(self.sensors)} sensor(s) in {self.config['mode']} mode")
+        while True:
+            try:
+                self._loop()
+                return 0
+            except KeyboardInterrupt:
+                return 0
+            except Exception as e:
+                self.restarts += 1
+                self.log(f"Ingest loop crashed ({e!r}); restart {self.restarts} "
+                         f"in {self.config['restart_delay_sec']}s")
+                time.sleep(self.config["restart_delay_sec"])
+
+    def _loop(self):
+        if self.config["mode"] == "stream":
+            url, to_readings = stream_source(self.sensors)
+            FirebaseStream(url, on_record=lambda value: self.ingest(to_readings(value)),
+                           client=self.client, log=self.log).run()
+        else:
+            # Each group of sensors sharing a tick rate is fetched on its own
+            # fixed-rate clock; appends run as a separate stage
+            self.runner = PipelineRunner([("append", self.ingest)], log=self.log,
+                                         stats_interval=self.config["stats_interval_sec"],
+                                         metrics=self.metrics)
+            for interval, group in self.poll_groups().items():
+                self.runner.add_source(f"fetch@{interval:g}s", interval, partial(self.fetch, group))
+            self.runner.run()
+
+    def poll_groups(self):
+        """{interval_sec: {id: Sensor}} grouping sensors by their poll period"""
+        groups = {}
+        for sid, sensor in self.sensors.items():
+            interval = sensor.interval_sec or self.config["interval_sec"]
+            groups.setdefault(float(interval), {})[sid] = sensor
+        return groups
+
+
+class HistoryFollower:
+    """Hand rows the ingestion daemon appends to a consumer
+
+    Rows already in the logs when the follower starts are skipped, except
+    those newer than since[sensor_id] (e.g. the last reading a persisted
+    model was fitted on), which are replayed first so rows written while
+    the consumer was down are not lost. poll() returns the rows as a list
+    of rounds, each {sensor_id: record} holding at most one row per sensor,
+    oldest round first.
+    """
+
+    def __init__(self, stores, since=None):
+        self.stores = stores
+        self.since = dict(since or {})
+        self._pending = {sid: deque() for sid in stores}
+        self._started = False
+        for sid, store in stores.items():
+            store.refresh()
+            store.add_listener(partial(self._on_rows, sid))
+        self._started = True
+
+    def _on_rows(self, sensor_id, cols):
+        if cols is None:
+            return  # log reloaded from scratch
+        if not self._started:
+            # Initial replay of the existing log: only rows after `since`
+            if self.since.get(sensor_id) is None:
+                return
+            keep = cols["timestamp"] > self.since[sensor_id]
+            cols = {c: v[keep] for c, v in cols.items()}
+        names = list(cols)
+        for values in zip(*(cols[c] for c in names)):
+            record = {c: (None if isinstance(v, float) and np.isnan(v) else v.item())
+                      for c, v in zip(names, values)}
+            self._pending[sensor_id].append(record)
+
+    def poll(self):
+        for store in self.stores.values():
+            store.refresh()
+        rounds = []
+        while any(self._pending.values()):
+            rounds.append({sid: rows.popleft() for sid, rows in self._pending.items() if rows})
+        return rounds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FloodSense ingestion daemon (single history writer)")
+    parser.add_argument("--config", help="JSON config file (default: $INGEST_CONFIG or ingest.json)")
+    parser.add_argument("--stream", action="store_true", help="hold a Firebase event stream open instead of polling")
+    parser.add_argument("--interval", type=float, help="poll period in seconds")
+    parser.add_argument("--sensors", help="sensor registry file")
+    parser.add_argument("--once", action="store_true", help="fetch and append once, then exit")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    if args.stream or os.getenv("INGEST_MODE") == "stream":
+        config["mode"] = "stream"
+    if args.interval is not None:
+        config["interval_sec"] = args.interval
+    if args.sensors:
+        config["sensors_file"] = args.sensors
+    return IngestService(config).run(once=args.once)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Admission control for slow endpoints sharing a worker's threads.
+
+A gthread worker serves every route from one thread pool, so a burst of
+slow calls (an OpenAI round trip takes seconds) could occupy all of its
+threads and stall the fast dashboard endpoints. ConcurrencyLimiter lets at
+most `limit` calls run at once and at most `max_queue` more wait for a
+slot; anything beyond that, or anything that waited longer than
+`queue_timeout`, is turned away at once so the caller can answer
+429 + Retry-After. Slow calls can therefore never hold more than
+limit + max_queue threads of a worker. thread_budget() sizes those limits
+(and the stream client cap) from the worker's thread count so that a
+reserve of threads is always left for the fast routes.
+"""
+import threading
+
+
+class ConcurrencyLimiter:
+    """Bounded number of concurrent calls with a bounded wait queue"""
+
+    def __init__(self, limit, max_queue=0, queue_timeout=10.0, on_change=None):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.on_change = on_change  # on_change(active, waiting) after every change
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Take a slot, waiting in the queue if there is room; False if the
+        call should be rejected"""
+        with self._cond:
+            if self.active < self.limit and self.waiting == 0:
+                self.active += 1
+                self._changed()
+                return True
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+            self._changed()
+            try:
+                if not self._cond.wait_for(lambda: self.active < self.limit, self.queue_timeout):
+                    self.rejected += 1
+                    return False
+                self.active += 1
+                return True
+            finally:
+                self.waiting -= 1
+                self._changed()
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+            self._changed()
+
+    def stats(self):
+        with self._cond:
+            return {'active': self.active, 'waiting': self.waiting, 'rejected': self.rejected,
+                    'limit': self.limit, 'max_queue': self.max_queue}
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change(self.active, self.waiting)
+
+
+
+def reserved_threads(threads):
+    """Default threads kept for the fast routes: a quarter of the worker's,
+    at least 4, but leaving 3 for chat and streams on small workers"""
+    return max(1, min(max(4, threads // 4), threads - 3))
+
+
+def thread_budget(threads, reserved, chat_limit=None, chat_queue=None, stream_clients=None):
+    """Split a worker's threads between the slow routes
+
+    `reserved` threads are kept for the fast routes; /api/stream clients and
+    chat (in flight + queued) share the rest. Values left as None are
+    derived (about a sixth of the shared threads run chat, as many may
+    wait, streams get the remainder); given values are lowered to fit.
+    Returns (chat_limit, chat_queue, stream_clients). Raises ValueError if
+    fewer than 3 threads are left to share (one running chat, one queued,
+    one stream).
+    """
+    shared = max(threads - reserved, 0)
+    if shared < 3:
+        raise ValueError(f"{threads} threads with {reserved} reserved for fast routes leave {shared} "
+                         f"for chat and streams; need at least 3")
+    chat_limit = max(1, min(max(1, shared // 6) if chat_limit is None else chat_limit, shared - 2))
+    chat_queue = max(0, min(chat_limit if chat_queue is None else chat_queue, shared - 1 - chat_limit))
+    rest = shared - chat_limit - chat_queue
+    stream_clients = max(0, min(rest if stream_clients is None else stream_clients, rest))
+    return chat_limit, chat_queue, stream_clients
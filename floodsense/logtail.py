@@ -0,0 +1,168 @@
+"""Tail reader for the rotating application log.
+
+Serving the last N lines never reads the whole file: LogReader walks the
+log backwards in fixed-size blocks, and continues into the rotated backups
+(app.log.1, app.log.2, ...) when the current file runs out. Every call is
+capped by a scan budget, so response time does not grow with log size.
+
+Results come with an opaque cursor (file inode + byte offset). Passing it
+back returns only the lines written since, following the file across a
+rotation, since RotatingFileHandler renames app.log to app.log.1 and the
+inode moves with it.
+"""
+import base64
+import os
+import re
+from datetime import datetime
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40, "CRITICAL": 50}
+
+# Matches the backend log format: "%(asctime)s - %(name)s - %(levelname)s - ..."
+_LINE_RE = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),\d+ - \S+ - (\w+) - ")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(inode, offset):
+    return base64.urlsafe_b64encode(f"{inode}:{offset}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        inode, offset = base64.urlsafe_b64decode(padded.encode()).decode().split(":")
+        return int(inode), int(offset)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(f"invalid cursor: {token}") from e
+
+
+def parse_since(value):
+    """ISO date/time -> comparable log timestamp prefix ("YYYY-MM-DD HH:MM:SS")"""
+    try:
+        return datetime.fromisoformat(value).strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError as e:
+        raise ValueError(f"invalid since: {value}") from e
+
+
+class LogReader:
+    """Backwards block reader over a log file and its rotated backups"""
+
+    def __init__(self, path, backup_count=5, block_size=65536, max_scan_bytes=8 * 1024 * 1024):
+        self.path = path
+        self.backup_count = backup_count
+        self.block_size = block_size
+        self.max_scan_bytes = max_scan_bytes
+
+    def files(self):
+        """Current log first, then backups from newest to oldest"""
+        paths = [self.path] + [f"{self.path}.{i}" for i in range(1, self.backup_count + 1)]
+        return [p for p in paths if os.path.exists(p)]
+
+    # ----------------------------------------
+    # Public API
+    # ----------------------------------------
+    def tail(self, lines=100, level=None, since=None):
+        """Last `lines` matching lines (oldest first) and a cursor at end of log"""
+        cursor = self._end_cursor()
+        keep = self._filter(level)
+        since = parse_since(since) if since else None
+        budget = [self.max_scan_bytes]
+
+        out = []
+        for path in self.files():
+            for raw in self._reverse_lines(path, budget):
+                line = raw.decode("utf-8", errors="replace")
+                m = _LINE_RE.match(line)
+                if since and m and m.group(1) < since:
+                    return out[::-1], cursor
+                if keep(m):
+                    out.append(line)
+                    if len(out) >= lines:
+                        return out[::-1], cursor
+            if budget[0] <= 0:
+                break
+        return out[::-1], cursor
+
+    def read_since(self, cursor, lines=100, level=None, since=None):
+        """Matching lines written after `cursor` (oldest first) and the next cursor"""
+        inode, offset = decode_cursor(cursor)
+        keep = self._filter(level)
+        since = parse_since(since) if since else None
+        budget = self.max_scan_bytes
+
+        # Find the file the cursor points into; newer files follow it in order
+        chain = self.files()
+        if not chain:
+            return [], cursor
+        inodes = [os.stat(p).st_ino for p in chain]
+        if inode in inodes:
+            start = inodes.index(inode)
+        else:
+            start, offset = 0, 0  # rotated out of reach: restart at current log
+        if offset > os.path.getsize(chain[start]):
+            offset = 0  # truncated
+
+        out = []
+        next_cursor = cursor
+        for i in range(start, -1, -1):
+            path = chain[i]
+            pos = offset if i == start else 0
+            with open(path, "rb") as f:
+                f.seek(pos)
+                while budget > 0:
+                    raw = f.readline()
+                    if not raw.endswith(b"\n"):
+                        break  # EOF or a line still being written
+                    budget -= len(raw)
+                    pos += len(raw)
+                    line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+                    m = _LINE_RE.match(line)
+                    if (not since or not m or m.group(1) >= since) and keep(m):
+                        out.append(line)
+                    next_cursor = encode_cursor(inodes[i], pos)
+                    if len(out) >= lines:
+                        return out, next_cursor
+            if budget <= 0:
+                break
+        return out, next_cursor
+
+    # ----------------------------------------
+    # Internals
+    # ----------------------------------------
+    def _end_cursor(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return encode_cursor(st.st_ino, st.st_size)
+
+    @staticmethod
+    def _filter(level):
+        """Predicate on a line's regex match; `level` is a minimum severity"""
+        if not level:
+            return lambda m: True
+        threshold = LEVELS.get(level.upper())
+        if threshold is None:
+            raise ValueError(f"invalid level: {level}")
+        return lambda m: m is not None and LEVELS.get(m.group(2), 0) >= threshold
+
+    def _reverse_lines(self, path, budget):
+        """Yield complete lines of path from last to first, within budget[0] bytes"""
+        with open(path, "rb") as f:
+            pos = f.seek(0, os.SEEK_END)
+            tail = b""
+            while pos > 0 and budget[0] > 0:
+                size = min(self.block_size, pos)
+                pos -= size
+                f.seek(pos)
+                block = f.read(size) + tail
+                budget[0] -= size
+                parts = block.split(b"\n")
+                tail = parts[0]
+                for raw in reversed(parts[1:]):
+                    if raw.strip():
+                        yield raw.rstrip(b"\r")
+            if pos == 0 and tail.strip():
+                yield tail.rstrip(b"\r")
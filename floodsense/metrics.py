@@ -0,0 +1,377 @@
+"""Prometheus metrics shared by every process of one service.
+
+Each process keeps its counter and histogram increments in memory and a
+background thread adds them to a small SQLite database (WAL mode) about once
+a second, the same way the cache counters are shared. A scrape of any
+gunicorn worker's /metrics therefore reports totals over all workers.
+Gauges such as in-flight requests are stored per process and summed over
+the processes that are still alive.
+
+Services keep separate databases (METRICS_DIR/floodsense-metrics-<service>.sqlite),
+so the backend and the pipeline scripts do not mix their numbers. The
+pipeline scripts serve their registry over HTTP with serve().
+"""
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('FloodSense.metrics')
+
+# Latency histogram bucket upper bounds (seconds)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS samples (name TEXT, labels TEXT, value REAL NOT NULL, "
+    "PRIMARY KEY (name, labels))",
+    "CREATE TABLE IF NOT EXISTS gauges (name TEXT, labels TEXT, pid INTEGER, value REAL NOT NULL, "
+    "PRIMARY KEY (name, labels, pid))",
+)
+
+
+class Metrics:
+    """Counters, histograms and gauges aggregated across processes"""
+
+    def __init__(self, service="floodsense", path=None, flush_interval=1.0, buckets=BUCKETS):
+        self.service = service
+        directory = os.getenv("METRICS_DIR") or tempfile.gettempdir()
+        self.path = path or os.path.join(directory, f"floodsense-metrics-{service}.sqlite")
+        self.flush_interval = flush_interval
+        self.buckets = tuple(buckets)
+        self._help = {}       # family -> (type, help)
+        self._buckets = {}    # histogram family -> bucket bounds, if not the default
+        self._pending = {}    # (name, labels) -> increment
+        self._gauges = {}     # (name, labels) -> value in this process
+        self._gauges_dirty = False
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._flusher = None
+        with self._db() as conn:
+            for stmt in _SCHEMA:
+                conn.execute(stmt)
+
+    # ----------------------------------------
+    # Recording
+    # ----------------------------------------
+    def describe(self, name, kind, help_text, buckets=None):
+        """Declare a metric family's TYPE (counter/gauge/histogram) and HELP;
+        histograms of something other than seconds pass their own buckets"""
+        self._help[name] = (kind, help_text)
+        if buckets is not None:
+            self._buckets[name] = tuple(buckets)
+
+    def inc(self, name, value=1.0, **labels):
+        self._add({(name, _labels(labels)): value})
+
+    def observe(self, name, seconds, **labels):
+        """Add one observation to a histogram"""
+        base = _labels(labels)
+        updates = {(f"{name}_sum", base): seconds, (f"{name}_count", base): 1}
+        for bound in self._buckets.get(name, self.buckets):
+            if seconds <= bound:
+                updates[(f"{name}_bucket", _labels(labels, le=_num(bound)))] = 1
+        updates[(f"{name}_bucket", _labels(labels, le="+Inf"))] = 1
+        self._add(updates)
+
+    def gauge_set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = value
+            self._gauges_dirty = True
+        self._start_flusher()
+
+    def gauge_add(self, name, delta, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+            self._gauges_dirty = True
+        self._start_flusher()
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of a `with` block into histogram `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def upstream(self, upstream, endpoint):
+        """Time one call to an external service, counting it as an error if
+        the block raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc("floodsense_upstream_errors_total", upstream=upstream, endpoint=endpoint)
+            raise
+        finally:
+            self.observe("floodsense_upstream_seconds", time.perf_counter() - start,
+                         upstream=upstream, endpoint=endpoint)
+
+    def add_collector(self, fn):
+        """fn() -> [(name, type, help, [(labels_dict, value), ...])], evaluated
+        at scrape time for values that live elsewhere"""
+        self._collectors.append(fn)
+
+    # ----------------------------------------
+    # Exposition
+    # ----------------------------------------
+    def render(self):
+        """All metrics in the Prometheus text format"""
+        self.flush()
+        db = self._db()
+        families = {}
+        for name, labels, value in db.execute("SELECT name, labels, value FROM samples"):
+            families.setdefault(self._family(name), []).append((name, labels, value))
+
+        alive = {}
+        for name, labels, pid, value in db.execute("SELECT name, labels, pid, value FROM gauges"):
+            if alive.setdefault(pid, _alive(pid)):
+                rows = families.setdefault(name, [])
+                for i, (n, l, v) in enumerate(rows):
+                    if n == name and l == labels:
+                        rows[i] = (n, l, v + value)
+                        break
+                else:
+                    rows.append((name, labels, value))
+        dead = [pid for pid, ok in alive.items() if not ok]
+        if dead:
+            with self._db() as conn:
+                conn.executemany("DELETE FROM gauges WHERE pid = ?", [(pid,) for pid in dead])
+
+        for collect in self._collectors:
+            try:
+                for name, kind, help_text, samples in collect():
+                    self._help.setdefault(name, (kind, help_text))
+                    families.setdefault(name, []).extend((name, _labels(l), v) for l, v in samples)
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+        families.update(_hit_ratios(families.get("floodsense_cache_requests_total", [])))
+
+        lines = []
+        for family in sorted(families):
+            kind, help_text = self._help.get(family, ("untyped", ""))
+            if help_text:
+                lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {kind}")
+            for name, labels, value in sorted(families[family], key=_sort_key):
+                lines.append(f"{name}{{{labels}}} {_num(value)}" if labels else f"{name} {_num(value)}")
+        return "\n".join(lines) + "\n"
+
+    # ----------------------------------------
+    # Internals
+    # ----------------------------------------
+    def _family(self, name):
+        for suffix in ("_bucket", "_sum", "_count"):
+            base = name[:-len(suffix)]
+            if name.endswith(suffix) and self._help.get(base, ("",))[0] == "histogram":
+                return base
+        return name
+
+    def _add(self, updates):
+        with self._lock:
+            for key, value in updates.items():
+                self._pending[key] = self._pending.get(key, 0) + value
+        self._start_flusher()
+
+    def _start_flusher(self):
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+
+            def loop():
+                while True:
+                    time.sleep(self.flush_interval)
+                    try:
+                        self.flush()
+                    except sqlite3.Error as e:
+                        logger.warning(f"Could not flush metrics: {e}")
+
+            self._flusher = threading.Thread(target=loop, name="metrics-flush", daemon=True)
+            self._flusher.start()
+
+    def flush(self):
+        """Write this process's pending increments and gauges to the database"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            gauges = dict(self._gauges) if self._gauges_dirty else {}
+            self._gauges_dirty = False
+        if not pending and not gauges:
+            return
+        pid = os.getpid()
+        try:
+            with self._db() as conn:
+                conn.executemany(
+                    "INSERT INTO samples (name, labels, value) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name, labels) DO UPDATE SET value = value + excluded.value",
+                    [(name, labels, value) for (name, labels), value in pending.items()])
+                conn.executemany(
+                    "INSERT OR REPLACE INTO gauges (name, labels, pid, value) VALUES (?, ?, ?, ?)",
+                    [(name, labels, pid, value) for (name, labels), value in gauges.items()])
+        except sqlite3.Error:
+            with self._lock:  # keep the increments for the next flush
+                for key, value in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + value
+                self._gauges_dirty = self._gauges_dirty or bool(gauges)
+            raise
+
+    def _db(self):
+        """Per-thread connection in autocommit mode, usable as an IMMEDIATE
+        transaction in a `with` block"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn = self._local.conn = _Connection(conn)
+        return conn
+
+
+class _Connection:
+    """sqlite3 connection whose `with` block is one IMMEDIATE transaction"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, *args):
+        return self.conn.execute(*args)
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, **extra):
+    """Canonical Prometheus label string (le always last)"""
+    items = sorted(labels.items()) + list(extra.items())
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in items)
+
+
+def _num(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _sort_key(sample):
+    """Order samples by name and labels, with histogram buckets by bound"""
+    name, labels, _ = sample
+    match = _LE.search(labels)
+    if match is None:
+        return name, labels, 0.0
+    le = match.group(1)
+    return name, labels[:match.start()], float("inf") if le == "+Inf" else float(le)
+
+
+_LE = re.compile(r'(?:^|,)le="([^"]*)"$')
+
+
+def _hit_ratios(samples):
+    """floodsense_cache_hit_ratio per cache from its request counters
+    (result="miss" counts as a miss, any other result as a hit)"""
+    totals = {}
+    for _, labels, value in samples:
+        parts = dict(p.split("=", 1) for p in labels.split(",") if "=" in p)
+        cache = parts.get("cache", '""')
+        hits, total = totals.get(cache, (0.0, 0.0))
+        if parts.get("result") != '"miss"':
+            hits += value
+        totals[cache] = (hits, total + value)
+    if not totals:
+        return {}
+    return {"floodsense_cache_hit_ratio": [
+        ("floodsense_cache_hit_ratio", f"cache={cache}", round(hits / total, 4))
+        for cache, (hits, total) in totals.items() if total]}
+
+
+def _alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # exists but owned by someone else
+    return True
+
+
+def _describe_common(metrics):
+    metrics.describe("floodsense_upstream_seconds", "histogram",
+                     "Latency of calls to external services (Firebase, Open-Meteo, OpenAI)")
+    metrics.describe("floodsense_upstream_errors_total", "counter",
+                     "Calls to external services that raised an error")
+    metrics.describe("floodsense_cache_requests_total", "counter",
+                     "Cache lookups by cache and result")
+    metrics.describe("floodsense_cache_hit_ratio", "gauge",
+                     "Share of cache lookups answered without a miss")
+    metrics.describe("floodsense_stage_seconds", "histogram", "Pipeline stage and source latency")
+    metrics.describe("floodsense_stage_errors_total", "counter", "Pipeline stage failures")
+    metrics.describe("floodsense_stage_dropped_total", "counter",
+                     "Items a latest-only stage dropped for a fresher one")
+    metrics.describe("floodsense_stage_merged_total", "counter",
+                     "Queued items a merging stage folded into a newer one")
+    metrics.describe("floodsense_stage_queue_depth", "gauge", "Items waiting in a stage's queue")
+    metrics.describe("floodsense_tick_overruns_total", "counter",
+                     "Source ticks still running when the next one was due")
+
+
+_metrics = None
+_metrics_pid = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics(service=None):
+    """This process's registry (a fresh one after fork). The first call
+    names the service; later calls may omit it."""
+    global _metrics, _metrics_pid
+    with _metrics_lock:
+        if (_metrics is None or _metrics_pid != os.getpid()
+                or (service is not None and service != _metrics.service)):
+            _metrics = Metrics(service or os.getenv("METRICS_SERVICE", "floodsense"))
+            _metrics_pid = os.getpid()
+            _describe_common(_metrics)
+        return _metrics
+
+
+def serve(port, metrics=None, host="0.0.0.0"):
+    """Serve GET /metrics on a daemon thread; returns the server"""
+    metrics = metrics or get_metrics()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
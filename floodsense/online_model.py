@@ -0,0 +1,217 @@
+"""Incremental linear regression for the forecast pipeline.
+
+The model keeps weighted running means and co-moments of the features and
+the target (Welford style), so each new reading is an O(k^2) update instead
+of a refit over the whole history, and the fit stays numerically stable with
+large relative timestamps. Solving the co-moment system gives exactly the
+ordinary least squares fit of LinearRegression on the same rows.
+
+With forgetting < 1 every older sample is down-weighted by that factor per
+update, so the fit tracks recent dynamics (exponentially weighted LS).
+
+OnlineModelBank holds this state for many series (one per sensor) as
+stacked arrays, so all sensors are fitted, updated and solved in single
+batched NumPy operations.
+"""
+import json
+import os
+
+import numpy as np
+
+
+class OnlineModelBank:
+    """Online least squares states of many series stacked into arrays
+
+    One model per key (e.g. sensor id). Fitting, updating and solving run as
+    single vectorized NumPy computations over all series instead of a Python
+    loop per model; each model is saved as its own JSON state.
+    """
+
+    def __init__(self, keys, n_features, forgetting=1.0):
+        if not 0.0 < forgetting <= 1.0:
+            raise ValueError("forgetting must be in (0, 1]")
+        self.keys = list(keys)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.n_features = n_features
+        self.forgetting = forgetting
+        self.meta = [{} for _ in self.keys]
+        s, k = len(self.keys), n_features
+        self.n = np.zeros(s, dtype=np.int64)
+        self.weight = np.zeros(s)
+        self.mean_x = np.zeros((s, k))
+        self.mean_y = np.zeros(s)
+        self.cxx = np.zeros((s, k, k))
+        self.cxy = np.zeros((s, k))
+        self.cyy = np.zeros(s)
+        self._solution = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    # ----------------------------------------
+    # Fitting
+    # ----------------------------------------
+    def fit(self, rows):
+        """Batch fit the models given as {key: (X, y)} in one computation
+
+        Design matrices of different lengths are zero-padded into one
+        (series, rows, features) array and masked by weight 0.
+        """
+        keys = list(rows)
+        if not keys:
+            return self
+        idx = np.array([self.index[key] for key in keys])
+        lengths = np.array([len(rows[key][1]) for key in keys])
+        length, k = int(lengths.max()), self.n_features
+        X = np.zeros((len(keys), length, k))
+        y = np.zeros((len(keys), length))
+        for j, key in enumerate(keys):
+            X[j, :lengths[j]] = np.asarray(rows[key][0], dtype=float).reshape(-1, k)
+            y[j, :lengths[j]] = rows[key][1]
+
+        # Row i of a series with n rows has weight forgetting ** (n - 1 - i)
+        age = lengths[:, None] - 1 - np.arange(length)[None, :]
+        w = np.where(age >= 0, self.forgetting ** np.maximum(age, 0), 0.0)
+        weight = w.sum(axis=1)
+        safe = np.where(weight > 0, weight, 1.0)
+        mean_x = np.einsum("sl,slk->sk", w, X) / safe[:, None]
+        mean_y = np.einsum("sl,sl->s", w, y) / safe
+        Xc = X - mean_x[:, None, :]
+        yc = y - mean_y[:, None]
+
+        self.n[idx] = lengths
+        self.weight[idx] = weight
+        self.mean_x[idx] = mean_x
+        self.mean_y[idx] = mean_y
+        self.cxx[idx] = np.einsum("sl,sli,slj->sij", w, Xc, Xc)
+        self.cxy[idx] = np.einsum("sl,sli,sl->si", w, Xc, yc)
+        self.cyy[idx] = np.einsum("sl,sl,sl->s", w, yc, yc)
+        self._solution = None
+        return self
+
+    def update(self, x, y, mask=None):
+        """Add one sample to every series where mask is set, in one step
+
+        x is (series, features), y is (series,); rows outside mask are ignored.
+        """
+        x = np.asarray(x, dtype=float).reshape(len(self.keys), self.n_features)
+        y = np.asarray(y, dtype=float)
+        m = np.ones(len(self.keys), dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+        if not m.any():
+            return self
+        lam = self.forgetting
+        x, y = x[m], y[m]
+
+        weight = self.weight[m] * lam + 1.0
+        dx = x - self.mean_x[m]
+        dy = y - self.mean_y[m]
+        mean_x = self.mean_x[m] + dx / weight[:, None]
+        mean_y = self.mean_y[m] + dy / weight
+        self.cxx[m] = self.cxx[m] * lam + dx[:, :, None] * (x - mean_x)[:, None, :]
+        self.cxy[m] = self.cxy[m] * lam + dx * (y - mean_y)[:, None]
+        self.cyy[m] = self.cyy[m] * lam + dy * (y - mean_y)
+        self.n[m] += 1
+        self.weight[m] = weight
+        self.mean_x[m] = mean_x
+        self.mean_y[m] = mean_y
+        self._solution = None
+        return self
+
+    # ----------------------------------------
+    # Prediction
+    # ----------------------------------------
+    def _solve(self):
+        if self._solution is None:
+            # Batched pseudo-inverse: the same minimum-norm solution as the
+            # per-model lstsq when a feature is constant
+            rcond = np.finfo(float).eps * self.n_features
+            coef = np.einsum("sij,sj->si", np.linalg.pinv(self.cxx, rcond=rcond, hermitian=True), self.cxy)
+            intercept = self.mean_y - np.einsum("si,si->s", coef, self.mean_x)
+            self._solution = (coef, intercept)
+        return self._solution
+
+    @property
+    def coef_(self):
+        return self._solve()[0]
+
+    @property
+    def intercept_(self):
+        return self._solve()[1]
+
+    def predict(self, X):
+        """Predict for (series, rows, features) inputs; returns (series, rows)"""
+        coef, intercept = self._solve()
+        X = np.asarray(X, dtype=float).reshape(len(self.keys), -1, self.n_features)
+        return np.einsum("smk,sk->sm", X, coef) + intercept[:, None]
+
+    def predict_interval(self, X, z=1.96):
+        """Predictions with prediction interval half-widths, both (series, rows)
+
+        Uses the residual variance from the running co-moments
+        (cyy - coef . cxy over weight - k - 1 degrees of freedom) and the
+        leverage of each row, so the interval widens away from the data.
+        z = 1.96 gives about 95% under normal residuals. Series with too few
+        samples for a variance estimate get NaN half-widths.
+        """
+        coef, intercept = self._solve()
+        X = np.asarray(X, dtype=float).reshape(len(self.keys), -1, self.n_features)
+        mean = np.einsum("smk,sk->sm", X, coef) + intercept[:, None]
+
+        dof = self.weight - self.n_features - 1
+        sse = np.maximum(self.cyy - np.einsum("si,si->s", coef, self.cxy), 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            var = np.where(dof > 0, sse / dof, np.nan)
+            dx = X - self.mean_x[:, None, :]
+            rcond = np.finfo(float).eps * self.n_features
+            inv = np.linalg.pinv(self.cxx, rcond=rcond, hermitian=True)
+            leverage = 1.0 / self.weight[:, None] + np.einsum("smi,sij,smj->sm", dx, inv, dx)
+            half = z * np.sqrt(var[:, None] * (1.0 + leverage))
+        return mean, half
+
+    # ----------------------------------------
+    # Persistence
+    # ----------------------------------------
+    def to_dict(self, key):
+        i = self.index[key]
+        return {
+            "n_features": self.n_features,
+            "forgetting": self.forgetting,
+            "meta": self.meta[i],
+            "n": int(self.n[i]),
+            "weight": float(self.weight[i]),
+            "mean_x": self.mean_x[i].tolist(),
+            "mean_y": float(self.mean_y[i]),
+            "cxx": self.cxx[i].tolist(),
+            "cxy": self.cxy[i].tolist(),
+            "cyy": float(self.cyy[i]),
+        }
+
+    def set_state(self, key, state):
+        """Load one series from a to_dict() state"""
+        i = self.index[key]
+        self.meta[i] = dict(state.get("meta") or {})
+        self.n[i] = state["n"]
+        self.weight[i] = state["weight"]
+        self.mean_x[i] = state["mean_x"]
+        self.mean_y[i] = state["mean_y"]
+        self.cxx[i] = state["cxx"]
+        self.cxy[i] = state["cxy"]
+        self.cyy[i] = state["cyy"]
+        self._solution = None
+
+    def save(self, key, path):
+        """Write one series' state as JSON (atomically)"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(key), f)
+        os.replace(tmp, path)
+
+    def load(self, key, path):
+        """Load one series' saved state; returns False if there is none"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.set_state(key, json.load(f))
+            return True
+        except FileNotFoundError:
+            return False
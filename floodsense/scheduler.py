@@ -0,0 +1,240 @@
+"""Fixed-rate asyncio runner for the fetch → train → push pipelines.
+
+`while True: work(); time.sleep(5)` runs every 5 s *plus* however long the
+work took, and one slow Firebase call holds up every later stage.
+PipelineRunner instead:
+
+- fires each source on a fixed-rate clock (start + k * period), so ticks do
+  not drift; a tick that is still running when the next one is due counts
+  as an overrun and the missed ticks are skipped, not replayed in a burst
+- runs each stage as its own task, connected to the next by a bounded
+  queue, so e.g. the weather fetch of one round, the model update of the
+  previous one and the Firebase push of the one before overlap. A full
+  queue blocks the stage feeding it (the blocked source then shows up as
+  overruns), except for `latest_only` stages, where the oldest queued item
+  is dropped because a fresher one supersedes it, and `merge` stages such
+  as a forecast push, where the queued items are folded into one (e.g. the
+  newest forecast of every sensor, see merge_by_key)
+- runs the (blocking) stage functions in worker threads, one at a time per
+  stage, so per-stage state such as the models needs no locking
+- records a latency histogram per source and stage (also exported as
+  floodsense_stage_seconds when given a floodsense.metrics registry)
+
+Several sources can feed the first stage, each with its own period (e.g.
+one per sensor tick rate).
+"""
+import asyncio
+import bisect
+import threading
+import time
+
+# Latency histogram bucket upper bounds (seconds)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def merge_by_key(older, newer):
+    """Merge function for dict items keyed by e.g. sensor id: newer entries win"""
+    return {**older, **newer}
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram with approximate quantiles"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.sum += seconds
+            self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Estimate of the q-quantile, interpolated within its bucket"""
+        with self._lock:
+            if self.count == 0:
+                return None
+            rank = q * self.count
+            seen = 0
+            for i, n in enumerate(self.counts):
+                if n and seen + n >= rank:
+                    lo = self.buckets[i - 1] if i else 0.0
+                    hi = self.buckets[i] if i < len(self.buckets) else self.max
+                    return min(lo + (hi - lo) * (rank - seen) / n, self.max)
+                seen += n
+            return self.max
+
+    def snapshot(self):
+        """count/sum/max plus p50/p95/p99 in milliseconds"""
+        out = {"count": self.count, "sum_ms": round(self.sum * 1000, 2),
+               "max_ms": round(self.max * 1000, 2)}
+        for name, q in (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            value = self.quantile(q)
+            out[name] = None if value is None else round(value * 1000, 2)
+        return out
+
+
+class PipelineRunner:
+    """Fixed-rate sources feeding a chain of stages over bounded queues
+
+    stages is a list of (name, fn). Each fn takes the previous stage's
+    output and returns the next stage's input; returning None ends that
+    item's trip through the pipeline. Stages named in latest_only drop
+    their oldest queued item instead of applying backpressure; stages in
+    merge ({name: fn(older, newer) -> item}) fold everything queued and the
+    new item into one.
+    """
+
+    def __init__(self, stages, queue_size=4, latest_only=(), stats_interval=60.0, log=print,
+                 metrics=None, merge=None):
+        self.stages = list(stages)
+        self.metrics = metrics
+        self.latest_only = set(latest_only)
+        self.merge = dict(merge or {})
+        self.queue_size = queue_size
+        self.stats_interval = stats_interval
+        self.log = log
+        self.sources = []
+        self.latency = {}
+        self.counters = {}
+        self._queues = None
+
+    def add_source(self, name, period, produce, many=False):
+        """Call produce() every `period` seconds and feed its result to the
+        first stage (each element of it if many=True)"""
+        self.sources.append((name, float(period), produce, many))
+        self.latency[name] = Histogram()
+        self.counters[name] = {"ticks": 0, "overruns": 0, "skipped": 0}
+        return self
+
+    def stats(self):
+        out = {}
+        for name, hist in self.latency.items():
+            out[name] = dict(hist.snapshot(), **self.counters[name])
+        if self._queues:
+            for (name, _), q in zip(self.stages, self._queues):
+                out[name]["queued"] = q.qsize()
+        return out
+
+    # ----------------------------------------
+    # Running
+    # ----------------------------------------
+    def run(self):
+        """Run until interrupted (blocking)"""
+        try:
+            asyncio.run(self.run_async())
+        except KeyboardInterrupt:
+            pass
+
+    async def run_async(self):
+        for name, _ in self.stages:
+            self.latency[name] = Histogram()
+            self.counters[name] = {"dropped": 0, "merged": 0, "errors": 0}
+        self._queues = [asyncio.Queue(self.queue_size) for _ in self.stages]
+        tasks = [asyncio.create_task(self._source(*source)) for source in self.sources]
+        for i in range(len(self.stages)):
+            tasks.append(asyncio.create_task(self._stage(i)))
+        if self.stats_interval:
+            tasks.append(asyncio.create_task(self._report()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _source(self, name, period, produce, many):
+        loop = asyncio.get_running_loop()
+        counters = self.counters[name]
+        start = loop.time()
+        tick = 0
+        while True:
+            due = start + tick * period
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            counters["ticks"] += 1
+
+            began = time.perf_counter()
+            try:
+                result = await asyncio.to_thread(produce)
+            except Exception as e:
+                self.log(f"[SCHED] {name} failed: {e}")
+                result = None
+            self._observe(name, time.perf_counter() - began)
+
+            for item in ((result or []) if many else [result]):
+                if item is not None:
+                    await self._put(0, item)
+
+            # Next tick on the fixed grid; ticks already missed are skipped
+            tick += 1
+            late = loop.time() - (start + tick * period)
+            if late > 0:
+                missed = int(late // period) + 1
+                counters["overruns"] += 1
+                if self.metrics is not None:
+                    self.metrics.inc("floodsense_tick_overruns_total", source=name)
+                counters["skipped"] += missed
+                tick += missed
+                self.log(f"[SCHED] {name} overran its {period:g}s tick by {late:.2f}s; "
+                         f"skipping {missed} tick(s)")
+
+    async def _stage(self, i):
+        name, fn = self.stages[i]
+        queue = self._queues[i]
+        while True:
+            item = await queue.get()
+            if self.metrics is not None:
+                self.metrics.gauge_set("floodsense_stage_queue_depth", queue.qsize(), stage=name)
+            began = time.perf_counter()
+            try:
+                result = await asyncio.to_thread(fn, item)
+            except Exception as e:
+                self.counters[name]["errors"] += 1
+                if self.metrics is not None:
+                    self.metrics.inc("floodsense_stage_errors_total", stage=name)
+                self.log(f"[SCHED] {name} failed: {e}")
+                result = None
+            self._observe(name, time.perf_counter() - began)
+            if result is not None and i + 1 < len(self.stages):
+                await self._put(i + 1, result)
+
+    async def _put(self, i, item):
+        name, queue = self.stages[i][0], self._queues[i]
+        if name in self.merge and queue.full():
+            # Oldest first, so newer values win wherever items overlap
+            queued = [queue.get_nowait() for _ in range(queue.qsize())]
+            for older in reversed(queued):
+                item = self.merge[name](older, item)
+            self.counters[name]["merged"] += len(queued)
+            if self.metrics is not None:
+                self.metrics.inc("floodsense_stage_merged_total", len(queued), stage=name)
+        elif name in self.latest_only and queue.full():
+            queue.get_nowait()  # superseded by a fresher item
+            self.counters[name]["dropped"] += 1
+            if self.metrics is not None:
+                self.metrics.inc("floodsense_stage_dropped_total", stage=name)
+        await queue.put(item)
+        if self.metrics is not None:
+            self.metrics.gauge_set("floodsense_stage_queue_depth", queue.qsize(), stage=name)
+
+    def _observe(self, name, seconds):
+        self.latency[name].observe(seconds)
+        if self.metrics is not None:
+            self.metrics.observe("floodsense_stage_seconds", seconds, stage=name)
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            parts = []
+            for name, s in self.stats().items():
+                if s["count"]:
+                    parts.append(f"{name} p50 {s['p50_ms']}ms p95 {s['p95_ms']}ms p99 {s['p99_ms']}ms")
+            if parts:
+                self.log("[SCHED] " + " | ".join(parts))
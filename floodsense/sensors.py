@@ -0,0 +1,150 @@
+"""Sensor registry: which river gauges the pipeline and backend serve.
+
+Sensors are listed in a JSON file (SENSORS_FILE, default sensors.json):
+
+    {"sensors": [
+        {"id": "sensor1", "name": "Cau Rach Chiec", "lat": 10.7769, "lon": 106.7009},
+        {"id": "sensor2", "lat": 10.80, "lon": 106.65}
+    ]}
+
+Each sensor's Firebase paths follow the existing layout under FIREBASE_DB
+(water_level/<id>, forecast/<id>, config/<id>, commands/<id>), and any of
+them can be overridden per sensor ("sensor_url", "forecast_url", ...).
+"interval_sec" sets how often the ingestion daemon polls that sensor
+(default: the daemon's interval_sec).
+Without a registry file there is a single sensor1 configured from the
+FB_SENSOR/FB_FORECAST/FB_CONFIG/FB_COMMANDS variables, as before.
+
+sensor1 keeps history.csv and history_columns/ in the repository root;
+other sensors store theirs under data/<id>/.
+"""
+import json
+import os
+import re
+
+from floodsense.history import HistoryStore
+
+FIREBASE_DB = os.getenv("FIREBASE_DB", "https://edfwef-default-rtdb.firebaseio.com").rstrip("/")
+DEFAULT_SENSOR = "sensor1"
+
+# Firebase node -> Sensor attribute holding that node's URL
+_NODES = {"water_level": "sensor_url", "forecast": "forecast_url",
+          "config": "config_url", "commands": "commands_url"}
+
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class Sensor:
+    """One gauge: its Firebase URLs, location and local history paths"""
+
+    def __init__(self, sensor_id, name=None, lat=None, lon=None, interval_sec=None, root=_ROOT, **urls):
+        if not re.fullmatch(r"[A-Za-z0-9_-]+", str(sensor_id)):
+            raise ValueError(f"invalid sensor id: {sensor_id!r}")
+        self.id = sensor_id
+        self.name = name or sensor_id
+        self.lat = float(lat if lat is not None else os.getenv("LAT", "10.7769"))
+        self.lon = float(lon if lon is not None else os.getenv("LON", "106.7009"))
+        self.interval_sec = float(interval_sec) if interval_sec is not None else None
+        self.sensor_url = urls.get("sensor_url") or f"{FIREBASE_DB}/water_level/{sensor_id}.json"
+        self.forecast_url = urls.get("forecast_url") or f"{FIREBASE_DB}/forecast/{sensor_id}.json"
+        self.config_url = urls.get("config_url") or f"{FIREBASE_DB}/config/{sensor_id}.json"
+        self.commands_url = urls.get("commands_url") or f"{FIREBASE_DB}/commands/{sensor_id}.json"
+        if sensor_id == DEFAULT_SENSOR:
+            base = root
+            columns_dir = os.getenv("HISTORY_COLUMNS_DIR") or os.path.join(base, "history_columns")
+        else:
+            base = os.path.join(root, "data", sensor_id)
+            columns_dir = os.path.join(base, "history_columns")
+        self.history_path = os.path.join(base, "history.csv")
+        self.columns_dir = columns_dir
+
+    def history_store(self, columnar=None, **kwargs):
+        """HistoryStore for this sensor's history file (creating its directory)"""
+        os.makedirs(os.path.dirname(self.history_path), exist_ok=True)
+        return HistoryStore(self.history_path, sensor=self.id, columnar=columnar, **kwargs)
+
+    def to_dict(self):
+        return {"id": self.id, "name": self.name, "lat": self.lat, "lon": self.lon}
+
+    def __repr__(self):
+        return f"Sensor({self.id!r})"
+
+
+def load_registry(path=None, root=_ROOT):
+    """Registered sensors as an ordered {id: Sensor} dict"""
+    path = path or os.getenv("SENSORS_FILE") or os.path.join(root, "sensors.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)["sensors"]
+    except FileNotFoundError:
+        entries = [{
+            "id": DEFAULT_SENSOR,
+            "sensor_url": os.getenv("FB_SENSOR"),
+            "forecast_url": os.getenv("FB_FORECAST"),
+            "config_url": os.getenv("FB_CONFIG"),
+            "commands_url": os.getenv("FB_COMMANDS"),
+        }]
+
+    registry = {}
+    for entry in entries:
+        entry = dict(entry)
+        sensor = Sensor(entry.pop("id"), root=root, **entry)
+        if sensor.id in registry:
+            raise ValueError(f"duplicate sensor id in {path}: {sensor.id}")
+        registry[sensor.id] = sensor
+    if not registry:
+        raise ValueError(f"no sensors in {path}")
+    return registry
+
+
+def batch_url(registry, node="water_level"):
+    """URL of the Firebase node holding every sensor's child (water_level,
+    forecast, ...), or None if any sensor uses a custom URL for it"""
+    attr = _NODES[node]
+    if all(getattr(s, attr) == f"{FIREBASE_DB}/{node}/{s.id}.json" for s in registry.values()):
+        return f"{FIREBASE_DB}/{node}.json"
+    return None
+
+
+def fetch_readings(registry, client, timeout=5):
+    """Latest reading of every sensor as {id: record}
+
+    When all sensors use the default layout this is a single GET of the
+    water_level/ node; otherwise each sensor URL is fetched in turn.
+    """
+    url = batch_url(registry)
+    if url:
+        r = client.get(url, timeout=timeout)
+        if r.status_code != 200:
+            raise ValueError(f"HTTP {r.status_code}")
+        return split_readings(r.json(), registry)
+
+    readings = {}
+    for s in registry.values():
+        r = client.get(s.sensor_url, timeout=timeout)
+        if r.status_code == 200 and isinstance(r.json(), dict):
+            readings[s.id] = r.json()
+    return readings
+
+
+def split_readings(node, registry):
+    """{id: record} for registered sensors found in a water_level/ snapshot"""
+    if not isinstance(node, dict):
+        return {}
+    return {sid: node[sid] for sid in registry if isinstance(node.get(sid), dict)}
+
+
+def stream_source(registry):
+    """(url, to_readings) for one FirebaseStream covering every sensor
+
+    Streams the water_level/ node when all sensors live under it, or the
+    sensor's own URL when there is only one. to_readings turns the stream's
+    current value into {id: record}.
+    """
+    url = batch_url(registry)
+    if url:
+        return url, lambda node: split_readings(node, registry)
+    if len(registry) == 1:
+        sensor = next(iter(registry.values()))
+        return sensor.sensor_url, lambda record: {sensor.id: record}
+    raise ValueError("stream mode needs every sensor under the default water_level/ node")
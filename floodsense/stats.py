@@ -0,0 +1,158 @@
+"""Incrementally maintained water level statistics over a HistoryStore.
+
+HistoryStats registers as a listener on the store, so it sees each batch of
+newly parsed rows exactly once and folds it into running aggregates:
+
+- totals (count/sum/min/max) over the whole history, in O(batch)
+- current value and trend from the two newest readings
+- sliding windows (e.g. last hour, last 24 hours of data time) using
+  monotonic deques, so window min/max are O(1) amortized per reading; the
+  window sum is recomputed exactly (math.fsum) at most once per change
+  rather than kept as a running sum, which drifts as values are evicted
+
+Rows in the store's late segment are merged into the totals and windows at
+snapshot time, so the stats agree with /api/history over the same range.
+
+A request then costs a tail refresh of the store plus a dict build instead
+of re-reading and re-aggregating the whole CSV.
+"""
+import math
+import threading
+from collections import deque
+
+import numpy as np
+
+WINDOWS = {"1h": 3600_000, "24h": 86_400_000}
+
+
+class WindowStats:
+    """min/max/avg of the readings within `span_ms` of the newest timestamp"""
+
+    def __init__(self, span_ms):
+        self.span_ms = span_ms
+        self._items = deque()   # (ts, value) in timestamp order
+        self._max = deque()     # values decreasing
+        self._min = deque()     # values increasing
+        self._sum = 0.0         # of _items, valid unless _dirty
+        self._dirty = False
+
+    def reset(self):
+        self.__init__(self.span_ms)
+
+    def push(self, ts, value):
+        self._items.append((ts, value))
+        self._dirty = True
+        while self._max and self._max[-1][1] < value:
+            self._max.pop()
+        self._max.append((ts, value))
+        while self._min and self._min[-1][1] > value:
+            self._min.pop()
+        self._min.append((ts, value))
+        self._evict(ts - self.span_ms)
+
+    def _evict(self, cutoff):
+        while self._items and self._items[0][0] < cutoff:
+            ts, value = self._items.popleft()
+            if self._max and self._max[0][0] == ts and self._max[0][1] == value:
+                self._max.popleft()
+            if self._min and self._min[0][0] == ts and self._min[0][1] == value:
+                self._min.popleft()
+
+    def snapshot(self, late_ts=None, late_values=None):
+        """min/max/avg/records, counting late rows (sorted arrays, optional)
+        that fall inside the window"""
+        n = len(self._items)
+        if n == 0:
+            return None
+        if self._dirty:
+            self._sum = math.fsum(value for _, value in self._items)
+            self._dirty = False
+        lo, hi, total = float(self._min[0][1]), float(self._max[0][1]), self._sum
+        if late_ts is not None and len(late_ts):
+            cutoff = self._items[-1][0] - self.span_ms
+            inside = late_values[int(np.searchsorted(late_ts, cutoff, "left")):]
+            if len(inside):
+                lo, hi = min(lo, float(inside.min())), max(hi, float(inside.max()))
+                total = math.fsum([total, *inside.tolist()])
+                n += len(inside)
+        return {"min": lo, "max": hi, "avg": total / n, "records": n}
+
+
+class HistoryStats:
+    """Running statistics of the waterLevel column of a HistoryStore"""
+
+    def __init__(self, store, column="waterLevel", windows=None):
+        self.store = store
+        self.column = column
+        self.windows = {name: WindowStats(span) for name, span in (windows or WINDOWS).items()}
+        self._lock = threading.Lock()
+        self._reset()
+        store.add_listener(self._on_rows)
+
+    def _reset(self):
+        self.rows = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.last = None   # (ts, value) of the newest reading
+        self.prev = None
+        for window in self.windows.values():
+            window.reset()
+
+    def _on_rows(self, cols):
+        with self._lock:
+            if cols is None:
+                self._reset()
+                return
+            ts, values = cols["timestamp"], cols[self.column]
+            self.rows += len(ts)
+            valid = ~np.isnan(values)
+            ts, values = ts[valid], values[valid]
+            if len(values) == 0:
+                return
+
+            self.count += len(values)
+            self.total += float(values.sum())
+            lo, hi = float(values.min()), float(values.max())
+            self.min = lo if self.min is None else min(self.min, lo)
+            self.max = hi if self.max is None else max(self.max, hi)
+
+            # Batches arrive sorted and after everything already seen, so only
+            # the tail that can still be inside the widest window is pushed
+            for a, b in zip(ts[-2:], values[-2:]):
+                self.prev, self.last = self.last, (int(a), float(b))
+            widest = max((w.span_ms for w in self.windows.values()), default=0)
+            start = int(np.searchsorted(ts, ts[-1] - widest, "left"))
+            for a, b in zip(ts[start:].tolist(), values[start:].tolist()):
+                for window in self.windows.values():
+                    window.push(a, b)
+
+    def snapshot(self):
+        """Stats dict in the shape returned by /api/water-status, or None"""
+        self.store.refresh()
+        late = self.store.late_rows()
+        late_rows = len(late)
+        late = late[late[self.column].notna()].sort_values("timestamp") if len(late) else late
+        late_ts = late["timestamp"].to_numpy() if len(late) else np.empty(0)
+        late_values = late[self.column].to_numpy() if len(late) else np.empty(0)
+
+        with self._lock:
+            count = self.count + len(late_values)
+            if count == 0 or self.last is None:
+                return None
+            lo, hi, total = self.min, self.max, self.total
+            if len(late_values):
+                lo = min(lo, float(late_values.min()))
+                hi = max(hi, float(late_values.max()))
+                total += float(late_values.sum())
+
+            return {
+                "current": self.last[1],
+                "min": lo,
+                "max": hi,
+                "avg": total / count,
+                "records": self.rows + late_rows,
+                "trend": "increasing" if self.prev is not None and self.last[1] > self.prev[1] else "decreasing",
+                "windows": {name: w.snapshot(late_ts, late_values) for name, w in self.windows.items()},
+            }
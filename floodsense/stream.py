@@ -0,0 +1,135 @@
+"""Streaming ingestion from the Firebase Realtime Database REST API.
+
+Instead of polling a .json URL every few seconds, FirebaseStream holds one
+long-lived `Accept: text/event-stream` request open. Firebase sends a `put`
+with the full value at the path when the stream opens, then `put`/`patch`
+events for every change, and a `keep-alive` event about every 30 seconds.
+
+The stream keeps a local copy of the value, applies each event to it and
+hands the updated record to a callback. If the connection drops it
+reconnects with backoff. The first `put` after reconnecting is a full
+snapshot, so the local copy resyncs and anything missed while disconnected
+is picked up. Replayed readings are then dropped by the history dedup index.
+"""
+import json
+import threading
+
+import requests
+
+from floodsense.firebase import get_client
+
+
+class FirebaseStream:
+    """Subscribe to a Firebase path and call on_record(value) on every change"""
+
+    def __init__(self, url, on_record, client=None, read_timeout=90,
+                 min_backoff=1.0, max_backoff=30.0, log=print):
+        self.url = url
+        self.on_record = on_record
+        self.client = client or get_client()
+        self.read_timeout = read_timeout  # > Firebase's 30s keep-alive interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.log = log
+        self.state = None
+        self.events = 0
+        self.reconnects = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ----------------------------------------
+    # Lifecycle
+    # ----------------------------------------
+    def run(self):
+        """Consume the stream until stop() is called, reconnecting as needed"""
+        backoff = self.min_backoff
+        while not self._stop.is_set():
+            try:
+                for event, data in self._events():
+                    backoff = self.min_backoff
+                    self._dispatch(event, data)
+                    if self._stop.is_set():
+                        return
+                self.log("[STREAM] Connection closed by server")
+            except (requests.RequestException, ValueError) as e:
+                self.log(f"[STREAM] Connection error: {e}")
+            if self._stop.wait(backoff):
+                return
+            self.reconnects += 1
+            self.log(f"[STREAM] Reconnecting (attempt {self.reconnects}, waited {backoff:.1f}s)")
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def start(self):
+        """Run the stream on a daemon thread"""
+        self._thread = threading.Thread(target=self.run, name="firebase-stream", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+
+    # ----------------------------------------
+    # Protocol
+    # ----------------------------------------
+    def _events(self):
+        """Yield (event, data) pairs from one streaming connection"""
+        with self.client.session.get(
+                self.url,
+                headers={"Accept": "text/event-stream"},
+                stream=True,
+                timeout=(5, self.read_timeout)) as r:
+            if r.status_code != 200:
+                raise ValueError(f"HTTP {r.status_code}")
+            self.log(f"[STREAM] Subscribed to {self.url}")
+            event, data = None, []
+            # chunk_size=1: a response that is not chunk-encoded would
+            # otherwise hold small events back until 512 bytes arrive
+            for line in r.iter_lines(chunk_size=1, decode_unicode=True):
+                if self._stop.is_set():
+                    return
+                if not line:
+                    if event is not None:
+                        yield event, "\n".join(data)
+                    event, data = None, []
+                elif line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:].strip())
+
+    def _dispatch(self, event, data):
+        if event == "keep-alive":
+            return
+        if event in ("cancel", "auth_revoked"):
+            raise ValueError(f"stream {event}: {data}")
+        if event not in ("put", "patch"):
+            return
+
+        payload = json.loads(data)
+        self.state = _apply(self.state, payload.get("path", "/"), payload.get("data"), event == "patch")
+        self.events += 1
+        if isinstance(self.state, dict):
+            self.on_record(dict(self.state))
+
+
+def _apply(state, path, data, merge):
+    """Apply a put (replace) or patch (merge) at a slash-separated path"""
+    keys = [k for k in path.split("/") if k]
+    if not keys:
+        if merge and isinstance(state, dict) and isinstance(data, dict):
+            return {**state, **data}
+        return data
+
+    root = dict(state) if isinstance(state, dict) else {}
+    node = root
+    for k in keys[:-1]:
+        child = node.get(k)
+        node[k] = dict(child) if isinstance(child, dict) else {}
+        node = node[k]
+    last = keys[-1]
+    if merge and isinstance(node.get(last), dict) and isinstance(data, dict):
+        node[last] = {**node[last], **data}
+    elif data is None:
+        node.pop(last, None)
+    else:
+        node[last] = data
+    return root
@@ -0,0 +1,60 @@
+"""Prompt token counting and token-budgeted chat history.
+
+Counts use tiktoken's encoding for the configured model when tiktoken is
+installed. Otherwise a word-piece estimate is used (about one token per four
+characters of a word, one per punctuation mark), which is close enough for
+budgeting and tends to over-count accented Vietnamese slightly, so it errs
+on the side of a smaller prompt.
+"""
+import math
+import re
+
+try:
+    import tiktoken
+except ImportError:  # optional; fall back to the estimate
+    tiktoken = None
+
+# Per-message overhead of the chat format (role and separators), plus the
+# tokens that prime the reply
+MESSAGE_OVERHEAD = 4
+REPLY_PRIMING = 3
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+_encodings = {}
+
+
+def count_tokens(text, model=None):
+    if tiktoken is not None:
+        encoding = _encodings.get(model)
+        if encoding is None:
+            try:
+                encoding = tiktoken.encoding_for_model(model or "gpt-4o-mini")
+            except KeyError:
+                encoding = tiktoken.get_encoding("o200k_base")
+            _encodings[model] = encoding
+        return len(encoding.encode(text))
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in _PIECES.findall(text))
+
+
+def message_tokens(message, model=None):
+    return count_tokens(message.get("content") or "", model) + MESSAGE_OVERHEAD
+
+
+def fit_history(history, budget, model=None):
+    """The newest messages of history whose tokens fit in budget
+
+    Returns (kept, tokens). Trimming happens from the oldest end, and a
+    leading assistant message whose question was trimmed is dropped too, so
+    the kept history always starts with a user turn.
+    """
+    kept, tokens = [], 0
+    for message in reversed(history):
+        cost = message_tokens(message, model)
+        if tokens + cost > budget:
+            break
+        kept.append(message)
+        tokens += cost
+    kept.reverse()
+    while kept and kept[0].get("role") == "assistant":
+        tokens -= message_tokens(kept.pop(0), model)
+    return kept, tokens
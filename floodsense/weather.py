@@ -0,0 +1,152 @@
+"""Hour-aligned, persistent cache of Open-Meteo rainfall per location.
+
+Open-Meteo's hourly precipitation series only changes once an hour, so each
+(lat, lon) is fetched at most once per clock hour and the value is reused for
+every tick in that hour. Entries are kept in a small JSON file (atomically
+replaced, merged under a file lock) so restarts and other processes start
+warm.
+
+A background refresher re-fetches every known location shortly after each
+hour boundary; until it has, and whenever the upstream fails, the previous
+hour's value is served (stale-on-error). Failed fetches are retried at most
+every `retry_sec` seconds rather than on every tick.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from floodsense.filelock import FileLock
+from floodsense.metrics import get_metrics
+
+logger = logging.getLogger('FloodSense.weather')
+
+HOUR = 3600
+
+
+class WeatherCache:
+    """Rainfall per (lat, lon), valid for the clock hour it was fetched in"""
+
+    def __init__(self, fetch, path=None, refresh_delay=None, retry_sec=None, clock=time.time):
+        self.fetch = fetch  # fetch(lat, lon) -> rain mm, raises on failure
+        self.path = path or os.getenv("WEATHER_CACHE_FILE", "models/weather_cache.json")
+        self.refresh_delay = float(os.getenv("WEATHER_REFRESH_DELAY_SEC", "120")
+                                   if refresh_delay is None else refresh_delay)
+        self.retry_sec = float(os.getenv("WEATHER_RETRY_SEC", "60") if retry_sec is None else retry_sec)
+        self.clock = clock
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+        self._entries = self._read()  # "lat,lon" -> {"lat", "lon", "hour", "rain", "fetched"}
+        self._retry_at = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    # ----------------------------------------
+    # Public API
+    # ----------------------------------------
+    def get(self, lat, lon):
+        """Rainfall for the current hour, or the last known value if the
+        upstream is failing (None if it was never fetched)"""
+        key = _key(lat, lon)
+        now = self.clock()
+        hour = int(now // HOUR)
+        entry = self._entries.get(key)
+        fresh = entry is not None and (entry["hour"] == hour or (
+            # Background refresh is due shortly; last hour's value is still good
+            entry["hour"] == hour - 1 and now - hour * HOUR < self.refresh_delay
+            and not self._stop.is_set()))
+        get_metrics().inc("floodsense_cache_requests_total", cache="weather",
+                          result="hit" if fresh else "miss")
+        if fresh:
+            return entry["rain"]
+        return self._refresh(lat, lon, hour)
+
+    def start_refresher(self):
+        """Re-fetch every known location `refresh_delay` seconds past each hour"""
+        thread = threading.Thread(target=self._refresh_loop, name="weather-refresh", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {"locations": len(self._entries), "upstream_calls": self.upstream_calls,
+                "upstream_errors": self.upstream_errors}
+
+    # ----------------------------------------
+    # Internals
+    # ----------------------------------------
+    def _refresh(self, lat, lon, hour, force=False):
+        key = _key(lat, lon)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["hour"] >= hour:
+                return entry["rain"]  # another thread fetched it meanwhile
+            stale = entry["rain"] if entry is not None else None
+            if not force and self.clock() < self._retry_at.get(key, 0):
+                return stale
+
+            self.upstream_calls += 1
+            try:
+                rain = float(self.fetch(lat, lon))
+            except Exception as e:
+                self.upstream_errors += 1
+                self._retry_at[key] = self.clock() + self.retry_sec
+                logger.warning(f"Weather fetch for ({lat}, {lon}) failed, serving "
+                               f"{'stale value' if stale is not None else 'nothing'}: {e}")
+                return stale
+
+            self._retry_at.pop(key, None)
+            self._entries[key] = {"lat": lat, "lon": lon, "hour": hour,
+                                  "rain": rain, "fetched": self.clock()}
+            self._write()
+            return rain
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            now = self.clock()
+            due = (now // HOUR + 1) * HOUR + self.refresh_delay
+            if now % HOUR < self.refresh_delay:
+                due -= HOUR  # still before this hour's refresh
+            if self._stop.wait(max(due - now, 0)):
+                return
+            hour = int(self.clock() // HOUR)
+            for entry in list(self._entries.values()):
+                if entry["hour"] < hour:
+                    self._refresh(entry["lat"], entry["lon"], hour, force=True)
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            return entries if isinstance(entries, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable weather cache {self.path}: {e}")
+            return {}
+
+    def _write(self):
+        """Merge with the file on disk (newest hour wins) and replace it atomically"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            with FileLock(self.path + ".lock"):
+                merged = self._read()
+                for key, entry in self._entries.items():
+                    if key not in merged or merged[key]["hour"] <= entry["hour"]:
+                        merged[key] = entry
+                tmp = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(merged, f)
+                os.replace(tmp, self.path)
+                self._entries = merged
+        except OSError as e:
+            logger.warning(f"Could not persist weather cache {self.path}: {e}")
+
+
+def _key(lat, lon):
+    return f"{float(lat):.4f},{float(lon):.4f}"
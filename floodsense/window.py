@@ -0,0 +1,91 @@
+"""Fixed-size sliding windows of recent training samples.
+
+SampleWindows keeps the newest `capacity` samples of every series in one
+preallocated ring buffer per array (timestamps, extra features, targets),
+stacked over series. The ingest loop writes new samples in place, so memory
+per sensor is constant and a windowed refit only ever touches `capacity`
+rows, however long the history grows.
+"""
+import os
+
+import numpy as np
+
+
+class SampleWindows:
+    """Ring buffers of (timestamp, extra features, target) per series"""
+
+    def __init__(self, keys, capacity, n_extra=0):
+        if capacity < 2:
+            raise ValueError("capacity must be at least 2")
+        self.keys = list(keys)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.capacity = capacity
+        s = len(self.keys)
+        self.ts = np.zeros((s, capacity), dtype=np.int64)
+        self.extra = np.zeros((s, capacity, n_extra))
+        self.y = np.zeros((s, capacity))
+        self.count = np.zeros(s, dtype=np.int64)
+        self.head = np.zeros(s, dtype=np.int64)  # next slot to write
+
+    def push(self, ts, y, extra=None, mask=None):
+        """Write one sample per series where mask is set, overwriting the oldest"""
+        m = np.ones(len(self.keys), dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+        rows = np.flatnonzero(m)
+        if len(rows) == 0:
+            return
+        slots = self.head[rows]
+        self.ts[rows, slots] = np.asarray(ts)[m]
+        self.y[rows, slots] = np.asarray(y, dtype=float)[m]
+        if extra is not None and self.extra.shape[2]:
+            self.extra[rows, slots] = np.asarray(extra, dtype=float)[m]
+        self.head[rows] = (slots + 1) % self.capacity
+        self.count[rows] = np.minimum(self.count[rows] + 1, self.capacity)
+
+    def extend(self, key, ts, y, extra=None):
+        """Bulk-load samples of one series (e.g. the tail of its history)"""
+        i = self.index[key]
+        ts, y = np.asarray(ts)[-self.capacity:], np.asarray(y, dtype=float)[-self.capacity:]
+        n = len(ts)
+        slots = (self.head[i] + np.arange(n)) % self.capacity
+        self.ts[i, slots] = ts
+        self.y[i, slots] = y
+        if extra is not None and self.extra.shape[2]:
+            self.extra[i, slots] = np.asarray(extra, dtype=float).reshape(-1, self.extra.shape[2])[-n:]
+        self.head[i] = (self.head[i] + n) % self.capacity
+        self.count[i] = min(self.count[i] + n, self.capacity)
+
+    def rows(self, key, span_ms=None):
+        """(ts, extra, y) of one series oldest first, optionally only the
+        samples within span_ms of its newest timestamp"""
+        i = self.index[key]
+        n, head = int(self.count[i]), int(self.head[i])
+        if n < self.capacity:
+            order = np.arange(n)
+        else:
+            order = (np.arange(n) + head) % self.capacity
+        ts, extra, y = self.ts[i, order], self.extra[i, order], self.y[i, order]
+        if span_ms is not None and n:
+            start = int(np.searchsorted(ts, ts[-1] - span_ms, "left"))
+            ts, extra, y = ts[start:], extra[start:], y[start:]
+        return ts, extra, y
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def from_env(keys, n_extra=0, getenv=None):
+    """(SampleWindows, span_ms) configured by TRAIN_WINDOW_SAMPLES and/or
+    TRAIN_WINDOW_MINUTES, or (None, None) to train on the full history.
+
+    With only a time span the buffer is sized for it at one sample every
+    UPDATE_INTERVAL_SEC seconds.
+    """
+    getenv = getenv or os.getenv
+    samples = int(getenv("TRAIN_WINDOW_SAMPLES", "0") or 0)
+    minutes = float(getenv("TRAIN_WINDOW_MINUTES", "0") or 0)
+    if samples <= 0 and minutes <= 0:
+        return None, None
+    span_ms = int(minutes * 60_000) if minutes > 0 else None
+    if samples <= 0:
+        samples = int(np.ceil(minutes * 60 / float(getenv("UPDATE_INTERVAL_SEC", "5")))) + 1
+    return SampleWindows(keys, samples, n_extra), span_ms
@@ -0,0 +1,57 @@
+// Live water status over SSE, polling while the stream is unavailable.
+//
+// The backend refuses /api/stream with 503 once a worker's client cap is
+// reached, and a non-200 answer closes an EventSource for good. The page then
+// calls poll() every pollMs and retries the stream with exponential backoff;
+// polling stops once a stream is open again. onState receives 'live',
+// 'reconnecting' (the browser is retrying by itself) or 'polling'.
+function subscribeWithFallback(url, onUpdate, poll, options = {}) {
+  const pollMs = options.pollMs || 5000;
+  const minRetryMs = options.minRetryMs || 5000;
+  const maxRetryMs = options.maxRetryMs || 120000;
+  const onState = options.onState || (() => {});
+  let retryMs = minRetryMs;
+  let pollTimer = null;
+
+  function startPolling() {
+    if (pollTimer !== null) return;
+    pollTimer = setInterval(poll, pollMs);
+    poll();
+  }
+
+  function stopPolling() {
+    if (pollTimer === null) return;
+    clearInterval(pollTimer);
+    pollTimer = null;
+  }
+
+  function connect() {
+    const source = new EventSource(url);
+    source.onopen = () => {
+      retryMs = minRetryMs;
+      stopPolling();
+      onState('live');
+    };
+    source.addEventListener('update', (e) => onUpdate(JSON.parse(e.data)));
+    source.onerror = () => {
+      if (source.readyState !== EventSource.CLOSED) {
+        onState('reconnecting');
+        return;
+      }
+      onState('polling');
+      startPolling();
+      setTimeout(connect, retryMs);
+      retryMs = Math.min(retryMs * 2, maxRetryMs);
+    };
+  }
+
+  if (typeof EventSource === 'undefined') {
+    startPolling();
+  } else {
+    connect();
+  }
+}
+
+if (typeof module !== 'undefined') {
+  module.exports = { subscribeWithFallback };
+}
@@ -0,0 +1,10 @@
+# Gunicorn settings, picked up automatically from the working directory
+# (Dockerfile, Procfile and railway.json all start gunicorn from here).
+import os
+
+# Threaded workers: long-lived /api/stream connections each hold a thread,
+# so sync workers would be blocked by a single open dashboard
+worker_class = "gthread"
+# The backend reads the same GUNICORN_THREADS to size its stream and chat
+# limits, so set the thread count here rather than with --threads
+threads = int(os.getenv("GUNICORN_THREADS", 32))
@@ -1,107 +1,230 @@
-import requests
-import pandas as pd
+import numpy as np
 import os
-import time
-from sklearn.linear_model import LinearRegression
 from datetime import datetime
 from dotenv import load_dotenv
 
-load_dotenv()
-
-FIREBASE_SENSOR = os.getenv(
-    "FB_SENSOR",
-    "https://edfwef-default-rtdb.firebaseio.com/water_level/sensor1.json")
-FIREBASE_FORECAST = os.getenv(
-    "FB_FORECAST",
-    "https://edfwef-default-rtdb.firebaseio.com/forecast/sensor1.json")
-
-LOCAL_HISTORY = "history.csv"
-
-
-def fetch_latest():
-    try:
-        r = requests.get(FIREBASE_SENSOR, timeout=5)
-        if r.status_code != 200:
-            return None
-        return r.json()
-    except:
-        return None
+from floodsense.firebase import get_client
+from floodsense.ingest import HistoryFollower
+from floodsense.metrics import get_metrics, serve as serve_metrics
+from floodsense.online_model import OnlineModelBank
+from floodsense.scheduler import PipelineRunner, merge_by_key
+from floodsense.window import from_env as window_from_env
+from floodsense.sensors import load_registry, batch_url
 
+load_dotenv()
 
-def append_history(record):
-    df_new = pd.DataFrame([record])
-    df_new["timestamp"] = pd.to_numeric(df_new["timestamp"], errors="coerce")
-
-    if os.path.exists(LOCAL_HISTORY):
-        df_old = pd.read_csv(LOCAL_HISTORY)
-        df = pd.concat([df_old, df_new], ignore_index=True)
+# Stage and upstream timings, served on FORECAST_METRICS_PORT (0 = off)
+metrics = get_metrics("forecast")
+METRICS_PORT = int(os.getenv("FORECAST_METRICS_PORT", "9102"))
+
+# Histories are written by the ingestion daemon (main.py); this script only
+# consumes the rows it appends
+SENSORS = load_registry()
+stores = {sid: sensor.history_store() for sid, sensor in SENSORS.items()}
+firebase = get_client()
+
+MODEL_PATH = os.getenv("MODEL_PATH", "models/online_{sensor}.json")
+MODEL_FORGETTING = float(os.getenv("MODEL_FORGETTING", "1.0"))
+models = None
+
+# Sliding-window training: refit on the newest samples held in a ring buffer
+windows, WINDOW_SPAN_MS = window_from_env(SENSORS)
+
+# Forecast curve: every FORECAST_STEP_MIN minutes out to FORECAST_HORIZON_MIN
+FORECAST_STEP_MIN = int(os.getenv("FORECAST_STEP_MIN", "1"))
+FORECAST_HORIZON_MIN = int(os.getenv("FORECAST_HORIZON_MIN", "60"))
+HORIZONS = np.arange(FORECAST_STEP_MIN, FORECAST_HORIZON_MIN + 1, FORECAST_STEP_MIN)
+
+# How often to check the histories for rows appended by the ingestion daemon
+CONSUMER_POLL_SEC = float(os.getenv("CONSUMER_POLL_SEC", "1"))
+STAGE_STATS_SEC = float(os.getenv("STAGE_STATS_SEC", "60"))  # per-stage latency log period
+
+
+def model_path(sensor_id):
+    return MODEL_PATH.format(sensor=sensor_id)
+
+
+def train_models(sensor_ids):
+    """Fit the given sensors once on their full history, in one batched fit"""
+    rows, t0s = {}, {}
+    for sid in sensor_ids:
+        cols = stores[sid].read_arrays()
+        keep = ~np.isnan(cols["waterLevel"])
+        ts, y = cols["timestamp"][keep], cols["waterLevel"][keep]
+        if len(y) < 2:
+            continue
+        t0s[sid] = {"t0": int(ts[0]), "t_last": int(ts[-1])}
+        rows[sid] = (((ts - ts[0]) / 1000.0)[:, None], y)
+    if rows:
+        models.fit(rows)
+        for sid, meta in t0s.items():
+            models.meta[models.index[sid]] = meta
+            models.save(sid, model_path(sid))
+    return list(rows)
+
+
+def unseen(sensor_id, record):
+    """True if the model has not trained on this reading yet (rows appended
+    while it bootstrapped from history are already in its fit)"""
+    return int(record["timestamp"]) > models.meta[models.index[sensor_id]].get("t_last", -1)
+
+
+def update_window_models(readings):
+    """Push new readings into the ring buffers and refit changed sensors on their window"""
+    global models
+    changed = np.zeros(len(windows), dtype=bool)
+    if models is None:
+        models = OnlineModelBank(SENSORS, 1, forgetting=MODEL_FORGETTING)
+        for sid in SENSORS:
+            cols = stores[sid].read_arrays()
+            keep = ~np.isnan(cols["waterLevel"])
+            windows.extend(sid, cols["timestamp"][keep], cols["waterLevel"][keep])
+        changed[:] = True
     else:
-        df = df_new
-
-    now_ms = int(datetime.now().timestamp() * 1000)
-    df = df[(df["timestamp"] > 0) & (df["timestamp"] < now_ms + 3600_000)]
-    df.dropna(subset=["timestamp"], inplace=True)
-    df.sort_values("timestamp", inplace=True)
-    df.to_csv(LOCAL_HISTORY, index=False)
-    return df
-
-
-def prepare_ts(df):
-    if len(df) < 2:
-        return None
-    df["dt"] = pd.to_datetime(df["timestamp"], unit="ms", errors="coerce")
-    df.dropna(subset=["dt"], inplace=True)
-    t0 = df["timestamp"].iloc[0]
-    df["t_rel"] = (df["timestamp"] - t0) / 1000.0
-    return df
-
-
-def train_model(df):
-    X = df[["t_rel"]].values
-    y = df["waterLevel"].values
-    model = LinearRegression().fit(X, y)
-    return model
-
-
-def forecast(model, df, minutes=10):
-    last_t = df["t_rel"].iloc[-1]
-    future_t = last_t + minutes * 60
-    pred = float(model.predict([[future_t]])[0])
-    return pred
-
-
-def push_forecast(pred):
-    payload = {
-        "pred_10min": round(pred, 2),
-        "timestamp": int(datetime.now().timestamp() * 1000)
-    }
+        ts = np.zeros(len(windows), dtype=np.int64)
+        y = np.zeros(len(windows))
+        for sid, record in readings.items():
+            i = windows.index[sid]
+            if record.get("waterLevel") is not None and unseen(sid, record):
+                ts[i], y[i] = int(record["timestamp"]), record["waterLevel"]
+                changed[i] = True
+        windows.push(ts, y, mask=changed)
+
+    rows = {}
+    for sid in [sid for sid, c in zip(windows.keys, changed) if c]:
+        ts, _, y = windows.rows(sid, WINDOW_SPAN_MS)
+        if len(y):
+            models.meta[models.index[sid]] = {"t0": int(ts[0]), "t_last": int(ts[-1])}
+            rows[sid] = (((ts - ts[0]) / 1000.0)[:, None], y)
+    if rows:
+        models.fit(rows)
+    return models
+
+
+def load_models():
+    """Create the model bank from the saved per-sensor states; returns
+    {sensor_id: timestamp of the last reading fitted} for loaded models"""
+    global models
+    models = OnlineModelBank(SENSORS, 1, forgetting=MODEL_FORGETTING)
+    return {sid: models.meta[models.index[sid]].get("t_last")
+            for sid in SENSORS if models.load(sid, model_path(sid))}
+
+
+def update_models(readings):
+    global models
+    if windows is not None:
+        return update_window_models(readings)
+    if models is None:
+        load_models()
+
+    # First run: fit once on the full history, then update online
+    fresh = train_models([sid for sid in readings if models.n[models.index[sid]] == 0])
+
+    x = np.zeros((len(models), 1))
+    y = np.zeros(len(models))
+    mask = np.zeros(len(models), dtype=bool)
+    for sid, record in readings.items():
+        i = models.index[sid]
+        if (record.get("waterLevel") is not None and models.n[i] > 0
+                and sid not in fresh and unseen(sid, record)):
+            x[i, 0] = (int(record["timestamp"]) - models.meta[i]["t0"]) / 1000.0
+            y[i] = record["waterLevel"]
+            mask[i] = True
+            models.meta[i]["t_last"] = int(record["timestamp"])
+    if mask.any():
+        models.update(x, y, mask)
+        for sid in [sid for sid, updated in zip(models.keys, mask) if updated]:
+            models.save(sid, model_path(sid))
+    return models
+
+
+def forecast(readings):
+    """Forecast curve over HORIZONS for every sensor with at least 2 samples,
+    in one batched predict; returns {sensor_id: (mean, half_width)}"""
+    ready = [sid for sid in readings if models.n[models.index[sid]] >= 2]
+    if not ready:
+        return {}
+    idx = np.array([models.index[sid] for sid in ready])
+    last_t = np.array([(int(readings[sid]["timestamp"]) - models.meta[i]["t0"]) / 1000.0
+                       for sid, i in zip(ready, idx)])
+    X = np.zeros((len(models), len(HORIZONS), 1))
+    X[idx, :, 0] = last_t[:, None] + HORIZONS * 60
+    mean, half = models.predict_interval(X)
+    return {sid: (mean[i], half[i]) for sid, i in zip(ready, idx)}
+
+
+def push_forecasts(preds):
+    """Push each sensor's forecast curve; True if every write succeeded"""
+    now = int(datetime.now().timestamp() * 1000)
+    payloads = {}
+    for sid, (mean, half) in preds.items():
+        bounds = not np.isnan(half).any()
+        payloads[sid] = {
+            "pred_10min": round(float(np.interp(10, HORIZONS, mean)), 2),
+            "timestamp": now,
+            "curve": {
+                "step_min": FORECAST_STEP_MIN,
+                "interval": 0.95,
+                "mean": np.round(mean, 1).tolist(),
+                "lower": np.round(mean - half, 1).tolist() if bounds else None,
+                "upper": np.round(mean + half, 1).tolist() if bounds else None,
+            },
+        }
     try:
-        requests.put(FIREBASE_FORECAST, json=payload, timeout=5)
-        print(f"[ML] Forecast pushed: {payload}")
+        # One PATCH of forecast/ writes every sensor's own child
+        url = batch_url(SENSORS, "forecast")
+        if url:
+            responses = [firebase.patch(url, json=payloads, timeout=10)]
+        else:
+            responses = [firebase.put(SENSORS[sid].forecast_url, json=payload, timeout=5)
+                         for sid, payload in payloads.items()]
+        failed = [r for r in responses if not r.ok]
+        if failed:
+            print(f"[ML] Push failed: HTTP {failed[0].status_code} ({len(failed)} request(s))")
+            return False
+        print(f"[ML] Forecast pushed for {len(payloads)} sensor(s)")
+        return True
     except Exception as e:
         print(f"[ML] Push error: {e}")
+    return False
 
 
-def pipeline():
-    latest = fetch_latest()
-    if not latest:
-        print("[ML] No data fetched")
-        return
-
-    df = append_history(latest)
-    df_ts = prepare_ts(df)
-    if df_ts is None:
+def model_stage(readings):
+    """Update the models with a round of new readings and forecast every sensor"""
+    if not readings:
+        return None
+    update_models(readings)
+    preds = forecast(readings)
+    if not preds:
         print("[ML] Not enough data yet")
-        return
+        return None
+    for sid, (mean, _) in preds.items():
+        pred10 = float(np.interp(10, HORIZONS, mean))
+        print(f"[ML] {sid} latest: {readings[sid]['waterLevel']}, Pred+10min: {round(pred10,2)}")
+    return preds
+
 
-    model = train_model(df_ts)
-    pred10 = forecast(model, df_ts, minutes=10)
-    push_forecast(pred10)
-    print(
-        f"[ML] Latest: {latest['waterLevel']}, Pred+10min: {round(pred10,2)}")
+def pipeline(readings):
+    """Update, forecast and push for one round of newly ingested readings"""
+    if not readings:
+        print("[ML] No new readings")
+        return
+    preds = model_stage(readings)
+    if preds is not None:
+        push_forecasts(preds)
 
 
 if __name__ == "__main__":
-    while True:
-        pipeline()
-        time.sleep(5)
+    # Following the histories, updating the models and pushing run as
+    # separate stages, so a slow Firebase push does not delay the next round;
+    # pushes that back up are merged, keeping every sensor's newest forecast
+    runner = PipelineRunner([("model", model_stage), ("push", push_forecasts)],
+                            merge={"push": merge_by_key}, stats_interval=STAGE_STATS_SEC,
+                            metrics=metrics)
+    if METRICS_PORT:
+        serve_metrics(METRICS_PORT)
+    # Resume after the last reading the saved models were fitted on, so rows
+    # ingested while this process was down are fitted too
+    since = load_models() if windows is None else None
+    runner.add_source("follow", CONSUMER_POLL_SEC, HistoryFollower(stores, since).poll, many=True)
+    runner.run()
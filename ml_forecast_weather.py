@@ -1,227 +1,351 @@
 # Pipeline with weather + water level ML
-# Fetch water from Firebase, train model with precipitation data, push predictions
+# Consume readings appended by the ingestion daemon (main.py), train model with
+# precipitation data, push predictions
+# All registered sensors (see floodsense/sensors.py) are handled in one pass
 
 import requests
-import pandas as pd
+import numpy as np
 import os
-import time
-from sklearn.linear_model import LinearRegression
 from datetime import datetime
 from dotenv import load_dotenv
 
+from floodsense.firebase import get_client
+from floodsense.ingest import HistoryFollower
+from floodsense.metrics import get_metrics, serve as serve_metrics
+from floodsense.online_model import OnlineModelBank
+from floodsense.scheduler import PipelineRunner, merge_by_key
+from floodsense.weather import WeatherCache
+from floodsense.window import from_env as window_from_env
+from floodsense.sensors import load_registry, batch_url
+
 load_dotenv()
 
-# Firebase URLs
-FIREBASE_SENSOR   = os.getenv("FB_SENSOR", "https://edfwef-default-rtdb.firebaseio.com/water_level/sensor1.json")
-FIREBASE_FORECAST = os.getenv("FB_FORECAST", "https://edfwef-default-rtdb.firebaseio.com/forecast/sensor1.json")
+# Stage and upstream timings, served on WEATHER_METRICS_PORT (0 = off)
+metrics = get_metrics("forecast_weather")
+METRICS_PORT = int(os.getenv("WEATHER_METRICS_PORT", "9103"))
 
-LOCAL_HISTORY = "history.csv"
+SENSORS = load_registry()
+stores = {sid: sensor.history_store() for sid, sensor in SENSORS.items()}
+firebase = get_client()
 
-# Weather API (Open-Meteo) - Ho Chi Minh City coords
-LAT = os.getenv("LAT", "10.7769")
-LON = os.getenv("LON", "106.7009")
-WEATHER_URL = f"https://api.open-meteo.com/v1/forecast?latitude={LAT}&longitude={LON}&hourly=precipitation&timezone=Asia/Ho_Chi_Minh"
+# Online model state per sensor (features: t_rel seconds, rain mm), updated per new reading
+MODEL_PATH = os.getenv("MODEL_PATH", "models/online_weather_{sensor}.json")
+MODEL_FORGETTING = float(os.getenv("MODEL_FORGETTING", "1.0"))  # 1.0 = plain least squares
+models = None
 
-def fetch_weather():
-    """Fetch recent precipitation data from Open-Meteo API"""
-    try:
-        r = requests.get(WEATHER_URL, timeout=5)
+# Sliding-window training (TRAIN_WINDOW_SAMPLES / TRAIN_WINDOW_MINUTES): refit on
+# only the newest samples, held in a fixed-size ring buffer per sensor
+windows, WINDOW_SPAN_MS = window_from_env(SENSORS, n_extra=1)
+
+# Forecast curve: every FORECAST_STEP_MIN minutes out to FORECAST_HORIZON_MIN,
+# with FORECAST_INTERVAL prediction intervals
+FORECAST_STEP_MIN = int(os.getenv("FORECAST_STEP_MIN", "1"))
+FORECAST_HORIZON_MIN = int(os.getenv("FORECAST_HORIZON_MIN", "60"))
+HORIZONS = np.arange(FORECAST_STEP_MIN, FORECAST_HORIZON_MIN + 1, FORECAST_STEP_MIN)
+FORECAST_INTERVAL = 0.95
+FORECAST_Z = 1.96
+
+# How often to check the histories for rows appended by the ingestion daemon
+CONSUMER_POLL_SEC = float(os.getenv("CONSUMER_POLL_SEC", "1"))
+STAGE_STATS_SEC = float(os.getenv("STAGE_STATS_SEC", "60"))  # per-stage latency log period
+
+# Weather API (Open-Meteo), queried at each sensor's coordinates
+WEATHER_URL = os.getenv("WEATHER_URL", "https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&hourly=precipitation&timezone=Asia/Ho_Chi_Minh")
+
+def fetch_precipitation(lat, lon):
+    """Recent precipitation from the Open-Meteo API (raises on failure)"""
+    with metrics.upstream("open_meteo", "GET /v1/forecast"):
+        r = weather_session.get(WEATHER_URL.format(lat=lat, lon=lon), timeout=5)
         if r.status_code != 200:
-            print("[WEATHER] API error:", r.status_code)
-            return 0.0
-        data = r.json()
-        precip = data.get("hourly", {}).get("precipitation", [0])
-        # Sum last 3 hours of precipitation
-        total_rain = sum(precip[-3:]) if len(precip) >= 3 else sum(precip)
-        print(f"[WEATHER] Recent rainfall: {total_rain:.2f}mm")
-        return total_rain
-    except Exception as e:
-        print(f"[WEATHER] Error: {e}")
+            raise ValueError(f"HTTP {r.status_code}")
+    data = r.json()
+    precip = [p or 0.0 for p in data.get("hourly", {}).get("precipitation", [0])]
+    # Sum last 3 hours of precipitation
+    return sum(precip[-3:]) if len(precip) >= 3 else sum(precip)
+
+# The hourly series changes once an hour: fetch each location once per hour,
+# persisted across restarts, refreshed in the background, stale on errors
+weather_session = requests.Session()
+weather_cache = WeatherCache(fetch_precipitation)
+
+def fetch_weather(lat, lon):
+    """Recent rainfall at a location (mm), from the hourly weather cache"""
+    total_rain = weather_cache.get(lat, lon)
+    if total_rain is None:
+        print(f"[WEATHER] No rainfall data for ({lat}, {lon}) yet")
         return 0.0
+    print(f"[WEATHER] Recent rainfall at ({lat}, {lon}): {total_rain:.2f}mm")
+    return total_rain
 
-def fetch_latest():
-    """Fetch latest water level from Firebase"""
-    try:
-        r = requests.get(FIREBASE_SENSOR, timeout=5)
-        if r.status_code != 200:
-            return None
-        return r.json()
-    except Exception as e:
-        print(f"[SENSOR] Fetch error: {e}")
-        return None
+def fetch_rain():
+    """Rainfall per sensor; sensors sharing coordinates share one request"""
+    by_location = {}
+    rain = {}
+    for sid, sensor in SENSORS.items():
+        loc = (sensor.lat, sensor.lon)
+        if loc not in by_location:
+            by_location[loc] = fetch_weather(*loc)
+        rain[sid] = by_location[loc]
+    return rain
+
+def model_path(sensor_id):
+    return MODEL_PATH.format(sensor=sensor_id)
 
-def append_history(record):
-    """Append sensor data to local history CSV"""
-    if record is None:
+def training_rows(sensor_id, weather=0.0):
+    """First and last timestamp, design matrix [t_rel, rain] and targets
+    from a sensor's full history"""
+    cols = stores[sensor_id].read_arrays()
+    keep = ~np.isnan(cols["waterLevel"])
+    ts, y = cols["timestamp"][keep], cols["waterLevel"][keep]
+    if len(y) < 2:
         return None
+    t0 = int(ts[0])
+    X = np.column_stack([(ts - t0) / 1000.0, np.full(len(y), weather or 0.0)])
+    return t0, int(ts[-1]), X, y
 
-    df_new = pd.DataFrame([record])
-    df_new["timestamp"] = pd.to_numeric(df_new["timestamp"], errors="coerce")
+def train_models(sensor_ids, rain):
+    """Bootstrap the given sensors' models from their full history in one batched fit"""
+    rows, t0s = {}, {}
+    for sid in sensor_ids:
+        data = training_rows(sid, rain.get(sid))
+        if data is None:
+            print(f"[ML] {sid}: not enough data for model")
+            continue
+        t0, t_last, X, y = data
+        t0s[sid] = {"t0": t0, "t_last": t_last}
+        rows[sid] = (X, y)
+    if not rows:
+        return []
 
-    if os.path.exists(LOCAL_HISTORY):
-        try:
-            df_old = pd.read_csv(LOCAL_HISTORY)
-            df = pd.concat([df_old, df_new], ignore_index=True)
-        except Exception as e:
-            print(f"[CSV] Error reading: {e}")
-            df = df_new
+    models.fit(rows)
+    for sid, meta in t0s.items():
+        models.meta[models.index[sid]] = meta
+        models.save(sid, model_path(sid))
+    print(f"[ML] Bootstrapped {len(rows)} model(s) on "
+          f"{sum(len(y) for _, y in rows.values())} samples")
+    return list(rows)
+
+def update_window_models(readings, rain):
+    """Windowed mode: push new readings into the ring buffers in place and
+    refit the sensors that changed on their window, in one batched fit
+
+    The buffers are seeded from the tail of each sensor's history on first use.
+    """
+    global models
+    changed = np.zeros(len(windows), dtype=bool)
+    if models is None:
+        models = OnlineModelBank(SENSORS, 2, forgetting=MODEL_FORGETTING)
+        for sid in SENSORS:
+            cols = stores[sid].read_arrays()
+            keep = ~np.isnan(cols["waterLevel"])
+            ts = cols["timestamp"][keep][-windows.capacity:]
+            y = cols["waterLevel"][keep][-windows.capacity:]
+            windows.extend(sid, ts, y, np.full((len(y), 1), rain.get(sid) or 0.0))
+        changed[:] = True
     else:
-        df = df_new
-
-    # Validate timestamps (remove outliers)
-    now_ms = int(datetime.now().timestamp() * 1000)
-    df = df[(df["timestamp"] > 0) & (df["timestamp"] < now_ms + 3600_000)]
-    df.dropna(subset=["timestamp"], inplace=True)
-    df.sort_values("timestamp", inplace=True)
-    df.to_csv(LOCAL_HISTORY, index=False)
-    print(f"[CSV] Appended {len(df)} records")
-    return df
-
-def prepare_ts(df):
-    """Prepare time series data for ML"""
-    if len(df) < 2:
-        return None
+        ts = np.zeros(len(windows), dtype=np.int64)
+        y = np.zeros(len(windows))
+        extra = np.zeros((len(windows), 1))
+        for sid, record in readings.items():
+            i = windows.index[sid]
+            if record.get("waterLevel") is not None and unseen(sid, record):
+                ts[i], y[i], extra[i] = int(record["timestamp"]), record["waterLevel"], rain.get(sid) or 0.0
+                changed[i] = True
+        windows.push(ts, y, extra, mask=changed)
 
-    df = df.copy()
-    df["dt"] = pd.to_datetime(df["timestamp"], unit="ms", errors="coerce")
-    df.dropna(subset=["dt"], inplace=True)
+    rows = {}
+    for sid in [sid for sid, c in zip(windows.keys, changed) if c]:
+        ts, extra, y = windows.rows(sid, WINDOW_SPAN_MS)
+        if len(y) == 0:
+            continue
+        models.meta[models.index[sid]] = {"t0": int(ts[0]), "t_last": int(ts[-1])}
+        rows[sid] = (np.column_stack([(ts - ts[0]) / 1000.0, extra[:, 0]]), y)
+    if rows:
+        models.fit(rows)
+        print(f"[ML] Refit {len(rows)} model(s) on windows of up to {windows.capacity} samples")
+    return models
 
-    # Calculate relative time (seconds from first measurement)
-    t0 = df["timestamp"].iloc[0]
-    df["t_rel"] = (df["timestamp"] - t0) / 1000.0
-    return df
+def load_models():
+    """Create the model bank from the saved per-sensor states; returns
+    {sensor_id: timestamp of the last reading fitted} for loaded models"""
+    global models
+    models = OnlineModelBank(SENSORS, 2, forgetting=MODEL_FORGETTING)
+    return {sid: models.meta[models.index[sid]].get("t_last")
+            for sid in SENSORS if models.load(sid, model_path(sid))}
 
-def train_model(df, weather=None):
-    """Train Linear Regression with water level and optional weather feature"""
-    if len(df) < 2:
-        print("[ML] Not enough data for model")
-        return None
+def update_models(readings, rain):
+    """Update every sensor's online model with its new reading in one step
 
-    X = df[["t_rel"]].copy()
-    
-    # Add weather/precipitation as a feature if available
-    if weather is not None and weather > 0:
-        X["rain"] = weather
-        print(f"[ML] Training with weather feature: {weather:.2f}mm rain")
-    else:
-        print("[ML] Training with time-series feature only")
-    
-    y = df["waterLevel"].values
-    
-    try:
-        model = LinearRegression()
-        model.fit(X, y)
-        print(f"[ML] Model trained. Coefficients: {model.coef_}, Intercept: {model.intercept_:.2f}")
-        return model
-    except Exception as e:
-        print(f"[ML] Training error: {e}")
-        return None
+    Loads the saved model states on first use; sensors without one are
+    bootstrapped once from their full history.
+    """
+    global models
+    if windows is not None:
+        return update_window_models(readings, rain)
+    if models is None:
+        load_models()
 
-def forecast(model, df, minutes=10, weather=0.0):
-    """Make water level prediction for future time"""
-    if model is None:
-        return None
+    fresh = train_models([sid for sid in readings if models.n[models.index[sid]] == 0], rain)
+
+    x = np.zeros((len(models), 2))
+    y = np.zeros(len(models))
+    mask = np.zeros(len(models), dtype=bool)
+    for sid, record in readings.items():
+        i = models.index[sid]
+        level = record.get("waterLevel")
+        if (level is not None and models.n[i] > 0
+                and sid not in fresh and unseen(sid, record)):
+            x[i] = [t_rel(sid, int(record["timestamp"])), rain.get(sid) or 0.0]
+            y[i] = level
+            mask[i] = True
+            models.meta[i]["t_last"] = int(record["timestamp"])
+    if mask.any():
+        models.update(x, y, mask)
+        for sid in [sid for sid, updated in zip(models.keys, mask) if updated]:
+            models.save(sid, model_path(sid))
+        print(f"[ML] Updated {int(mask.sum())} model(s)")
+    return models
+
+def unseen(sensor_id, record):
+    """True if the sensor's model has not trained on this reading yet (rows
+    appended while it bootstrapped from history are already in its fit)"""
+    return int(record["timestamp"]) > models.meta[models.index[sensor_id]].get("t_last", -1)
+
+def t_rel(sensor_id, timestamp):
+    """Seconds since the sensor model's first training sample"""
+    return (timestamp - models.meta[models.index[sensor_id]]["t0"]) / 1000.0
+
+def forecast(readings, rain):
+    """Forecast curve for every ready sensor in one batched predict
+
+    Returns {sensor_id: (mean, half_width)} arrays over HORIZONS, assuming the
+    current rainfall persists; water level is clamped at 0.
+    """
+    ready = [sid for sid in readings if models.n[models.index[sid]] >= 2]
+    if not ready:
+        return {}
 
+    idx = np.array([models.index[sid] for sid in ready])
+    now = np.array([t_rel(sid, int(readings[sid]["timestamp"])) for sid in ready])
+    X = np.zeros((len(models), len(HORIZONS), 2))
+    X[idx, :, 0] = now[:, None] + HORIZONS * 60
+    X[idx, :, 1] = np.array([rain.get(sid) or 0.0 for sid in ready])[:, None]
     try:
-        last_t = df["t_rel"].iloc[-1]
-        future_t = last_t + minutes * 60
-        
-        # Check if model was trained with weather
-        if "rain" in model.feature_names_in_:
-            X_pred = [[future_t, weather]]
-        else:
-            X_pred = [[future_t]]
-        
-        pred = float(model.predict(X_pred)[0])
-        # Ensure water level doesn't go negative
-        return max(pred, 0.0)
+        mean, half = models.predict_interval(X, z=FORECAST_Z)
     except Exception as e:
         print(f"[ML] Forecast error: {e}")
-        return None
+        return {}
+    return {sid: (np.maximum(mean[i], 0.0), half[i]) for sid, i in zip(ready, idx)}
 
-def push_forecast(pred):
-    """Push ML prediction to Firebase"""
-    if pred is None:
-        return False
+def at(curve, minutes):
+    """Value of a forecast curve at any horizon (linear between steps)"""
+    return float(np.interp(minutes, HORIZONS, curve))
 
-    payload = {
-        "pred_10min": round(pred, 2),
-        "pred_30min": round(pred * 1.05, 2),  # rough estimate for 30 min
-        "timestamp": int(datetime.now().timestamp() * 1000),
-        "model": "LinearRegression",
-        "features": "time_series+weather"
+def forecast_payload(sensor_id, mean, half, now):
+    """Firebase forecast document: headline horizons plus the compact curve"""
+    lower = np.maximum(mean - half, 0.0)
+    upper = mean + half
+    return {
+        "pred_10min": round(at(mean, 10), 2),
+        "pred_30min": round(at(mean, 30), 2),
+        "timestamp": now,
+        "model": "OnlineLinearRegression",
+        "features": "time_series+weather",
+        "training_samples": int(models.n[models.index[sensor_id]]),
+        # curve[i] is the forecast (i + 1) * step_min minutes after timestamp;
+        # bounds are missing until there are enough samples for a variance
+        "curve": {
+            "step_min": FORECAST_STEP_MIN,
+            "interval": FORECAST_INTERVAL,
+            "mean": np.round(mean, 1).tolist(),
+            "lower": None if np.isnan(half).any() else np.round(lower, 1).tolist(),
+            "upper": None if np.isnan(half).any() else np.round(upper, 1).tolist(),
+        },
     }
+
+def push_forecasts(preds):
+    """Push each sensor's forecast curve to its own forecast path
+
+    With the default Firebase layout all sensors go out in one PATCH of the
+    forecast/ node, which replaces each sensor's child. Returns True if
+    every write succeeded.
+    """
+    if not preds:
+        return False
+
+    now = int(datetime.now().timestamp() * 1000)
+    payloads = {sid: forecast_payload(sid, mean, half, now) for sid, (mean, half) in preds.items()}
     try:
-        r = requests.put(FIREBASE_FORECAST, json=payload, timeout=5)
-        if r.status_code == 200:
-            print(f"[FIREBASE] Forecast pushed: {payload}")
-            return True
+        url = batch_url(SENSORS, "forecast")
+        if url:
+            responses = [firebase.patch(url, json=payloads, timeout=10)]
+        else:
+            responses = [firebase.put(SENSORS[sid].forecast_url, json=p, timeout=5)
+                         for sid, p in payloads.items()]
+        failed = [r for r in responses if not r.ok]
+        if failed:
+            print(f"[FIREBASE] Push failed: HTTP {failed[0].status_code} ({len(failed)} request(s))")
+            return False
+        print(f"[FIREBASE] Forecasts pushed for {len(payloads)} sensor(s)")
+        return True
     except Exception as e:
         print(f"[FIREBASE] Push error: {e}")
     return False
 
-def pipeline():
-    """Main ML pipeline: fetch → train → forecast → push"""
-    print("\n" + "="*60)
-    print(f"[PIPELINE] Starting at {datetime.now().isoformat()}")
-    print("="*60)
+# Pipeline stages, run one after another by pipeline() or overlapped across
+# rounds by the PipelineRunner in __main__
 
-    # 1. Fetch latest data
-    latest = fetch_latest()
-    if not latest:
-        print("[PIPELINE] No sensor data available")
-        return
+def weather_stage(readings):
+    """Attach the rainfall context to a round of new readings"""
+    if not readings:
+        return None
+    return readings, fetch_rain()
 
-    # 2. Append to history
-    df = append_history(latest)
-    if df is None or len(df) < 2:
+def model_stage(item):
+    """Update the models with a round of readings and forecast every sensor"""
+    readings, rain = item
+    update_models(readings, rain)
+    preds = forecast(readings, rain)
+    if not preds:
         print("[PIPELINE] Insufficient history data")
-        return
-
-    # 3. Prepare time series
-    df_ts = prepare_ts(df)
-    if df_ts is None:
-        print("[PIPELINE] Time series preparation failed")
-        return
-
-    # 4. Fetch weather context
-    rain = fetch_weather()
+        return None
 
-    # 5. Train model
-    model = train_model(df_ts, weather=rain)
-    if model is None:
-        print("[PIPELINE] Model training failed")
-        return
+    print("\n[SUMMARY]")
+    for sid, (mean, half) in preds.items():
+        print(f"  {sid}: current {readings[sid]['waterLevel']:.2f} mm, "
+              f"10-min {at(mean, 10):.2f} ± {at(half, 10):.2f} mm, "
+              f"{HORIZONS[-1]}-min {mean[-1]:.2f} ± {half[-1]:.2f} mm, "
+              f"rain {rain.get(sid, 0.0):.2f} mm, samples {models.n[models.index[sid]]}")
+    return preds
 
-    # 6. Make predictions
-    pred_10min = forecast(model, df_ts, minutes=10, weather=rain)
-    pred_30min = forecast(model, df_ts, minutes=30, weather=rain*0.5)
+def pipeline(readings):
+    """Main ML pipeline: weather → train → forecast → push, for one round of
+    readings the ingestion daemon just appended to the histories"""
+    print("\n" + "="*60)
+    print(f"[PIPELINE] Starting at {datetime.now().isoformat()}")
+    print("="*60)
 
-    if pred_10min is None:
-        print("[PIPELINE] Forecast failed")
+    item = weather_stage(readings)
+    if item is None:
+        print("[PIPELINE] No sensor data available")
         return
-
-    # 7. Push to Firebase
-    push_forecast(pred_10min)
-
-    # 8. Log summary
-    print("\n[SUMMARY]")
-    print(f"  Current water level: {latest['waterLevel']:.2f} mm")
-    print(f"  10-min forecast: {pred_10min:.2f} mm")
-    if pred_30min:
-        print(f"  30-min forecast: {pred_30min:.2f} mm")
-    print(f"  Recent rainfall: {rain:.2f} mm")
-    print(f"  Data points in history: {len(df)}")
+    preds = model_stage(item)
+    if preds is not None:
+        push_forecasts(preds)
     print("="*60)
 
 if __name__ == "__main__":
-    print("Starting ML Forecast Pipeline with Weather Integration")
-    print("Fetching every 5 seconds...")
-    
-    while True:
-        try:
-            pipeline()
-        except Exception as e:
-            print(f"[ERROR] Unexpected error: {e}")
-        
-        time.sleep(5)
+    print(f"Starting ML Forecast Pipeline with Weather Integration for {len(SENSORS)} sensor(s)")
+    weather_cache.start_refresher()
+    print(f"Following history written by the ingestion daemon every {CONSUMER_POLL_SEC}s...")
+    # Pushes that back up behind a slow Firebase are merged per sensor
+    runner = PipelineRunner([("weather", weather_stage), ("model", model_stage), ("push", push_forecasts)],
+                            merge={"push": merge_by_key}, stats_interval=STAGE_STATS_SEC,
+                            metrics=metrics)
+    if METRICS_PORT:
+        serve_metrics(METRICS_PORT)
+    # Resume after the last reading the saved models were fitted on, so rows
+    # ingested while this process was down are fitted too
+    since = load_models() if windows is None else None
+    runner.add_source("follow", CONSUMER_POLL_SEC, HistoryFollower(stores, since).poll, many=True)
+    runner.run()
@@ -0,0 +1,58 @@
+"""Shared setup: import paths for floodsense/ and the bench stand-ins,
+per-run scratch locations for the SQLite files the modules create, and the
+backend app wired to the stand-ins."""
+import json
+import os
+import socket
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+_scratch = tempfile.mkdtemp(prefix="floodsense-tests-")
+os.environ.setdefault("METRICS_DIR", _scratch)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def backend():
+    """backend/app.py imported against local Firebase and OpenAI stand-ins,
+    with its SQLite files and columnar history in a scratch directory"""
+    import fake_firebase
+    import fake_openai
+
+    firebase = fake_firebase.serve(free_port(), latency=0)
+    openai = fake_openai.serve(free_port(), latency=0, token_delay=0)
+    firebase_url = f"http://127.0.0.1:{firebase.server_address[1]}"
+    tmp = tempfile.mkdtemp(prefix="floodsense-backend-", dir=_scratch)
+    sensors_file = os.path.join(tmp, "sensors.json")
+    with open(sensors_file, "w", encoding="utf-8") as f:
+        json.dump({"sensors": [{
+            "id": "sensor1",
+            "sensor_url": f"{firebase_url}/water_level/sensor1.json",
+            "forecast_url": f"{firebase_url}/forecast/sensor1.json",
+            "config_url": f"{firebase_url}/config/sensor1.json",
+            "commands_url": f"{firebase_url}/commands/sensor1.json",
+        }]}, f)
+    os.environ.update(
+        SENSORS_FILE=sensors_file,
+        OPENAI_API_KEY="test",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{openai.server_address[1]}/v1",
+        CACHE_DB=os.path.join(tmp, "cache.sqlite"),
+        CONVERSATION_DB=os.path.join(tmp, "conversations.sqlite"),
+        HISTORY_COLUMNS_DIR=os.path.join(tmp, "history_columns"))
+    sys.path.insert(0, os.path.join(ROOT, "backend"))
+    import app
+
+    yield app
+    firebase.shutdown()
+    openai.shutdown()
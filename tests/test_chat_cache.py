@@ -0,0 +1,30 @@
+import uuid
+
+
+def ask(backend, message):
+    r = backend.app.test_client().post("/chat", json={"message": message},
+                                       headers={"X-Session-Id": uuid.uuid4().hex})
+    assert r.status_code == 200
+    return r.get_json()
+
+
+def test_first_questions_are_answered_from_the_cache(backend):
+    message = f"Sẽ ngập không? {uuid.uuid4().hex}"
+    assert "cached" not in ask(backend, message)
+    assert ask(backend, message)["cached"] is True
+
+
+def test_answers_without_sensor_or_forecast_data_are_not_cached(backend, monkeypatch):
+    gather = backend.gather_upstream
+
+    def without(name):
+        def fake(fetchers, deadline=None):
+            data, missing = gather(fetchers, deadline)
+            return dict(data, **{name: None}), missing + [name]
+        return fake
+
+    for name in ("sensor", "forecast"):
+        monkeypatch.setattr(backend, "gather_upstream", without(name))
+        message = f"Sẽ ngập không? {uuid.uuid4().hex}"
+        assert "cached" not in ask(backend, message)
+        assert "cached" not in ask(backend, message)
@@ -0,0 +1,33 @@
+import json
+import uuid
+
+
+def sse_events(text):
+    """[(event, data)] of an SSE body"""
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        events.append((fields.get("event"), json.loads(fields["data"])))
+    return events
+
+
+def test_streamed_chat_relays_deltas_and_records_the_turn(backend):
+    session = f"test-{uuid.uuid4().hex}"
+    message = f"Mực nước hiện tại bao nhiêu? #{session}"
+    r = backend.app.test_client().post("/chat", json={"message": message, "stream": True},
+                                       headers={"X-Session-Id": session})
+    assert r.status_code == 200
+    assert r.mimetype == "text/event-stream"
+
+    events = sse_events(r.get_data(as_text=True))
+    names = [name for name, _ in events]
+    assert names[-1] == "done" and set(names[:-1]) == {"delta"} and len(names) > 2
+    reply = "".join(data["text"] for _, data in events[:-1])
+    done = events[-1][1]
+    assert done["status"] == "success" and done["reply"] == reply
+    assert done["prompt_tokens"] == int(r.headers["X-Prompt-Tokens"])
+
+    assert backend.conversations.get(session) == [
+        {"role": "user", "content": message},
+        {"role": "assistant", "content": reply},
+    ]
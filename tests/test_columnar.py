@@ -0,0 +1,19 @@
+import time
+
+from floodsense.columnar import ColumnarHistory, convert
+from floodsense.history import HistoryStore
+
+
+def test_convert_leaves_late_rows_in_the_csv_store(tmp_path):
+    path = str(tmp_path / "history.csv")
+    store = HistoryStore(path)
+    t0 = int(time.time() * 1000) - 60_000
+    for i in range(4):
+        store.append({"timestamp": t0 + i * 5000, "waterLevel": 100 + i, "distance": 40})
+    store.append({"timestamp": t0 + 2500, "waterLevel": 99, "distance": 40})  # late
+    assert len(store.late_rows()) == 1
+
+    out = str(tmp_path / "history_columns")
+    assert convert(path, out) == 4
+    cols = ColumnarHistory(out, read_only=True).query()
+    assert cols["timestamp"].tolist() == [t0, t0 + 5000, t0 + 10_000, t0 + 15_000]
@@ -0,0 +1,50 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from conftest import free_port
+from floodsense.firebase import FirebaseClient
+
+
+class CountingServer(ThreadingHTTPServer):
+    """HTTP/1.1 keep-alive server counting the TCP connections it accepts"""
+
+    daemon_threads = True
+
+    def __init__(self, address, handler):
+        super().__init__(address, handler)
+        self.connections = 0
+
+    def get_request(self):
+        conn = super().get_request()
+        self.connections += 1
+        return conn
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"waterLevel": 120.0}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_sequential_gets_reuse_one_connection():
+    server = CountingServer(("127.0.0.1", free_port()), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = FirebaseClient(retries=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/water_level/sensor1.json"
+        for _ in range(20):
+            r = client.get(url, timeout=5)
+            assert r.json() == {"waterLevel": 120.0}
+        assert server.connections == 1
+    finally:
+        client.close()
+        server.shutdown()
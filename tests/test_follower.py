@@ -0,0 +1,68 @@
+import time
+
+from floodsense.columnar import ColumnarHistory
+from floodsense.history import HistoryStore
+from floodsense.ingest import HistoryFollower
+
+
+def reading(ts, level):
+    return {"timestamp": ts, "waterLevel": level, "distance": 50 - level / 10}
+
+
+def test_replays_rows_after_since_then_follows(tmp_path):
+    path = str(tmp_path / "history.csv")
+    writer = HistoryStore(path)
+    t0 = int(time.time() * 1000) - 60_000
+    for i in range(5):
+        assert writer.append(reading(t0 + i * 5000, 100 + i))
+
+    # The model last saw the third row; the two after it were ingested while down
+    follower = HistoryFollower({"sensor1": HistoryStore(path)}, since={"sensor1": t0 + 10_000})
+    rounds = follower.poll()
+    assert [r["sensor1"]["timestamp"] for r in rounds] == [t0 + 15_000, t0 + 20_000]
+
+    writer.append(reading(t0 + 25_000, 105))
+    rounds = follower.poll()
+    assert [r["sensor1"]["waterLevel"] for r in rounds] == [105]
+
+
+def test_without_since_existing_rows_are_skipped(tmp_path):
+    path = str(tmp_path / "history.csv")
+    writer = HistoryStore(path)
+    t0 = int(time.time() * 1000) - 60_000
+    writer.append(reading(t0, 100))
+    follower = HistoryFollower({"sensor1": HistoryStore(path)})
+    assert follower.poll() == []
+
+
+def test_read_only_columns_are_not_created(tmp_path):
+    columns = ColumnarHistory(str(tmp_path / "history_columns"), read_only=True)
+    assert len(columns) == 0 and columns.last_timestamp() is None
+    assert not (tmp_path / "history_columns").exists()
+
+
+def test_sensor_clock_reset_starts_a_new_epoch_the_follower_sees(tmp_path):
+    path = str(tmp_path / "history.csv")
+    writer = HistoryStore(path)
+    t0 = int(time.time() * 1000) - 60_000
+    for i in range(3):
+        writer.append(reading(t0 + i * 5000, 100 + i))
+    follower = HistoryFollower({"sensor1": HistoryStore(path)})
+
+    # The Arduino rebooted: millis() starts again near zero
+    assert writer.append(reading(12_000, 110)) == "appended"
+    assert writer.append(reading(17_000, 111)) == "appended"
+    assert writer.append(reading(17_000, 111)) == "duplicate"  # polled again
+    rounds = follower.poll()
+    ts = [r["sensor1"]["timestamp"] for r in rounds]
+    assert [r["sensor1"]["waterLevel"] for r in rounds] == [110, 111]
+    assert t0 + 10_000 < ts[0] and ts[1] - ts[0] == 5000
+    assert len(writer.late_rows()) == 0
+
+    # A restarted writer keeps the epoch
+    assert HistoryStore(path).append(reading(22_000, 112)) == "appended"
+    assert [r["sensor1"]["timestamp"] for r in follower.poll()] == [ts[1] + 5000]
+
+    # Small steps back are still late rows, not resets
+    assert writer.append(reading(14_000, 109)) == "appended"
+    assert len(writer.late_rows()) == 1
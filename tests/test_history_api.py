@@ -0,0 +1,9 @@
+def test_downsample_cache_hit_skips_the_range_query(backend, monkeypatch):
+    calls = []
+    query = backend.query_history
+    monkeypatch.setattr(backend, "query_history", lambda *a: calls.append(a) or query(*a))
+
+    first = backend.downsampled_history("sensor1", None, None, 100, "lttb")
+    second = backend.downsampled_history("sensor1", None, None, 100, "lttb")
+    assert second is first
+    assert len(calls) == 1
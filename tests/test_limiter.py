@@ -0,0 +1,28 @@
+import pytest
+
+from floodsense.limiter import reserved_threads, thread_budget
+
+
+def test_default_worker_keeps_a_quarter_for_fast_routes():
+    assert reserved_threads(32) == 8
+    assert thread_budget(32, 8) == (4, 4, 16)
+
+
+def test_configured_limits_are_lowered_to_fit_the_shared_threads():
+    chat_limit, chat_queue, streams = thread_budget(32, 8, 16, 16, 24)
+    assert chat_limit + chat_queue + streams == 24
+    assert streams >= 1
+
+
+@pytest.mark.parametrize("threads", [4, 5, 6, 8])
+def test_small_worker_never_hands_out_reserved_threads(threads):
+    reserved = reserved_threads(threads)
+    assert reserved >= 1
+    assert sum(thread_budget(threads, reserved)) <= threads - reserved
+
+
+def test_reserve_leaving_too_few_threads_is_an_error():
+    with pytest.raises(ValueError):
+        thread_budget(4, 4)
+    with pytest.raises(ValueError):
+        thread_budget(6, 4)
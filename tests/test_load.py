@@ -0,0 +1,73 @@
+"""Water-status latency while chat and stream clients saturate their limits,
+against a real gunicorn worker (bench/run.py's setup)."""
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+
+import fake_firebase
+import fake_openai
+import run as bench
+from conftest import free_port
+from floodsense.limiter import thread_budget
+
+
+def test_water_status_holds_under_a_chat_burst():
+    threads = 8
+    chat_limit, chat_queue, stream_clients = thread_budget(threads, 4)
+    tmp = tempfile.mkdtemp(prefix="floodsense-load-")
+    firebase = fake_firebase.serve(free_port(), latency=0)
+    openai = fake_openai.serve(free_port(), latency=1.5, token_delay=0)
+    args = argparse.Namespace(workers=1, threads=threads)
+    proc = None
+    streams = []
+    try:
+        proc, base = bench.start_backend(
+            args, tmp, f"http://127.0.0.1:{firebase.server_address[1]}",
+            f"http://127.0.0.1:{openai.server_address[1]}/v1")
+
+        # Dashboards hold their stream threads for the whole test; those
+        # beyond the cap are turned away instead of taking a thread
+        for _ in range(stream_clients + 2):
+            r = requests.get(f"{base}/api/stream", stream=True, timeout=10)
+            streams.append(r)
+        assert sorted(r.status_code for r in streams) == [200] * stream_clients + [503, 503]
+
+        chat_status = []
+
+        def ask():
+            r = requests.post(f"{base}/chat", timeout=30,
+                              json={"message": f"Sẽ ngập không? {uuid.uuid4().hex}"},
+                              headers={"X-Session-Id": uuid.uuid4().hex})
+            chat_status.append(r.status_code)
+
+        burst = [threading.Thread(target=ask) for _ in range(4 * threads)]
+        for t in burst:
+            t.start()
+        time.sleep(0.3)  # let the burst take its threads
+
+        latencies = []
+        while any(t.is_alive() for t in burst):
+            began = time.perf_counter()
+            assert requests.get(f"{base}/api/water-status", timeout=10).status_code == 200
+            latencies.append(time.perf_counter() - began)
+        for t in burst:
+            t.join()
+
+        assert chat_status.count(200) >= chat_limit + chat_queue
+        assert chat_status.count(429) > 0
+        assert len(latencies) >= 10
+        assert max(latencies) < 0.5, f"water-status took {max(latencies):.2f}s under the chat burst"
+    finally:
+        for r in streams:
+            r.close()
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=15)
+        firebase.shutdown()
+        openai.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
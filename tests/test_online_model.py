@@ -0,0 +1,57 @@
+import numpy as np
+
+from floodsense.online_model import OnlineModelBank
+
+
+def lstsq_predict(X, y, X_new, forgetting=1.0):
+    """Reference: weighted least squares with an intercept column via lstsq"""
+    w = forgetting ** np.arange(len(y) - 1, -1, -1, dtype=float)
+    A = np.column_stack([np.ones(len(y)), X]) * np.sqrt(w)[:, None]
+    beta = np.linalg.lstsq(A, y * np.sqrt(w), rcond=None)[0]
+    return np.column_stack([np.ones(len(X_new)), X_new]) @ beta
+
+
+def window(n, rain, seed):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) * 5.0  # seconds since the window's first reading
+    X = np.column_stack([t, np.full(n, rain) if np.isscalar(rain) else rain])
+    y = 120 + 0.03 * t + 2.0 * X[:, 1] + rng.normal(0, 0.5, n)
+    return X, y
+
+
+def test_bank_matches_lstsq_with_forgetting():
+    rng = np.random.default_rng(0)
+    rows = {"a": window(240, rng.uniform(0, 8, 240), 1), "b": window(60, rng.uniform(0, 3, 60), 2)}
+    for forgetting in (1.0, 0.98):
+        bank = OnlineModelBank(rows, 2, forgetting=forgetting).fit(rows)
+        X_new = np.zeros((2, 5, 2))
+        for i, (X, _) in enumerate(rows.values()):
+            X_new[i, :, 0] = X[-1, 0] + np.arange(1, 6) * 60
+            X_new[i, :, 1] = [0.0, 1.0, 2.5, 4.0, 8.0]
+        pred = bank.predict(X_new)
+        for i, (X, y) in enumerate(rows.values()):
+            np.testing.assert_allclose(pred[i], lstsq_predict(X, y, X_new[i], forgetting), rtol=1e-9)
+
+
+def test_online_updates_match_lstsq_on_the_same_rows():
+    X, y = window(200, np.random.default_rng(3).uniform(0, 5, 200), 4)
+    bank = OnlineModelBank(["s"], 2, forgetting=0.99).fit({"s": (X[:50], y[:50])})
+    for x_i, y_i in zip(X[50:], y[50:]):
+        bank.update(x_i[None, :], [y_i])
+    X_new = np.array([[X[-1, 0] + 600, 1.0], [X[-1, 0] + 1800, 3.0]])
+    np.testing.assert_allclose(bank.predict(X_new[None])[0], lstsq_predict(X, y, X_new, 0.99), rtol=1e-9)
+
+
+def test_constant_rain_is_rank_deficient_but_predicts_like_lstsq():
+    # rain == 0 for the whole window: the rain column is collinear with the
+    # intercept, so only predictions at the same rain are determined
+    X, y = window(120, 0.0, 5)
+    assert np.linalg.matrix_rank(np.column_stack([np.ones(len(y)), X])) == 2
+    for forgetting in (1.0, 0.97):
+        bank = OnlineModelBank(["s"], 2, forgetting=forgetting).fit({"s": (X, y)})
+        X_new = np.column_stack([X[-1, 0] + np.arange(1, 13) * 300.0, np.zeros(12)])
+        np.testing.assert_allclose(bank.predict(X_new[None])[0],
+                                   lstsq_predict(X, y, X_new, forgetting), rtol=1e-9)
+        assert np.all(np.isfinite(bank.coef_)) and bank.coef_[0, 1] == 0.0
+        mean, half = bank.predict_interval(X_new[None])
+        assert np.all(np.isfinite(half)) and np.all(half > 0)
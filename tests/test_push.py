@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+import requests
+
+import ml_forecast
+import ml_forecast_weather
+
+
+class StubFirebase:
+    """Answers every write with the given HTTP status"""
+
+    def __init__(self, status):
+        self.status = status
+        self.calls = 0
+
+    def _reply(self, url, **kwargs):
+        self.calls += 1
+        r = requests.Response()
+        r.status_code = self.status
+        return r
+
+    patch = put = _reply
+
+
+@pytest.mark.parametrize("script", [ml_forecast, ml_forecast_weather])
+@pytest.mark.parametrize("status, ok", [(200, True), (401, False), (503, False)])
+def test_push_reports_whether_firebase_accepted_the_write(script, status, ok, monkeypatch):
+    firebase = StubFirebase(status)
+    monkeypatch.setattr(script, "firebase", firebase)
+    monkeypatch.setattr(script, "models", None)
+    script.load_models()
+    mean = np.linspace(120, 140, len(script.HORIZONS))
+    preds = {sid: (mean, np.full_like(mean, 2.0)) for sid in script.SENSORS}
+    assert script.push_forecasts(preds) is ok
+    assert firebase.calls >= 1
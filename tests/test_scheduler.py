@@ -0,0 +1,42 @@
+import asyncio
+import threading
+
+from floodsense.scheduler import PipelineRunner, merge_by_key
+
+
+def test_backed_up_pushes_keep_every_sensors_newest_forecast():
+    rounds = [{"sensor1": 1}, {"sensor2": 1}, {"sensor1": 2}, {"sensor3": 1},
+              {"sensor2": 2}, {"sensor1": 3}, {"sensor4": 1}]
+    produced = threading.Event()
+    pushed = []
+
+    def produce():
+        if rounds:
+            item = rounds.pop(0)
+            if not rounds:
+                produced.set()
+            return [item]
+        return []
+
+    def push(preds):
+        produced.wait(5)  # a slow upstream: everything queues behind the first push
+        pushed.append(preds)
+
+    runner = PipelineRunner([("push", push)], queue_size=2, merge={"push": merge_by_key},
+                            stats_interval=0, log=lambda msg: None)
+    runner.add_source("follow", 0.01, produce, many=True)
+
+    async def run():
+        task = asyncio.create_task(runner.run_async())
+        while not (produced.is_set() and runner._queues[0].empty() and len(pushed) > 1):
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.2)  # let the last push finish
+        task.cancel()
+
+    asyncio.run(asyncio.wait_for(run(), 10))
+    latest = {}
+    for preds in pushed:
+        latest.update(preds)
+    assert latest == {"sensor1": 3, "sensor2": 2, "sensor3": 1, "sensor4": 1}
+    assert runner.counters["push"]["merged"] > 0
+    assert runner.counters["push"]["dropped"] == 0
@@ -0,0 +1,35 @@
+import math
+import time
+
+from floodsense.history import HistoryStore
+from floodsense.stats import HistoryStats, WindowStats
+
+
+def test_window_average_does_not_drift():
+    window = WindowStats(span_ms=4 * 5000)
+    values = [0.1, 0.7, 5.3, 1e6, 0.3] * 200
+    for i, value in enumerate(values):
+        window.push(i * 5000, value)
+        kept = values[max(0, i - 4):i + 1]
+        assert window.snapshot()["avg"] == math.fsum(kept) / len(kept)
+    for i in range(len(values), len(values) + 5):
+        window.push(i * 5000, 5.0)
+    assert window.snapshot() == {"min": 5.0, "max": 5.0, "avg": 5.0, "records": 5}
+
+
+def test_windows_include_late_rows_like_the_history_range(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.csv"))
+    t0 = int(time.time() * 1000) - 7200_000
+    for i in range(0, 7200_000, 60_000):  # two hours, one reading a minute
+        store.append({"timestamp": t0 + i, "waterLevel": 100 + (i // 60_000) % 7, "distance": 40})
+    newest = t0 + 7200_000 - 60_000
+    store.append({"timestamp": newest - 10 * 60_000 + 30_000, "waterLevel": 500, "distance": 40})
+    store.append({"timestamp": newest - 50 * 60_000 + 30_000, "waterLevel": 1, "distance": 40})
+    assert len(store.late_rows()) == 2
+
+    stats = HistoryStats(store, windows={"30m": 1800_000}).snapshot()
+    rows = store.read_arrays(newest - 1800_000, newest)["waterLevel"]  # late rows merged, as /api/history
+    assert 500 in rows and 1 not in rows
+    assert stats["windows"]["30m"] == {"min": rows.min(), "max": 500.0,
+                                       "avg": math.fsum(rows) / len(rows), "records": len(rows)}
+    assert stats["min"] == 1.0 and stats["max"] == 500.0
@@ -0,0 +1,40 @@
+import threading
+import time
+
+import requests
+
+import fake_firebase
+from conftest import free_port
+from floodsense.firebase import FirebaseClient
+from floodsense.stream import FirebaseStream
+
+
+def test_small_events_arrive_without_buffering():
+    server = fake_firebase.serve(free_port(), latency=0)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    records = []
+    got = threading.Event()
+
+    def on_record(value):
+        records.append((time.perf_counter(), value))
+        got.set()
+
+    stream = FirebaseStream(f"{base}/water_level/sensor1.json", on_record,
+                            client=FirebaseClient(retries=0), log=lambda msg: None)
+    stream.start()
+    try:
+        assert got.wait(5), "no initial snapshot"
+        assert records[0][1]["waterLevel"] is not None
+
+        # A patch event is far smaller than requests' default 512-byte read
+        got.clear()
+        sent = time.perf_counter()
+        requests.patch(f"{base}/water_level/sensor1.json", json={"waterLevel": 187.5}, timeout=5)
+        assert got.wait(2), "patch event not delivered"
+        arrived, value = records[-1]
+        assert value["waterLevel"] == 187.5
+        assert value["distance"] == 38.0  # merged into the local copy
+        assert arrived - sent < 0.5
+    finally:
+        stream.stop()
+        server.shutdown()
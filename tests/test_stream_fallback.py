@@ -0,0 +1,96 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+
+import pytest
+
+from conftest import ROOT
+
+FRONTEND = os.path.join(ROOT, "frontend")
+
+# Runs a page's scripts under node with a fake EventSource, timers and fetch;
+# the scenario refuses the stream like a capped backend, then lets it open
+HARNESS = r"""
+const vm = require('vm');
+const [scriptsJson] = process.argv.slice(1);
+const log = {fetches: [], timeouts: [], intervals: 0, cleared: 0, streams: 0};
+const elements = {};
+class FakeEventSource {
+  constructor(url) { this.url = url; this.readyState = 0; this.listeners = {}; log.streams++;
+                     FakeEventSource.last = this; }
+  addEventListener(name, fn) { this.listeners[name] = fn; }
+  close() { this.readyState = 2; }
+}
+FakeEventSource.CLOSED = 2;
+const timers = [];
+const sandbox = {
+  console, JSON, Math, Promise,
+  EventSource: FakeEventSource,
+  window: {},
+  document: {getElementById: (id) => (elements[id] = elements[id] || {textContent: ''})},
+  fetch: (url) => { log.fetches.push(url); return Promise.resolve({
+    ok: true, json: () => Promise.resolve({sensor: {waterLevel: 187.5, distance: 38}})}); },
+  setInterval: (fn, ms) => { log.intervals++; return 1; },
+  clearInterval: () => { log.cleared++; },
+  setTimeout: (fn, ms) => { log.timeouts.push(ms); timers.push(fn); return 2; },
+};
+sandbox.window.EventSource = FakeEventSource;
+vm.createContext(sandbox);
+for (const code of JSON.parse(scriptsJson)) vm.runInContext(code, sandbox);
+
+(async () => {
+  const refuse = () => { FakeEventSource.last.readyState = 2; FakeEventSource.last.onerror(); };
+  refuse();                      // 503: closed for good
+  await new Promise((r) => setImmediate(r));
+  log.afterRefusal = {fetches: log.fetches.length, text: elements['water-level'].textContent};
+  timers.shift()();              // retry after the backoff: refused again
+  refuse();
+  timers.shift()();              // next retry opens
+  FakeEventSource.last.onopen();
+  FakeEventSource.last.listeners.update({data: JSON.stringify({sensor: {waterLevel: 190, distance: 37}})});
+  log.afterOpen = {text: elements['water-level'].textContent};
+  console.log(JSON.stringify(log));
+})();
+"""
+
+
+def page_scripts(name):
+    """Code of a page's local scripts, in order (src'd files are read from frontend/)"""
+    with open(os.path.join(FRONTEND, name), encoding="utf-8") as f:
+        html = f.read()
+    scripts = []
+    for src, body in re.findall(r'<script(?: src="([^"]+)")?>(.*?)</script>', html, re.S):
+        if src.startswith("http"):
+            continue
+        if src:
+            with open(os.path.join(FRONTEND, src), encoding="utf-8") as f:
+                body = f.read()
+        scripts.append(body)
+    return scripts
+
+
+def test_capped_stream_is_refused_with_retry_after(backend, monkeypatch):
+    monkeypatch.setattr(backend, "STREAM_MAX_CLIENTS", 0)
+    r = backend.app.test_client().get("/api/stream")
+    assert r.status_code == 503
+    assert int(r.headers["Retry-After"]) > 0
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_page_polls_while_the_stream_is_refused_and_retries_with_backoff():
+    out = subprocess.run(["node", "-e", HARNESS, "--", json.dumps(page_scripts("thongbao.html"))],
+                         capture_output=True, text=True, timeout=30)
+    assert out.returncode == 0, out.stderr
+    log = json.loads(out.stdout.strip().splitlines()[-1])
+
+    # Refused: polling starts at once and shows the polled reading
+    assert log["afterRefusal"]["fetches"] == 1 and log["fetches"][0] == "/api/water-status"
+    assert log["afterRefusal"]["text"] == 187.5
+    assert log["intervals"] == 1  # a second refusal does not start a second poller
+    # The stream is retried with backoff, and polling stops once it opens
+    assert log["timeouts"] == [5000, 10000]
+    assert log["streams"] == 3
+    assert log["cleared"] == 1
+    assert log["afterOpen"]["text"] == 190
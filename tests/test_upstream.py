@@ -0,0 +1,41 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def test_fetches_that_miss_the_deadline_are_cancelled(backend, monkeypatch):
+    monkeypatch.setattr(backend, "upstream_pool", ThreadPoolExecutor(max_workers=1))
+    release = threading.Event()
+    ran = []
+
+    def slow():
+        release.wait(5)
+        return "slow"
+
+    results, missing = backend.gather_upstream(
+        {"slow": slow, "queued": lambda: ran.append("queued")}, deadline=0.1)
+    assert results == {"slow": None, "queued": None}
+    assert missing == ["slow", "queued"]
+    release.set()
+    backend.upstream_pool.shutdown(wait=True)
+    assert ran == []  # queued behind the slow fetch and cancelled, never run
+
+
+def test_a_saturated_pool_fails_fast(backend, monkeypatch):
+    monkeypatch.setattr(backend, "upstream_slots", threading.BoundedSemaphore(1))
+    release = threading.Event()
+    backend.gather_upstream({"slow": lambda: release.wait(5)}, deadline=0.05)
+
+    began = time.perf_counter()
+    results, missing = backend.gather_upstream({"sensor": lambda: 1}, deadline=5)
+    assert time.perf_counter() - began < 1
+    assert results == {"sensor": None} and missing == ["sensor"]
+
+    release.set()  # the slow fetch finishes and frees its slot
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        results, missing = backend.gather_upstream({"sensor": lambda: 1}, deadline=5)
+        if results == {"sensor": 1}:
+            break
+        time.sleep(0.01)
+    assert results == {"sensor": 1} and missing == []
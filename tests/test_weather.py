@@ -0,0 +1,81 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from conftest import free_port
+from floodsense.weather import HOUR, WeatherCache
+
+
+class OpenMeteo(ThreadingHTTPServer):
+    """Open-Meteo stand-in counting the forecast requests it answers"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", free_port()), OpenMeteoHandler)
+        self.calls = 0
+        self.status = 200
+
+
+class OpenMeteoHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.calls += 1
+        body = json.dumps({"hourly": {"precipitation": [0.0, 1.5, 2.0, 0.5]}}).encode()
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_cache(tmp_path, server, clock):
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/forecast?latitude={{lat}}&longitude={{lon}}"
+
+    def fetch(lat, lon):
+        r = requests.get(url.format(lat=lat, lon=lon), timeout=5)
+        r.raise_for_status()
+        return sum(r.json()["hourly"]["precipitation"][-3:])
+
+    return WeatherCache(fetch, path=str(tmp_path / "weather_cache.json"),
+                        refresh_delay=120, retry_sec=60, clock=lambda: clock[0])
+
+
+def test_an_hour_of_ticks_fetches_at_most_twice(tmp_path):
+    server = OpenMeteo()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    clock = [1_700_000_000 // HOUR * HOUR + HOUR / 2]  # half past, so the hour rolls over
+    cache = make_cache(tmp_path, server, clock)
+    try:
+        end = clock[0] + HOUR
+        while clock[0] < end:  # one tick every 5 s, as the forecaster polls
+            assert cache.get(10.7769, 106.7009) == 4.0
+            clock[0] += 5
+        assert 1 <= server.calls <= 2
+        assert cache.stats()["upstream_calls"] == server.calls
+
+        # A restart starts warm from the persisted file
+        calls = server.calls
+        assert make_cache(tmp_path, server, clock).get(10.7769, 106.7009) == 4.0
+        assert server.calls == calls
+    finally:
+        server.shutdown()
+
+
+def test_failing_upstream_is_retried_at_most_every_retry_sec(tmp_path):
+    server = OpenMeteo()
+    server.status = 503
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    clock = [1_700_000_000 // HOUR * HOUR]
+    cache = make_cache(tmp_path, server, clock)
+    try:
+        for _ in range(60):  # five minutes of ticks
+            assert cache.get(10.7769, 106.7009) is None
+            clock[0] += 5
+        assert server.calls == 5
+    finally:
+        server.shutdown()